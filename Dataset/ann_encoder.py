@@ -1,8 +1,6 @@
 import tensorflow as tf
 import numpy as np
 
-import matplotlib.pyplot as plt
-
 import pdb
 
 
@@ -20,7 +18,7 @@ import pdb
 
 
 def get_angles(position, i, d_model):
-   angle_rates = 1 / np.power(10000, (2 * i //2)) / np.float32(d_model)
+   angle_rates = 1 / np.power(10000, (2 * (i // 2)) / np.float32(d_model))
    return position * angle_rates
 
 def positional_encoding(position, d_model):
@@ -43,6 +41,8 @@ def positional_encoding(position, d_model):
 
 if __name__ == '__main__':
 
+    import matplotlib.pyplot as plt
+
     pos_encoding = positional_encoding(50, 512)
     print(pos_encoding.shape)
 
@@ -0,0 +1,499 @@
+"""
+Staged corpus build pipeline, streaming space objects from the website
+scrapers to sharded TFRecord files:
+
+    fetch (asyncio) -> parse + normalize (process pool)
+        -> near-duplicate filter -> tokenize (process pool)
+        -> write (I/O thread)
+
+Stages are connected by bounded queues, so a slow stage applies back
+pressure instead of letting work pile up in memory. Completed shards are
+recorded in a checkpoint file, and a rerun skips every object whose
+records are already in a finished shard. With --cache_path the fetched
+pages are kept in a ResponseCache, so rebuilding the corpus makes almost
+no network requests, and --offline makes none at all.
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import re
+import time
+import unicodedata
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+import tensorflow as tf
+
+from Dataset.near_duplicate_filter import MinHashDeduplicator
+from Dataset.save_text_data import make_text_example
+from Website_Scrapers.fetch_engine import FetchEngine
+from Website_Scrapers.generic_scraper_functions import GenericPageScraper
+from Website_Scrapers.response_cache import ResponseCache
+from Website_Scrapers.scraping_functions import (AstriaGraphScraper,
+                                                 NSSDCScraper)
+
+
+# Subword tokenizer and MinHash hasher created once per worker process
+# (see _init_worker)
+_tokenizer = None
+_hasher = None
+
+
+def _init_worker(vocab_file_prefix, hash_config=None):
+    global _tokenizer, _hasher
+    if vocab_file_prefix:
+        import tensorflow_datasets as tfds
+        _tokenizer = tfds.features.text.SubwordTextEncoder.load_from_file(
+            vocab_file_prefix)
+    if hash_config is not None:
+        _hasher = MinHashDeduplicator(**hash_config)
+
+
+def normalize_text(text):
+    '''Unicode normalize text and collapse runs of whitespace'''
+    text = unicodedata.normalize('NFKC', text)
+    return re.sub(r'\s+', ' ', text).strip()
+
+
+def result_to_documents(result):
+    '''Flatten a scraper plugin result into a list of text documents'''
+    if result is None:
+        return []
+    if isinstance(result, list):
+        return [doc for item in result for doc in result_to_documents(item)]
+    if isinstance(result, dict):
+        lines = list()
+        for key, value in result.items():
+            if isinstance(value, list):
+                value = ', '.join(str(v) for v in value)
+            lines.append('{0}: {1}'.format(key, value))
+        return ['\n'.join(lines)]
+    if hasattr(result, 'get_text'):
+        return [result.get_text(' ')]
+    return [str(result)]
+
+
+def parse_documents(plugin, obj_name, raw):
+    '''Process pool task: parse raw pages and normalize the documents.
+       Both steps run in the same task so parse trees never have to be
+       pickled back to the main process.
+
+       :return: (documents, parse seconds, normalize seconds)
+    '''
+    start_time = time.perf_counter()
+    result = plugin.parse(obj_name, raw)
+    parse_time = time.perf_counter() - start_time
+
+    start_time = time.perf_counter()
+    documents = [normalize_text(doc) for doc in result_to_documents(result)]
+    documents = [doc for doc in documents if doc]
+    normalize_time = time.perf_counter() - start_time
+
+    return documents, parse_time, normalize_time
+
+
+def compute_signatures(documents):
+    '''Process pool task: MinHash signatures of documents, computed with
+       the same hash permutations as the pipeline's deduplicator
+
+       :return: (signatures, seconds)
+    '''
+    start_time = time.perf_counter()
+    signatures = _hasher.compute_signatures(documents)
+    return signatures, time.perf_counter() - start_time
+
+
+def encode_documents(source, obj_name, documents):
+    '''Process pool task: tokenize documents and serialize them into
+       tf.train.Example records. Start and end tokens are added the same
+       way as DatasetGenerator_PtToEng.encode.
+
+       :return: list of serialized examples
+    '''
+    records = list()
+    for doc in documents:
+        token_ids = None
+        if _tokenizer is not None:
+            token_ids = ([_tokenizer.vocab_size] + _tokenizer.encode(doc) +
+                         [_tokenizer.vocab_size + 1])
+        example = make_text_example(source, obj_name, doc, token_ids)
+        records.append(example.SerializeToString())
+    return records
+
+
+class StageStats(object):
+    '''Throughput bookkeeping for one pipeline stage'''
+
+    def __init__(self, name):
+        self.name = name
+        self.items = 0
+        self.failures = 0
+        self.busy_time = 0.0
+        self.start_time = None
+        self.end_time = None
+
+    def record(self, seconds, items=1):
+        now = time.perf_counter()
+        if self.start_time is None:
+            self.start_time = now - seconds
+        self.end_time = now
+        self.items += items
+        self.busy_time += seconds
+
+    def summary(self):
+        wall_time = ((self.end_time - self.start_time)
+                     if self.start_time is not None else 0.0)
+        return ("{0:>10}: {1:7d} items | {2:9.2f} items/sec | "
+                "{3:8.2f} ms busy/item | {4} failed").format(
+                    self.name, self.items,
+                    self.items / wall_time if wall_time else 0.0,
+                    1000 * self.busy_time / self.items if self.items else 0.0,
+                    self.failures)
+
+
+class CorpusPipeline(object):
+    '''Streams objects from a scraper plugin through parsing,
+       normalization and tokenization into sharded TFRecord files.
+
+       :param plugin: ScraperPlugin instance used to fetch and parse objects
+       :param output_dir: directory the corpus-*.tfrecord shards go into
+       :param vocab_file_prefix: SubwordTextEncoder vocab file; if None the
+                                 records hold text only
+       :param num_workers: processes used for parsing and tokenization
+       :param fetch_concurrency: objects being fetched at the same time
+       :param queue_size: capacity of the queues between stages
+       :param records_per_shard: records written before a shard is closed
+                                 and checkpointed
+       :param checkpoint_path: json checkpoint file, defaults to
+                               output_dir/checkpoint.json
+       :param engine_kwargs: keyword arguments for the FetchEngine
+       :param deduplicator: optional MinHashDeduplicator; documents it
+                            flags as near-duplicates are not tokenized.
+                            Signatures are computed in the process pool
+    '''
+
+    def __init__(self, plugin, output_dir, vocab_file_prefix=None,
+                 num_workers=None, fetch_concurrency=16, queue_size=64,
+                 records_per_shard=1000, checkpoint_path=None,
+                 engine_kwargs=None, deduplicator=None):
+        self.plugin = plugin
+        self.output_dir = output_dir
+        self.vocab_file_prefix = vocab_file_prefix
+        self.num_workers = num_workers or os.cpu_count()
+        self.fetch_concurrency = fetch_concurrency
+        self.queue_size = queue_size
+        self.records_per_shard = records_per_shard
+        self.checkpoint_path = checkpoint_path or os.path.join(
+            output_dir, 'checkpoint.json')
+        self.engine_kwargs = engine_kwargs or dict()
+        self.deduplicator = deduplicator
+
+        self.stats = [StageStats(name) for name in
+                      ('fetch', 'parse', 'normalize', 'dedup', 'tokenize',
+                       'write')]
+        self.fetch_stats, self.parse_stats, self.normalize_stats, \
+            self.dedup_stats, self.tokenize_stats, self.write_stats = self.stats
+
+        os.makedirs(output_dir, exist_ok=True)
+        self.completed, self.next_shard = self.load_checkpoint()
+
+        # State of the shard currently being written
+        self._writer = None
+        self._shard_path = None
+        self._shard_objects = list()
+        self._shard_records = 0
+
+    def load_checkpoint(self):
+        '''Return (set of completed object names, next shard index)'''
+        if not os.path.exists(self.checkpoint_path):
+            return set(), 0
+        with open(self.checkpoint_path, 'r') as cf:
+            checkpoint = json.load(cf)
+        return set(checkpoint['completed']), checkpoint['next_shard']
+
+    def save_checkpoint(self):
+        '''Atomically rewrite the checkpoint file'''
+        tmp_path = self.checkpoint_path + '.tmp'
+        with open(tmp_path, 'w') as cf:
+            json.dump({'completed': sorted(self.completed),
+                       'next_shard': self.next_shard}, cf)
+        os.replace(tmp_path, self.checkpoint_path)
+
+    def run(self, obj_names):
+        '''Build the corpus for obj_names, skipping completed objects'''
+        todo = [name for name in obj_names if name not in self.completed]
+        print("{0} of {1} objects already in the corpus, {2} to go".format(
+            len(obj_names) - len(todo), len(obj_names), len(todo)))
+        start_time = time.perf_counter()
+        asyncio.run(self._run(todo))
+        print("Corpus build time: {:.2f} seconds".format(
+            time.perf_counter() - start_time))
+        self.report()
+
+    def report(self):
+        print('------------------- STAGE THROUGHPUT -------------------')
+        for stage_stats in self.stats:
+            print(stage_stats.summary())
+        if self.deduplicator is not None:
+            self.deduplicator.report()
+
+    async def _run(self, obj_names):
+        name_queue = asyncio.Queue()
+        for obj_name in obj_names:
+            name_queue.put_nowait(obj_name)
+        raw_queue = asyncio.Queue(self.queue_size)
+        doc_queue = asyncio.Queue(self.queue_size)
+        record_queue = asyncio.Queue(self.queue_size)
+
+        hash_config = (self.deduplicator.hash_config
+                       if self.deduplicator is not None else None)
+        with ProcessPoolExecutor(self.num_workers, initializer=_init_worker,
+                                 initargs=(self.vocab_file_prefix,
+                                           hash_config)) as pool, \
+                ThreadPoolExecutor(1) as io_pool:
+            async with FetchEngine(**self.engine_kwargs) as engine:
+                fetchers = [asyncio.ensure_future(
+                                self._fetch_stage(engine, name_queue, raw_queue))
+                            for _ in range(self.fetch_concurrency)]
+                parsers = [asyncio.ensure_future(
+                               self._parse_stage(pool, raw_queue, doc_queue))
+                           for _ in range(self.num_workers)]
+                tokenizers = [asyncio.ensure_future(
+                                  self._tokenize_stage(pool, doc_queue,
+                                                       record_queue))
+                              for _ in range(self.num_workers)]
+                writer = asyncio.ensure_future(
+                    self._write_stage(io_pool, record_queue))
+
+                # Shut the stages down in order, one sentinel per consumer
+                await asyncio.gather(*fetchers)
+                for _ in parsers:
+                    await raw_queue.put(None)
+                await asyncio.gather(*parsers)
+                for _ in tokenizers:
+                    await doc_queue.put(None)
+                await asyncio.gather(*tokenizers)
+                await record_queue.put(None)
+                await writer
+
+    async def _fetch_stage(self, engine, name_queue, raw_queue):
+        while True:
+            try:
+                obj_name = name_queue.get_nowait()
+            except asyncio.QueueEmpty:
+                return
+            start_time = time.perf_counter()
+            try:
+                raw = await self.plugin.fetch(engine, obj_name)
+            except Exception as e:
+                print("\nERROR: fetch failed for {0}: {1}".format(obj_name, e))
+                self.fetch_stats.failures += 1
+                continue
+            self.fetch_stats.record(time.perf_counter() - start_time)
+            await raw_queue.put((obj_name, raw))
+
+    async def _parse_stage(self, pool, raw_queue, doc_queue):
+        loop = asyncio.get_event_loop()
+        while True:
+            item = await raw_queue.get()
+            if item is None:
+                return
+            obj_name, raw = item
+            try:
+                documents, parse_time, normalize_time = \
+                    await loop.run_in_executor(pool, parse_documents,
+                                               self.plugin, obj_name, raw)
+            except Exception as e:
+                print("\nERROR: parse failed for {0}: {1}".format(obj_name, e))
+                self.parse_stats.failures += 1
+                continue
+            self.parse_stats.record(parse_time)
+            self.normalize_stats.record(normalize_time)
+            await doc_queue.put((obj_name, documents))
+
+    async def _tokenize_stage(self, pool, doc_queue, record_queue):
+        loop = asyncio.get_event_loop()
+        while True:
+            item = await doc_queue.get()
+            if item is None:
+                return
+            obj_name, documents = item
+
+            if self.deduplicator is not None and documents:
+                try:
+                    signatures, hash_time = await loop.run_in_executor(
+                        pool, compute_signatures, documents)
+                except Exception as e:
+                    print("\nERROR: dedup failed for {0}: {1}".format(
+                        obj_name, e))
+                    self.dedup_stats.failures += 1
+                    continue
+                # The LSH insertion runs on the event loop, so the shared
+                # index is only ever touched by one coroutine at a time
+                start_time = time.perf_counter()
+                kept = self.deduplicator.add_signatures(
+                    [(obj_name, doc) for doc in documents], signatures)
+                documents = [doc for _, doc in kept]
+                self.dedup_stats.record(
+                    hash_time + time.perf_counter() - start_time)
+
+            start_time = time.perf_counter()
+            try:
+                records = await loop.run_in_executor(
+                    pool, encode_documents, self.plugin.name, obj_name,
+                    documents)
+            except Exception as e:
+                print("\nERROR: tokenize failed for {0}: {1}".format(
+                    obj_name, e))
+                self.tokenize_stats.failures += 1
+                continue
+            self.tokenize_stats.record(time.perf_counter() - start_time)
+            await record_queue.put((obj_name, records))
+
+    async def _write_stage(self, io_pool, record_queue):
+        loop = asyncio.get_event_loop()
+        while True:
+            item = await record_queue.get()
+            if item is None:
+                break
+            obj_name, records = item
+            start_time = time.perf_counter()
+            await loop.run_in_executor(io_pool, self._write_records, records)
+            self._shard_objects.append(obj_name)
+            self._shard_records += len(records)
+            if self._shard_records >= self.records_per_shard:
+                await loop.run_in_executor(io_pool, self._close_shard)
+            self.write_stats.record(time.perf_counter() - start_time,
+                                    items=len(records))
+        await loop.run_in_executor(io_pool, self._close_shard)
+
+    def _write_records(self, records):
+        if self._writer is None:
+            self._shard_path = os.path.join(
+                self.output_dir, 'corpus-{:05d}.tfrecord'.format(self.next_shard))
+            self._writer = tf.python_io.TFRecordWriter(self._shard_path + '.tmp')
+        for record in records:
+            self._writer.write(record)
+
+    def _close_shard(self):
+        '''Finish the current shard and checkpoint the objects in it. The
+           shard is only renamed to its final name once complete, so an
+           interrupted run never leaves a partial shard behind.
+        '''
+        if self._writer is None:
+            return
+        self._writer.close()
+        os.replace(self._shard_path + '.tmp', self._shard_path)
+        self.completed.update(self._shard_objects)
+        self.next_shard += 1
+        self.save_checkpoint()
+
+        self._writer = None
+        self._shard_objects = list()
+        self._shard_records = 0
+
+
+SCRAPER_PLUGINS = {
+    'nssdc': NSSDCScraper,
+    'astriagraph': AstriaGraphScraper,
+    'generic': GenericPageScraper,
+}
+
+
+def main(flags):
+    with open(flags.object_names_file, 'r') as nf:
+        obj_names = [line.strip() for line in nf if line.strip()]
+
+    deduplicator = None
+    if flags.dedup_threshold > 0:
+        deduplicator = MinHashDeduplicator(threshold=flags.dedup_threshold)
+
+    engine_kwargs = {'per_domain_limit': flags.fetch_concurrency,
+                     'requests_per_second': flags.requests_per_second}
+    # With a response cache, rebuilding the corpus only revalidates stale
+    # pages, and --offline rebuilds it without touching the network
+    cache = None
+    if flags.cache_path:
+        cache = ResponseCache(flags.cache_path, ttl=flags.cache_ttl,
+                              offline=flags.offline)
+        engine_kwargs['cache'] = cache
+    elif flags.offline:
+        raise ValueError("--offline needs a --cache_path to read from")
+
+    pipeline = CorpusPipeline(SCRAPER_PLUGINS[flags.source](),
+                              flags.output_dir,
+                              vocab_file_prefix=flags.vocab_file_prefix,
+                              num_workers=flags.num_workers,
+                              fetch_concurrency=flags.fetch_concurrency,
+                              queue_size=flags.queue_size,
+                              records_per_shard=flags.records_per_shard,
+                              engine_kwargs=engine_kwargs,
+                              deduplicator=deduplicator)
+    try:
+        pipeline.run(obj_names)
+    finally:
+        if cache is not None:
+            cache.close()
+
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser()
+
+    parser.add_argument('--object_names_file', type=str,
+                        required=True,
+                        help="Text file with one object name (or url for the generic source) per line")
+
+    parser.add_argument('--source', type=str,
+                        default='nssdc',
+                        choices=sorted(SCRAPER_PLUGINS.keys()),
+                        help="Website backend to scrape")
+
+    parser.add_argument('--output_dir', type=str,
+                        default='corpus',
+                        help="Directory for the TFRecord shards and the checkpoint file")
+
+    parser.add_argument('--vocab_file_prefix', type=str,
+                        default=None,
+                        help="SubwordTextEncoder vocab file; if unset, records hold text only")
+
+    parser.add_argument('--num_workers', type=int,
+                        default=None,
+                        help="Number of processes for parsing and tokenization (default: all cores)")
+
+    parser.add_argument('--fetch_concurrency', type=int,
+                        default=16,
+                        help="Number of objects fetched concurrently")
+
+    parser.add_argument('--requests_per_second', type=float,
+                        default=4.0,
+                        help="Maximum request rate per website")
+
+    parser.add_argument('--cache_path', type=str,
+                        default=None,
+                        help="sqlite file caching the fetched pages between runs (default: no cache)")
+
+    parser.add_argument('--cache_ttl', type=float,
+                        default=7*24*3600,
+                        help="Seconds a cached page is used before it is revalidated")
+
+    parser.add_argument('--offline', action='store_true',
+                        default=False,
+                        help="Serve every page from --cache_path and fail on pages that are not cached")
+
+    parser.add_argument('--queue_size', type=int,
+                        default=64,
+                        help="Capacity of the queues between pipeline stages")
+
+    parser.add_argument('--records_per_shard', type=int,
+                        default=1000,
+                        help="Number of records per TFRecord shard (and per checkpoint)")
+
+    parser.add_argument('--dedup_threshold', type=float,
+                        default=0.8,
+                        help="Estimated Jaccard similarity above which documents are dropped as near-duplicates (0 disables)")
+
+    parsed_flags, _ = parser.parse_known_args()
+
+    main(parsed_flags)
@@ -2,67 +2,117 @@ import tensorflow as tf
 
 import tensorflow_datasets as tfds
 
+from Dataset.translation_sources import TedHrlrSource
+
 # Dataset generator as described on Tensorflow website
 # link: https://www.tensorflow.org/beta/tutorials/text/transformer
 
 class DatasetGenerator_PtToEng(object):
 
     def __init__(self, target_vocab_size=2**13, max_length=40,
-                buffer_size=20000, batch_size=64):
-
-        examples, self.metadata = tfds.load(
-                'ted_hrlr_translate/pt_to_en', 
-                with_info=True, as_supervised=True)
+                buffer_size=20000, batch_size=64, num_parallel_calls=None,
+                vocab_file_prefix=None, source=None, cache=True,
+                num_shards=1):
+
+        # Where the (pt, en) sentence pairs come from (see
+        # Dataset/translation_sources.py); ted_hrlr_translate by default
+        if source is None:
+            source = TedHrlrSource()
+        self.source = source
+        examples = source.examples()
+        self.metadata = source.metadata
         self.train_examples, self.val_examples = (examples['train'], 
                                 examples['validation'])
-        #self.train_examples = self.train_examples.make_one_shot_iterator()
-        #self.val_examples = self.val_examples.make_one_shot_iterator
-        #self.next_train_element = self.train_examples.get_next()
         self.target_vocab_size = target_vocab_size
         self.max_length = max_length
         self.buffer_size = buffer_size
         self.batch_size = batch_size
-
-        # Generate word tokenizers for training dataset
-        #self.tokenizer_en, self.tokenizer_pt = self.tokenize_training_set(
-        #        self.train_examples, self.target_vocab_size)
-        self.tokenizer_en = None
-        self.tokenizer_pt = None
-
-        # Generate training dataset
-        self.train_dataset = self.train_examples.map(self.tf_encode)
-        self.train_dataset = self.train_dataset.filter(self.filter_max_length)
-        self.train_dataset = self.train_dataset.cache()
-        self.train_dataset = self.train_dataset.shuffle(
-                self.buffer_size).padded_batch(self.batch_size,
-                padded_shapes=([-1], [-1]))
-        self.train_dataset = self.train_dataset.prefetch(
-                tf.data.experimental.AUTOTUNE)
+        self.num_parallel_calls = num_parallel_calls
+
+        # Generate word tokenizers for training dataset. The tokenizers
+        # are needed by tf_encode, so they have to exist before the
+        # datasets are mapped. Building them walks the whole training set,
+        # so they are saved next to vocab_file_prefix and reloaded on
+        # later runs. Pre-tokenized sources come with the vocabularies
+        # their ids were made with
+        if source.pre_tokenized:
+            vocab_file_prefix = source.vocab_file_prefix
+        self.tokenizer_en, self.tokenizer_pt = self.load_or_build_tokenizers(
+                vocab_file_prefix)
+
+        # Pre-tokenized examples skip tf_encode's py_function
+        if source.pre_tokenized:
+            encoded = source.encoded_examples(self.num_parallel_calls)
+            train_encoded, val_encoded = encoded['train'], encoded['validation']
+        else:
+            train_encoded = None
+            val_encoded = self.val_examples.map(self.tf_encode,
+                    num_parallel_calls=self.num_parallel_calls)
+
+        # Generate training datasets, one per shard of the training
+        # examples. The examples are split before they are encoded, cached,
+        # shuffled and batched, so the shards are disjoint and every
+        # example is encoded and cached once over all the shards
+        self.train_datasets = list()
+        for index in range(num_shards):
+            if train_encoded is not None:
+                shard = train_encoded.shard(num_shards, index)
+            else:
+                shard = self.train_examples.shard(num_shards, index).map(
+                        self.tf_encode,
+                        num_parallel_calls=self.num_parallel_calls)
+            shard = shard.filter(self.filter_max_length)
+            if cache:
+                shard = shard.cache()
+            shard = shard.shuffle(self.buffer_size).padded_batch(
+                    self.batch_size, padded_shapes=([-1], [-1]))
+            self.train_datasets.append(shard.prefetch(
+                    tf.data.experimental.AUTOTUNE))
+        # The whole training set when num_shards is 1
+        self.train_dataset = self.train_datasets[0]
 
         # Generate validation dataset
-        self.val_dataset = self.val_examples.map(self.tf_encode)
-        self.val_dataset = self.val_dataset.filter(
+        self.val_dataset = val_encoded.filter(
                 self.filter_max_length).padded_batch(
                 self.batch_size, padded_shapes=([-1], [-1]))
 
-        self.train_examples = self.train_examples.make_one_shot_iterator()
-        self.val_examples = self.val_examples.make_one_shot_iterator()
-        self.next_train_element = self.train_examples.get_next()
+    def load_or_build_tokenizers(self, vocab_file_prefix=None):
+        '''Load the (en, pt) tokenizers saved under vocab_file_prefix, or
+           build them from the training set and save them there
+        '''
+        encoder = tfds.features.text.SubwordTextEncoder
+        if vocab_file_prefix is not None:
+            en_prefix = vocab_file_prefix + '_en'
+            pt_prefix = vocab_file_prefix + '_pt'
+            if (tf.gfile.Exists(en_prefix + '.subwords') and
+                    tf.gfile.Exists(pt_prefix + '.subwords')):
+                return (encoder.load_from_file(en_prefix),
+                        encoder.load_from_file(pt_prefix))
+
+        tokenizer_en, tokenizer_pt = self.tokenize_dataset(
+                self.train_examples, self.target_vocab_size)
+
+        if vocab_file_prefix is not None:
+            tokenizer_en.save_to_file(en_prefix)
+            tokenizer_pt.save_to_file(pt_prefix)
+
+        return tokenizer_en, tokenizer_pt
 
     def tokenize_dataset(self, train_examples,
             target_vocab_size):
         tokenizer_en = tfds.features.text.SubwordTextEncoder.build_from_corpus(
-                (en for pt, en in train_examples),
-                target_vocab_size=self.target_vocab_size)
+                (en for pt, en in tfds.as_numpy(train_examples)),
+                target_vocab_size=target_vocab_size)
         tokenizer_pt = tfds.features.text.SubwordTextEncoder.build_from_corpus(
-                (pt for pt, en in train_examples),
-                target_vocab_size=self.target_vocab_size)
+                (pt for pt, en in tfds.as_numpy(train_examples)),
+                target_vocab_size=target_vocab_size)
 
         return tokenizer_en, tokenizer_pt
 
     # Add start and end token to input and target
-    def encode(self, lang1, lang2, tokenizer_pt, tokenizer_en):
+    def encode(self, lang1, lang2):
         '''Add start and end token to input and target'''
+        tokenizer_pt, tokenizer_en = self.tokenizer_pt, self.tokenizer_en
         lang1 = [tokenizer_pt.vocab_size] + tokenizer_pt.encode(
                     lang1.numpy()) + [tokenizer_pt.vocab_size+1]
         lang2 = [tokenizer_en.vocab_size] + tokenizer_en.encode(
@@ -70,10 +120,12 @@ class DatasetGenerator_PtToEng(object):
 
         return lang1, lang2
 
-    def filter_max_length(self, x, y, max_length=40):
+    def filter_max_length(self, x, y, max_length=None):
         '''Drop examples with a length over max_length number of
-           tokens
+           tokens (self.max_length by default)
         '''
+        if max_length is None:
+            max_length = self.max_length
         return tf.logical_and(tf.size(x) <= max_length,
                 tf.size(y) <= max_length)
 
@@ -82,7 +134,11 @@ class DatasetGenerator_PtToEng(object):
            recieves an eager tensor with numpy attribute containing 
            string value.
         '''
-        return tf.py_function(self.encode, [pt, en], [tf.int64, tf.int64])
+        pt, en = tf.py_function(self.encode, [pt, en], [tf.int64, tf.int64])
+        # py_function loses the static shapes, which padded_batch needs
+        pt.set_shape([None])
+        en.set_shape([None])
+        return pt, en
 
 #def tokenize_training_set(train_examples,
 #        target_vocab_size):
@@ -99,45 +155,29 @@ class DatasetGenerator_PtToEng(object):
 if __name__ == '__main__':
 
     dataset = DatasetGenerator_PtToEng()
-    list_of_training_elements = list()
-    with tf.Session() as sess:
-        while True:
-            print("In the loop")
-            try:
-                train_element = sess.run(dataset.next_train_element)
-                list_of_training_elements.append(train_element)
-            except tf.errors.OutOfRangeError:
-                break
-        # Generate tokenizers
-        tokenizer_en, tokenizer_pt = sess.run(
-                dataset.tokenize_dataset(list_of_training_elements,
-                dataset.target_vocab_size))
-
-        dataset.tokenizer_en = tokenizer_en
-        dataset.tokenizer_pt = tokenizer_pt
+    tokenizer_en = dataset.tokenizer_en
 
-        sample_string = 'Transformer is awesome.'
+    sample_string = 'Transformer is awesome.'
 
-        tokenized_string = tokenizer_en.encode(sample_string)
-        print('The original string: {}'.format(tokenized_string))
+    tokenized_string = tokenizer_en.encode(sample_string)
+    print('The tokenized string: {}'.format(tokenized_string))
 
-        original_string = tokenizer_en.decode(tokenizer_string)
-        print('The original string: {}'.format(original_string))
+    original_string = tokenizer_en.decode(tokenized_string)
+    print('The original string: {}'.format(original_string))
 
-        assert original_string == sample_string
+    assert original_string == sample_string
 
-        # words can be broken into subwords if the word is not included
-        # in the dictionary
-        for ts in tokenized_string:
-            print('{} ----> {}'.format(ts, tokenizer_en.decode([ts])))
+    # words can be broken into subwords if the word is not included
+    # in the dictionary
+    for ts in tokenized_string:
+        print('{} ----> {}'.format(ts, tokenizer_en.decode([ts])))
 
-        pt_batch, en_batch = next(iter(val_dataset))
+    next_val_batch = dataset.val_dataset.make_one_shot_iterator().get_next()
+    with tf.Session() as sess:
+        pt_batch, en_batch = sess.run(next_val_batch)
         print(pt_batch, en_batch)
 
 
-
-
-
     #examples, metadata = tfds.load(
     #    'ted_hrlr_translate/pt_to_en',
     #    with_info=True, as_supervised=True)
@@ -0,0 +1,247 @@
+"""
+Near-duplicate detection for scraped documents with MinHash and locality
+sensitive hashing (LSH). Sibling objects (e.g. the Galaxy satellites) often
+share most of their boilerplate text, and keeping every copy inflates the
+corpus without adding information.
+
+Each document is reduced to a set of hashed word shingles, summarized by a
+MinHash signature computed with vectorized numpy, and the signature is
+split into bands that are hashed into buckets. Only documents sharing a
+bucket are compared, so detection scales sub-quadratically with the number
+of documents.
+"""
+
+import argparse
+import json
+import re
+import zlib
+
+import numpy as np
+
+
+# Mersenne prime used by the universal hash family; hashes are reduced
+# below it so a * h + b never overflows uint64
+_MERSENNE_PRIME = np.uint64((1 << 31) - 1)
+_SHINGLE_MULTIPLIER = np.uint64(1000003)
+_UINT32_MASK = np.uint64(0xFFFFFFFF)
+
+
+class MinHashDeduplicator(object):
+    '''Streaming near-duplicate filter. Documents are added one batch at a
+       time, and a document is dropped if its estimated Jaccard similarity
+       with an already kept document is at least threshold.
+
+       :param num_perm: number of hash permutations in a signature
+       :param num_bands: number of LSH bands, must divide num_perm. More
+                         bands find more candidates at lower similarity
+       :param shingle_size: number of words per shingle
+       :param threshold: estimated Jaccard similarity above which two
+                         documents count as duplicates
+       :param seed: seed for the hash permutations
+       :param max_batch_shingles: bound on shingles hashed at once, which
+                                  bounds the num_perm x shingles matrix
+    '''
+
+    def __init__(self, num_perm=128, num_bands=32, shingle_size=5,
+                 threshold=0.8, seed=1, max_batch_shingles=2**18):
+        assert num_perm % num_bands == 0
+
+        self.num_perm = num_perm
+        self.num_bands = num_bands
+        self.rows_per_band = num_perm // num_bands
+        self.shingle_size = shingle_size
+        self.threshold = threshold
+        self.seed = seed
+        self.max_batch_shingles = max_batch_shingles
+
+        rng = np.random.RandomState(seed)
+        self.perm_a = rng.randint(1, int(_MERSENNE_PRIME), size=num_perm,
+                                  dtype=np.int64).astype(np.uint64)
+        self.perm_b = rng.randint(0, int(_MERSENNE_PRIME), size=num_perm,
+                                  dtype=np.int64).astype(np.uint64)
+
+        self.buckets = [dict() for _ in range(num_bands)]
+        self.signatures = list()
+        self.kept_ids = list()
+        self.num_seen = 0
+        self.num_duplicates = 0
+
+    @property
+    def hash_config(self):
+        '''Keyword arguments of a MinHashDeduplicator that computes the
+           same signatures, e.g. in a worker process. The LSH index is not
+           included, so it is cheap to pickle
+        '''
+        return dict(num_perm=self.num_perm, num_bands=self.num_bands,
+                    shingle_size=self.shingle_size, threshold=self.threshold,
+                    seed=self.seed, max_batch_shingles=self.max_batch_shingles)
+
+    def shingle_hashes(self, text):
+        '''Unique 32 bit hashes of the word shingles of text'''
+        words = re.findall(r'\w+', text.lower()) or ['']
+        token_hashes = np.array([zlib.crc32(w.encode('utf-8')) for w in words],
+                                dtype=np.uint64)
+        k = min(self.shingle_size, len(words))
+        num_shingles = len(words) - k + 1
+
+        # Roll the token hashes of each window into one shingle hash
+        hashes = np.zeros(num_shingles, dtype=np.uint64)
+        for j in range(k):
+            hashes = (hashes * _SHINGLE_MULTIPLIER +
+                      token_hashes[j:j + num_shingles]) & _UINT32_MASK
+        return np.unique(hashes % _MERSENNE_PRIME)
+
+    def compute_signatures(self, texts):
+        '''MinHash signatures of texts, shape (len(texts), num_perm)'''
+        shingles = [self.shingle_hashes(text) for text in texts]
+        signatures = np.empty((len(texts), self.num_perm), dtype=np.uint64)
+
+        start = 0
+        while start < len(texts):
+            # Take as many documents as fit in one hashing batch
+            end, batch_size = start, 0
+            while end < len(texts) and (end == start or batch_size +
+                    len(shingles[end]) <= self.max_batch_shingles):
+                batch_size += len(shingles[end])
+                end += 1
+
+            batch = np.concatenate(shingles[start:end])
+            offsets = np.cumsum([0] + [len(s) for s in shingles[start:end - 1]])
+
+            # (num_perm, batch_size) matrix of permuted hashes, reduced to
+            # the minimum over each document's segment of columns
+            permuted = (self.perm_a[:, np.newaxis] * batch[np.newaxis, :] +
+                        self.perm_b[:, np.newaxis]) % _MERSENNE_PRIME
+            signatures[start:end] = np.minimum.reduceat(permuted, offsets,
+                                                        axis=1).T
+            start = end
+
+        return signatures
+
+    def band_keys(self, signature):
+        '''One bucket key per LSH band of a signature'''
+        bands = signature.reshape(self.num_bands, self.rows_per_band)
+        return [band.tobytes() for band in bands]
+
+    def add_batch(self, documents):
+        '''Filter a batch of (doc_id, text) pairs against every document
+           kept so far, including earlier documents of the same batch
+
+           :return: list of the (doc_id, text) pairs that were kept
+        '''
+        documents = list(documents)
+        if not documents:
+            return []
+        signatures = self.compute_signatures([text for _, text in documents])
+        return self.add_signatures(documents, signatures)
+
+    def add_signatures(self, documents, signatures):
+        '''Filter a batch of (doc_id, text) pairs whose signatures were
+           already computed, e.g. by compute_signatures in another process.
+           Only this step touches the LSH index
+
+           :return: list of the (doc_id, text) pairs that were kept
+        '''
+        kept = list()
+        for (doc_id, text), signature in zip(documents, signatures):
+            self.num_seen += 1
+            keys = self.band_keys(signature)
+
+            candidates = set()
+            for bucket, key in zip(self.buckets, keys):
+                candidates.update(bucket.get(key, ()))
+
+            if any(np.mean(self.signatures[idx] == signature) >= self.threshold
+                   for idx in candidates):
+                self.num_duplicates += 1
+                continue
+
+            idx = len(self.signatures)
+            self.signatures.append(signature)
+            self.kept_ids.append(doc_id)
+            for bucket, key in zip(self.buckets, keys):
+                bucket.setdefault(key, []).append(idx)
+            kept.append((doc_id, text))
+
+        return kept
+
+    def is_duplicate(self, doc_id, text):
+        '''Add a single document, returning True if it was dropped'''
+        return not self.add_batch([(doc_id, text)])
+
+    @property
+    def dedup_ratio(self):
+        '''Fraction of the documents seen that were dropped'''
+        return self.num_duplicates / self.num_seen if self.num_seen else 0.0
+
+    def report(self):
+        print("Near-duplicate filter: {0} documents seen, {1} kept, "
+              "{2} dropped (dedup ratio {3:.2%})".format(
+                  self.num_seen, self.num_seen - self.num_duplicates,
+                  self.num_duplicates, self.dedup_ratio))
+
+
+def main(flags):
+    deduplicator = MinHashDeduplicator(num_perm=flags.num_perm,
+                                       num_bands=flags.num_bands,
+                                       shingle_size=flags.shingle_size,
+                                       threshold=flags.threshold)
+
+    # Inputs are json files written by save_text_to_json, i.e. a stream of
+    # {obj_name: text_dict} objects
+    decoder = json.JSONDecoder()
+    documents = list()
+    for json_file_name in flags.input_files:
+        with open(json_file_name, 'r') as jf:
+            data, idx = jf.read(), 0
+        while idx < len(data):
+            obj_data, idx = decoder.raw_decode(data, idx)
+            for obj_name, text_dict in obj_data.items():
+                documents.append((obj_name, json.dumps(text_dict)))
+
+    kept = list()
+    for start in range(0, len(documents), flags.batch_size):
+        kept.extend(deduplicator.add_batch(
+            documents[start:start + flags.batch_size]))
+
+    if flags.output_file:
+        with open(flags.output_file, 'w') as of:
+            for obj_name, text in kept:
+                json.dump({obj_name: json.loads(text)}, of)
+    deduplicator.report()
+
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser()
+
+    parser.add_argument('input_files', nargs='+',
+                        help="Json text files written by save_text_to_json")
+
+    parser.add_argument('--output_file', type=str,
+                        default=None,
+                        help="Where to write the de-duplicated documents")
+
+    parser.add_argument('--num_perm', type=int,
+                        default=128,
+                        help="Number of MinHash permutations")
+
+    parser.add_argument('--num_bands', type=int,
+                        default=32,
+                        help="Number of LSH bands (must divide num_perm)")
+
+    parser.add_argument('--shingle_size', type=int,
+                        default=5,
+                        help="Number of words per shingle")
+
+    parser.add_argument('--threshold', type=float,
+                        default=0.8,
+                        help="Estimated Jaccard similarity counted as a duplicate")
+
+    parser.add_argument('--batch_size', type=int,
+                        default=4096,
+                        help="Number of documents hashed per batch")
+
+    parsed_flags, _ = parser.parse_known_args()
+
+    main(parsed_flags)
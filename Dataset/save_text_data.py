@@ -6,6 +6,28 @@ def _bytes_feature(value):
     return tf.train.Feature(bytes_list=tf.train.BytesList(value=[value]))
 
 
+def _int64_list_feature(values):
+    return tf.train.Feature(int64_list=tf.train.Int64List(value=values))
+
+
+def make_text_example(source, obj_name, text, token_ids=None):
+    """Builds a tf.train.Example holding one text document about an object
+
+       :param source: string of the data source
+       :param obj_name: string of the object name
+       :param text: string with the document text
+       :param token_ids: optional list of subword token ids of the text
+    """
+    feature = {
+        'source': _bytes_feature(source.encode('utf-8')),
+        'obj_name': _bytes_feature(obj_name.encode('utf-8')),
+        'text': _bytes_feature(text.encode('utf-8')),
+    }
+    if token_ids is not None:
+        feature['token_ids'] = _int64_list_feature(token_ids)
+    return tf.train.Example(features=tf.train.Features(feature=feature))
+
+
 def save_text_to_json(source, obj_name, text_dict):
     """Saves text data scraped from the internet or other sources
        to a json file
@@ -35,5 +57,9 @@ def save_text_to_tfrecord(source, obj_name, text_dict):
                          are text summaries scraped from the internet
                          or other sources
     """
-    # Build feature dict
-    feature
+    # Build example holding the serialized text dictionary
+    example = make_text_example(source, obj_name, json.dumps(text_dict))
+
+    tfrecord_file_name = '{0}_{1}.tfrecord'.format(source.lower(), obj_name)
+    with tf.python_io.TFRecordWriter(tfrecord_file_name) as writer:
+        writer.write(example.SerializeToString())
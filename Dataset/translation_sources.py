@@ -0,0 +1,279 @@
+"""
+Sources of Pt->En sentence pairs for DatasetGenerator_PtToEng.
+
+Every source gives {'train': ..., 'validation': ...} datasets of (pt, en)
+string pairs, the element spec of ted_hrlr_translate/pt_to_en:
+
+    TedHrlrSource          the tfds download (network access on first use)
+    ShardDirectorySource   TFRecord shards in a local directory, optionally
+                           pre-tokenized so tf_encode's py_function is
+                           skipped entirely
+    SyntheticSource        seeded random sentence pairs with a realistic
+                           length and word frequency distribution, for
+                           offline runs and benchmarks
+
+A shard directory is written from any other source with
+
+    python -m Dataset.translation_sources --output_dir shards --vocab_file_prefix vocab
+"""
+
+import argparse
+import glob
+import json
+import os
+
+import numpy as np
+import tensorflow as tf
+
+
+SPLITS = ('train', 'validation')
+
+
+class TedHrlrSource(object):
+    '''ted_hrlr_translate/pt_to_en from tensorflow_datasets, downloaded and
+       prepared on first use'''
+    pre_tokenized = False
+
+    def __init__(self):
+        self.metadata = None
+
+    def examples(self):
+        import tensorflow_datasets as tfds
+
+        examples, self.metadata = tfds.load('ted_hrlr_translate/pt_to_en',
+                                            with_info=True, as_supervised=True)
+        return {split: examples[split] for split in SPLITS}
+
+
+class ShardDirectorySource(object):
+    '''Sentence pairs read from <directory>/<split>-*.tfrecord shards, as
+       written by write_shards. Every record holds the 'pt' and 'en'
+       strings and, in pre-tokenized directories, their 'pt_ids' and
+       'en_ids' (with start and end tokens), made with the vocabularies
+       saved under <directory>/vocab.
+
+       Parameters:
+           directory (str): the shard directory
+           num_parallel_reads (int): shards read in parallel
+    '''
+
+    def __init__(self, directory, num_parallel_reads=None):
+        self.directory = directory
+        self.num_parallel_reads = num_parallel_reads
+        with tf.gfile.GFile(os.path.join(directory, 'metadata.json'), 'r') as mf:
+            self.metadata = json.load(mf)
+        self.pre_tokenized = self.metadata['pre_tokenized']
+        self.vocab_file_prefix = os.path.join(directory, 'vocab')
+
+    def _records(self, split):
+        paths = sorted(glob.glob(os.path.join(self.directory,
+                                              split + '-*.tfrecord')))
+        if not paths:
+            raise ValueError("No {0} shards in {1}".format(split, self.directory))
+        return tf.data.TFRecordDataset(paths,
+                                       num_parallel_reads=self.num_parallel_reads)
+
+    def examples(self):
+        def parse(record):
+            features = tf.parse_single_example(
+                record, {'pt': tf.FixedLenFeature([], tf.string),
+                         'en': tf.FixedLenFeature([], tf.string)})
+            return features['pt'], features['en']
+
+        return {split: self._records(split).map(parse) for split in SPLITS}
+
+    def encoded_examples(self, num_parallel_calls=None):
+        '''(pt ids, en ids) datasets of a pre-tokenized directory'''
+        def parse(record):
+            features = tf.parse_single_example(
+                record, {'pt_ids': tf.VarLenFeature(tf.int64),
+                         'en_ids': tf.VarLenFeature(tf.int64)})
+            return (tf.sparse.to_dense(features['pt_ids']),
+                    tf.sparse.to_dense(features['en_ids']))
+
+        return {split: self._records(split).map(
+                    parse, num_parallel_calls=num_parallel_calls)
+                for split in SPLITS}
+
+
+class SyntheticSource(object):
+    '''Seeded random sentence pairs. Each language gets a vocabulary of
+       pseudo-words drawn with Zipfian frequencies, sentence lengths are
+       log-normal (median about 13 words, like TED talk sentences) and the
+       English side is about as long as the Portuguese one.
+
+       Parameters:
+           num_train (int): training sentence pairs
+           num_validation (int): validation sentence pairs
+           vocab_size (int): distinct words per language
+           seed (int): the same seed gives the same corpus
+    '''
+    pre_tokenized = False
+
+    def __init__(self, num_train=50000, num_validation=1000, vocab_size=5000,
+                 seed=0):
+        self.num_sentences = {'train': num_train, 'validation': num_validation}
+        self.vocab_size = vocab_size
+        self.seed = seed
+        self.metadata = None
+
+    def make_vocabulary(self, rng, syllables):
+        '''Distinct pseudo-words of one to four syllables, in a random
+           order that sets their frequency ranks'''
+        words = set()
+        while len(words) < self.vocab_size:
+            num_syllables = rng.randint(1, 5)
+            words.add(''.join(rng.choice(syllables, size=num_syllables)))
+        return rng.permutation(sorted(words))
+
+    def sentences(self, rng, vocabulary, lengths):
+        ranks = np.arange(1, len(vocabulary) + 1)
+        frequencies = 1.0 / ranks ** 1.1
+        words = vocabulary[rng.choice(len(vocabulary), size=lengths.sum(),
+                                      p=frequencies / frequencies.sum())]
+        ends = np.cumsum(lengths)
+        return [' '.join(words[end - length:end]).capitalize() + '.'
+                for length, end in zip(lengths, ends)]
+
+    def pairs(self, split):
+        '''Lists of pt and en sentences of a split'''
+        rng = np.random.RandomState(self.seed)
+        pt_vocabulary = self.make_vocabulary(
+            rng, ['a', 'o', 'e', 'de', 'ra', 'ção', 'me', 'pa', 'lho', 'ti',
+                  'vo', 'nha', 'es', 'que', 'dos', 'mu'])
+        en_vocabulary = self.make_vocabulary(
+            rng, ['a', 'the', 'in', 'ing', 'er', 'on', 'st', 'ly', 'ou',
+                  'th', 'ed', 'wh', 'ar', 'com', 'pro', 'ion'])
+
+        # Each split has its own stream, so splits do not overlap
+        rng = np.random.RandomState([self.seed, SPLITS.index(split)])
+        num_sentences = self.num_sentences[split]
+        pt_lengths = np.clip(rng.lognormal(2.6, 0.5, size=num_sentences),
+                             1, 80).astype(np.int64)
+        en_lengths = np.maximum(
+            1, np.round(pt_lengths * rng.normal(0.95, 0.1, size=num_sentences))
+        ).astype(np.int64)
+        return (self.sentences(rng, pt_vocabulary, pt_lengths),
+                self.sentences(rng, en_vocabulary, en_lengths))
+
+    def examples(self):
+        return {split: tf.data.Dataset.from_tensor_slices(self.pairs(split))
+                for split in SPLITS}
+
+
+def make_source(name, directory=None, num_sentences=50000, seed=0):
+    '''Source by name: 'tfds', 'shards' (reading directory) or 'synthetic'
+    '''
+    if name == 'tfds':
+        return TedHrlrSource()
+    if name == 'shards':
+        if directory is None:
+            raise ValueError("The shards source needs a directory")
+        return ShardDirectorySource(directory)
+    if name == 'synthetic':
+        return SyntheticSource(num_train=num_sentences, seed=seed)
+    raise ValueError("Unknown dataset source " + name)
+
+
+def _bytes_feature(value):
+    return tf.train.Feature(bytes_list=tf.train.BytesList(value=[value]))
+
+
+def _int64_list_feature(values):
+    return tf.train.Feature(int64_list=tf.train.Int64List(value=values))
+
+
+def write_shards(source, directory, tokenizer_pt=None, tokenizer_en=None,
+                 num_shards=8):
+    '''Write the sentence pairs of source as a shard directory. With
+       tokenizers the records are pre-tokenized and the tokenizers are
+       saved next to them'''
+    import tensorflow_datasets as tfds
+
+    tf.gfile.MakeDirs(directory)
+    pre_tokenized = tokenizer_pt is not None and tokenizer_en is not None
+    num_examples = dict()
+    for split, examples in source.examples().items():
+        writers = [tf.python_io.TFRecordWriter(os.path.join(
+                       directory, '{0}-{1:05d}.tfrecord'.format(split, i)))
+                   for i in range(num_shards)]
+        count = 0
+        for count, (pt, en) in enumerate(tfds.as_numpy(examples), 1):
+            feature = {'pt': _bytes_feature(pt), 'en': _bytes_feature(en)}
+            if pre_tokenized:
+                feature['pt_ids'] = _int64_list_feature(
+                    [tokenizer_pt.vocab_size] + tokenizer_pt.encode(pt) +
+                    [tokenizer_pt.vocab_size + 1])
+                feature['en_ids'] = _int64_list_feature(
+                    [tokenizer_en.vocab_size] + tokenizer_en.encode(en) +
+                    [tokenizer_en.vocab_size + 1])
+            example = tf.train.Example(
+                features=tf.train.Features(feature=feature))
+            writers[count % num_shards].write(example.SerializeToString())
+        for writer in writers:
+            writer.close()
+        num_examples[split] = count
+
+    if pre_tokenized:
+        tokenizer_en.save_to_file(os.path.join(directory, 'vocab_en'))
+        tokenizer_pt.save_to_file(os.path.join(directory, 'vocab_pt'))
+    with tf.gfile.GFile(os.path.join(directory, 'metadata.json'), 'w') as mf:
+        json.dump({'pre_tokenized': pre_tokenized,
+                   'num_examples': num_examples}, mf, indent=2)
+    return num_examples
+
+
+def main(flags):
+    from Dataset.dataset_generator_porteng_translate import DatasetGenerator_PtToEng
+
+    source = make_source(flags.source, num_sentences=flags.num_sentences)
+    tokenizer_pt, tokenizer_en = None, None
+    if not flags.text_only:
+        # Loads the vocabularies, or builds them from the source and saves
+        # them under vocab_file_prefix
+        data = DatasetGenerator_PtToEng(target_vocab_size=flags.vocab_size,
+                                        vocab_file_prefix=flags.vocab_file_prefix,
+                                        source=source)
+        tokenizer_pt, tokenizer_en = data.tokenizer_pt, data.tokenizer_en
+
+    num_examples = write_shards(source, flags.output_dir, tokenizer_pt,
+                                tokenizer_en, flags.num_shards)
+    print("Wrote {0} to {1}".format(num_examples, flags.output_dir))
+
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser()
+
+    parser.add_argument('--source', type=str,
+                        choices=['tfds', 'synthetic'],
+                        default='tfds',
+                        help="Where the sentence pairs come from")
+
+    parser.add_argument('--output_dir', type=str,
+                        required=True,
+                        help="Shard directory to write")
+
+    parser.add_argument('--num_shards', type=int,
+                        default=8,
+                        help="TFRecord shards per split")
+
+    parser.add_argument('--text_only', action='store_true',
+                        default=False,
+                        help="Only store the text, not pre-tokenized ids")
+
+    parser.add_argument('--vocab_file_prefix', type=str,
+                        default=None,
+                        help="Where to save/load the subword vocabularies")
+
+    parser.add_argument('--vocab_size', type=int,
+                        default=8500,
+                        help="Target size of the subword vocabularies")
+
+    parser.add_argument('--num_sentences', type=int,
+                        default=50000,
+                        help="Training pairs of the synthetic source")
+
+    parsed_flags, _ = parser.parse_known_args()
+
+    main(parsed_flags)
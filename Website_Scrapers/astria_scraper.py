@@ -1,5 +1,20 @@
 import requests
 from bs4 import BeautifulSoup
 
+from Website_Scrapers.fetch_engine import run_scraper
+from Website_Scrapers.scraping_functions import AstriaGraphScraper
 
-def search_for_object(res_space_obj, datasource='USSTRATCOM', nat_of_origin='United_States'):
\ No newline at end of file
+
+def search_for_object(res_space_obj, datasource='USSTRATCOM', nat_of_origin='United_States'):
+    '''Search AstriaGraph for one or more resident space objects
+
+       :param res_space_obj: object name, or list of object names
+       :param datasource: AstriaGraph data source to search
+       :param nat_of_origin: country of origin for the object
+       :return: dict mapping each object name to its parsed results page
+    '''
+    if isinstance(res_space_obj, str):
+        res_space_obj = [res_space_obj]
+    return run_scraper(AstriaGraphScraper(data_source=datasource,
+                                          nat_of_origin=nat_of_origin),
+                       res_space_obj)
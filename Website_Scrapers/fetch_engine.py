@@ -0,0 +1,237 @@
+import abc
+import aiohttp
+import asyncio
+import collections
+import random
+import time
+from urllib.parse import urlparse
+
+from Website_Scrapers.response_cache import CacheMissError
+
+
+# Result of a single request made by the FetchEngine
+FetchResponse = collections.namedtuple('FetchResponse',
+                                       ['url', 'status', 'content', 'headers'])
+
+
+class FetchError(Exception):
+    '''Raised when a request still fails after all retries'''
+
+
+class TokenBucket(object):
+    '''Asyncio token bucket rate limiter. Tokens are refilled at rate
+       tokens per second up to capacity, and every request consumes one.
+
+       Parameters:
+           rate (float): refill rate in tokens per second. If None or 0,
+                         acquire never blocks
+           capacity (int): maximum number of tokens, i.e. the largest
+                           burst of requests allowed at once
+    '''
+
+    def __init__(self, rate, capacity=1):
+        self.rate = rate
+        self.capacity = max(capacity, 1)
+        self._tokens = float(self.capacity)
+        self._last = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self):
+        '''Wait until a token is available and consume it'''
+        if not self.rate:
+            return
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self._tokens = min(self.capacity,
+                                   self._tokens + (now - self._last) * self.rate)
+                self._last = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                await asyncio.sleep((1 - self._tokens) / self.rate)
+
+
+class FetchEngine(object):
+    '''Asyncio HTTP fetch engine shared by all of the website scrapers.
+       Requests to the same domain are bounded by a concurrency limit and
+       a token bucket rate limiter, and failed requests are retried with
+       exponential backoff. Use as an async context manager:
+
+           async with FetchEngine() as engine:
+               response = await engine.fetch(url)
+
+       Parameters:
+           per_domain_limit (int): maximum concurrent requests per domain
+           requests_per_second (float): sustained request rate per domain
+           burst (int): number of requests per domain allowed in a burst
+           max_retries (int): number of retries after the first attempt
+           backoff_base (float): delay in seconds before the first retry,
+                                 doubled on every following retry
+           backoff_max (float): upper bound on the retry delay
+           timeout (float): total timeout for a single attempt in seconds
+           retry_statuses (tuple of int): http statuses worth retrying
+           headers (dict): default headers sent with every request
+           cache (ResponseCache): optional on-disk cache consulted before
+                                  every request (see response_cache.py)
+    '''
+
+    def __init__(self, per_domain_limit=4, requests_per_second=4.0, burst=1,
+                 max_retries=3, backoff_base=0.5, backoff_max=30.0,
+                 timeout=10.0, retry_statuses=(429, 500, 502, 503, 504),
+                 headers=None, cache=None):
+        self.per_domain_limit = per_domain_limit
+        self.requests_per_second = requests_per_second
+        self.burst = burst
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.timeout = timeout
+        self.retry_statuses = retry_statuses
+        self.headers = headers
+        self.cache = cache
+        self.network_requests = 0
+        self.session = None
+        self._domains = dict()
+
+    async def __aenter__(self):
+        connector = aiohttp.TCPConnector(limit_per_host=self.per_domain_limit)
+        self.session = aiohttp.ClientSession(
+            connector=connector,
+            headers=self.headers,
+            timeout=aiohttp.ClientTimeout(total=self.timeout))
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.session.close()
+        self.session = None
+
+    def _domain_limits(self, url):
+        '''Return the (semaphore, token bucket) pair for the url's domain'''
+        domain = urlparse(url).netloc
+        if domain not in self._domains:
+            self._domains[domain] = (
+                asyncio.Semaphore(self.per_domain_limit),
+                TokenBucket(self.requests_per_second, self.burst))
+        return self._domains[domain]
+
+    def _backoff(self, attempt):
+        '''Exponential backoff delay with jitter for the given retry'''
+        delay = min(self.backoff_max, self.backoff_base * 2 ** attempt)
+        return delay * (0.5 + random.random() / 2)
+
+    async def fetch(self, url, method='GET', data=None, params=None,
+                    headers=None):
+        '''Make a single request, retrying on connection errors, timeouts
+           and retryable statuses
+
+           :param url: url to request
+           :param method: http method
+           :param data: form payload for POST requests
+           :param params: query string parameters
+           :param headers: extra headers for this request
+           :return: FetchResponse with the body read into memory
+        '''
+        entry = None
+        if self.cache is not None:
+            entry = self.cache.get(method, url, data, params)
+            if entry is not None and self.cache.is_fresh(entry):
+                return FetchResponse(entry.url, entry.status, entry.content,
+                                     entry.headers)
+            if self.cache.offline:
+                raise CacheMissError('{} {} is not cached'.format(method, url))
+            if entry is not None and method.upper() == 'GET':
+                headers = dict(headers or {})
+                headers.update(self.cache.conditional_headers(entry))
+
+        semaphore, bucket = self._domain_limits(url)
+        last_error = None
+        for attempt in range(self.max_retries + 1):
+            if attempt:
+                await asyncio.sleep(self._backoff(attempt - 1))
+            async with semaphore:
+                await bucket.acquire()
+                self.network_requests += 1
+                try:
+                    async with self.session.request(method, url, data=data,
+                                                    params=params,
+                                                    headers=headers) as resp:
+                        content = await resp.read()
+                        response = FetchResponse(str(resp.url), resp.status,
+                                                 content, dict(resp.headers))
+                except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                    last_error = e
+                    continue
+
+            if response.status == 304 and entry is not None:
+                entry = self.cache.refresh(entry)
+                return FetchResponse(entry.url, entry.status, entry.content,
+                                     entry.headers)
+            if response.status in self.retry_statuses:
+                last_error = 'HTTP {}'.format(response.status)
+                continue
+            if response.status >= 400:
+                raise FetchError('{} {} returned HTTP {}'.format(
+                    method, url, response.status))
+            if self.cache is not None and response.status == 200:
+                self.cache.put(method, url, data, params, response.status,
+                               response.headers, response.content)
+            return response
+
+        raise FetchError('{} {} failed after {} attempts: {}'.format(
+            method, url, self.max_retries + 1, last_error))
+
+
+class ScraperPlugin(abc.ABC):
+    '''Base class for a website backend running on the FetchEngine. A
+       plugin only knows which requests to make for an object and how to
+       parse the responses; concurrency, rate limiting and retries are
+       left to the engine.
+
+       Downloading (fetch) and parsing (parse) are kept apart so that
+       pipelines can run the CPU bound parse step in worker processes.
+       Plugins therefore need to be picklable, and a plugin missing either
+       method fails when it is instantiated.
+    '''
+    name = 'scraper'
+
+    @abc.abstractmethod
+    async def fetch(self, engine, obj_name):
+        '''Download the raw pages needed for obj_name'''
+
+    @abc.abstractmethod
+    def parse(self, obj_name, raw):
+        '''Turn the raw pages returned by fetch into results'''
+
+    async def scrape(self, engine, obj_name):
+        '''Fetch and parse everything this backend knows about obj_name'''
+        return self.parse(obj_name, await self.fetch(engine, obj_name))
+
+
+async def scrape_all(plugin, obj_names, engine):
+    '''Run plugin.scrape concurrently for every name in obj_names.
+       Returns a dict mapping each name to its result, or None if
+       scraping that object failed
+    '''
+    async def scrape_one(obj_name):
+        try:
+            return await plugin.scrape(engine, obj_name)
+        except Exception as e:
+            print("\nERROR: {0} scrape failed for {1}: {2}".format(
+                plugin.name, obj_name, e))
+            return None
+
+    results = await asyncio.gather(*[scrape_one(obj_name)
+                                     for obj_name in obj_names])
+    return dict(zip(obj_names, results))
+
+
+def run_scraper(plugin, obj_names, **engine_kwargs):
+    '''Synchronous entry point: scrape obj_names with plugin on a new
+       FetchEngine built from engine_kwargs
+    '''
+    async def run():
+        async with FetchEngine(**engine_kwargs) as engine:
+            return await scrape_all(plugin, obj_names, engine)
+
+    return asyncio.run(run())
@@ -1,7 +1,27 @@
 import requests
 from bs4 import BeautifulSoup
 
+from Website_Scrapers.fetch_engine import ScraperPlugin
+from Website_Scrapers.scraping_functions import HTML_PARSER
+
+
 def scrape_data(url):
     ''' '''
     response = requests.get(url, timeout=10)
-    soup = BeautifulSoup(response.content, 'html.parser')
+    soup = BeautifulSoup(response.content, HTML_PARSER)
+    return soup
+
+
+class GenericPageScraper(ScraperPlugin):
+    '''FetchEngine backend that fetches arbitrary pages. The names passed
+       to run_scraper are the urls to fetch, and each result is the parsed
+       page.
+    '''
+    name = 'generic'
+
+    async def fetch(self, engine, url):
+        response = await engine.fetch(url)
+        return response.content
+
+    def parse(self, url, raw):
+        return BeautifulSoup(raw, HTML_PARSER)
@@ -0,0 +1,191 @@
+import collections
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+import zlib
+from urllib.parse import urlencode
+
+import requests
+
+
+# A response served from the on-disk cache
+CachedResponse = collections.namedtuple('CachedResponse',
+                                        ['key', 'url', 'status', 'headers',
+                                         'content', 'stored_at'])
+
+
+class CacheMissError(Exception):
+    '''Raised in offline mode when a request is not in the cache'''
+
+
+class ResponseCache(object):
+    '''On-disk cache of scraped http responses, stored in a sqlite file.
+       Entries are keyed by method, url, query parameters and form
+       payload, and bodies are stored zlib compressed. Stale entries that
+       carry an ETag or Last-Modified header are revalidated with a
+       conditional GET instead of being downloaded again, and the least
+       recently used entries are evicted once the cache grows past
+       max_bytes.
+
+       Parameters:
+           cache_path (str): sqlite file holding the cache
+           ttl (float): seconds an entry is served without revalidation
+           max_bytes (int): upper bound on the compressed size of all bodies
+           offline (bool): if True, every request is served from the cache
+                           regardless of age, and misses raise
+                           CacheMissError instead of touching the network
+    '''
+
+    def __init__(self, cache_path='scrape_cache.sqlite', ttl=7*24*3600,
+                 max_bytes=512*1024**2, offline=False):
+        self.cache_path = cache_path
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.offline = offline
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(cache_path, check_same_thread=False)
+        self._db.execute('''CREATE TABLE IF NOT EXISTS responses (
+                                key TEXT PRIMARY KEY,
+                                url TEXT,
+                                status INTEGER,
+                                headers TEXT,
+                                body BLOB,
+                                size INTEGER,
+                                stored_at REAL,
+                                last_access REAL)''')
+        self._db.execute('''CREATE INDEX IF NOT EXISTS lru
+                            ON responses (last_access)''')
+        self._db.commit()
+
+    def close(self):
+        self._db.close()
+
+    @staticmethod
+    def make_key(method, url, data=None, params=None):
+        '''Hash of everything that identifies a request'''
+        parts = [method.upper(), url]
+        for payload in (params, data):
+            if isinstance(payload, dict):
+                payload = urlencode(sorted(payload.items()))
+            elif isinstance(payload, bytes):
+                payload = payload.decode('latin-1')
+            parts.append(payload or '')
+        return hashlib.sha1('\n'.join(parts).encode('utf-8')).hexdigest()
+
+    def get(self, method, url, data=None, params=None):
+        '''Look up a request, returning a CachedResponse or None'''
+        key = self.make_key(method, url, data, params)
+        with self._lock:
+            row = self._db.execute('''SELECT url, status, headers, body,
+                                      stored_at FROM responses WHERE key=?''',
+                                   (key,)).fetchone()
+            if row is None:
+                return None
+            self._db.execute('UPDATE responses SET last_access=? WHERE key=?',
+                             (time.time(), key))
+            self._db.commit()
+        url, status, headers, body, stored_at = row
+        return CachedResponse(key, url, status, json.loads(headers),
+                              zlib.decompress(body), stored_at)
+
+    def is_fresh(self, entry):
+        '''True if the entry can be served without revalidation'''
+        return self.offline or time.time() - entry.stored_at < self.ttl
+
+    def conditional_headers(self, entry):
+        '''Validator headers for revalidating a stale entry'''
+        headers = dict()
+        entry_headers = {k.lower(): v for k, v in entry.headers.items()}
+        if 'etag' in entry_headers:
+            headers['If-None-Match'] = entry_headers['etag']
+        if 'last-modified' in entry_headers:
+            headers['If-Modified-Since'] = entry_headers['last-modified']
+        return headers
+
+    def refresh(self, entry):
+        '''Mark a stale entry as fresh after a 304 Not Modified'''
+        with self._lock:
+            self._db.execute('UPDATE responses SET stored_at=? WHERE key=?',
+                             (time.time(), entry.key))
+            self._db.commit()
+        return entry._replace(stored_at=time.time())
+
+    def put(self, method, url, data, params, status, headers, content):
+        '''Store a response and evict old entries if over budget'''
+        key = self.make_key(method, url, data, params)
+        body = zlib.compress(content)
+        now = time.time()
+        with self._lock:
+            self._db.execute('''INSERT OR REPLACE INTO responses
+                                VALUES (?, ?, ?, ?, ?, ?, ?, ?)''',
+                             (key, url, status, json.dumps(dict(headers)),
+                              body, len(body), now, now))
+            self._evict()
+            self._db.commit()
+
+    def _evict(self):
+        '''Drop least recently used entries until under max_bytes'''
+        total, = self._db.execute(
+            'SELECT COALESCE(SUM(size), 0) FROM responses').fetchone()
+        if total <= self.max_bytes:
+            return
+        rows = self._db.execute('''SELECT key, size FROM responses
+                                   ORDER BY last_access''').fetchall()
+        stale_keys = list()
+        for key, size in rows:
+            if total <= self.max_bytes:
+                break
+            stale_keys.append((key,))
+            total -= size
+        self._db.executemany('DELETE FROM responses WHERE key=?', stale_keys)
+
+    def __len__(self):
+        with self._lock:
+            return self._db.execute(
+                'SELECT COUNT(*) FROM responses').fetchone()[0]
+
+
+class CachedSession(requests.Session):
+    '''requests.Session that goes through a ResponseCache, so the
+       synchronous scrapers share the cache with the FetchEngine
+    '''
+
+    def __init__(self, cache):
+        super().__init__()
+        self.cache = cache
+        self.network_requests = 0
+
+    def request(self, method, url, params=None, data=None, headers=None,
+                **kwargs):
+        entry = self.cache.get(method, url, data, params)
+        if entry is not None and self.cache.is_fresh(entry):
+            return self._build_response(entry)
+        if self.cache.offline:
+            raise CacheMissError('{} {} is not cached'.format(method, url))
+
+        headers = dict(headers or {})
+        if entry is not None and method.upper() == 'GET':
+            headers.update(self.cache.conditional_headers(entry))
+
+        self.network_requests += 1
+        response = super().request(method, url, params=params, data=data,
+                                   headers=headers, **kwargs)
+        if response.status_code == 304 and entry is not None:
+            return self._build_response(self.cache.refresh(entry))
+        if response.status_code == requests.codes.ok:
+            self.cache.put(method, url, data, params, response.status_code,
+                           response.headers, response.content)
+        return response
+
+    def _build_response(self, entry):
+        response = requests.models.Response()
+        response.status_code = entry.status
+        response.headers = requests.structures.CaseInsensitiveDict(
+            entry.headers)
+        response._content = entry.content
+        response.url = entry.url
+        response.encoding = requests.utils.get_encoding_from_headers(
+            response.headers)
+        return response
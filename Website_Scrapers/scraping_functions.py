@@ -1,28 +1,84 @@
 import requests
-from bs4 import BeautifulSoup, NavigableString, Tag
+from bs4 import BeautifulSoup, NavigableString, SoupStrainer, Tag
 from lxml import html
+import asyncio
 import re
+import os
 import json
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor
+import sys
+from urllib.parse import quote, urljoin, urlparse
+
+# When run as a script (python Website_Scrapers/scraping_functions.py) the
+# repo root is not on the path for the Website_Scrapers imports below
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from Website_Scrapers.fetch_engine import ScraperPlugin, run_scraper
+from Website_Scrapers.response_cache import CachedSession
 
 import pdb
 
 
-def nasa_nssdc_scraper(obj_name, discipline='Any Discipline',
-        launch_date=None):
-    '''Function to scrape all textual data about a given object from the
-       NASA National Space Science Data Center Catalog (NSSDC)
+NSSDC_BASE_URL = "https://nssdc.gsfc.nasa.gov"
 
-       Parameter:
-           obj_name (str): space object name
-           discipline (str): mission of the space object
-           launch_date (str): date of object launch
-       Return:
-           str with all textual information on given object in catalog
+# lxml is a C parser and builds trees several times faster than the pure
+# python 'html.parser' backend
+HTML_PARSER = 'lxml'
+
+# Only the parts of the NSSDC pages that are actually read get parsed into
+# a tree; everything else is skipped by the parser
+NSSDC_QUERY_STRAINER = SoupStrainer(['p', 'a', 'td'])
+NSSDC_OBJECT_STRAINER = SoupStrainer('div', class_=['urone', 'urtwo'])
+
+
+class HostRateLimiter(object):
+    '''Thread safe rate limiter that spaces out requests made to the
+       same host by at least 1 / requests_per_second seconds. Requests to
+       different hosts do not block each other.
+
+       Parameters:
+           requests_per_second (float): maximum request rate per host. If
+                                        None or 0, no limit is applied
     '''
-    # Post query to nssdc spacecraft search page
-    base_nssdc_url = "https://nssdc.gsfc.nasa.gov"
-    nssdc_query_url = base_nssdc_url + "/nmc/spacecraft/query"
-    #with requests.Session() as rs:
+
+    def __init__(self, requests_per_second=None):
+        self.min_interval = (1.0 / requests_per_second
+                             if requests_per_second else 0.0)
+        self._lock = threading.Lock()
+        self._next_slot = dict()
+
+    def wait(self, url):
+        '''Block until a request to the host of url is allowed'''
+        if not self.min_interval:
+            return
+        host = urlparse(url).netloc
+        with self._lock:
+            now = time.monotonic()
+            slot = max(now, self._next_slot.get(host, now))
+            self._next_slot[host] = slot + self.min_interval
+        if slot > now:
+            time.sleep(slot - now)
+
+
+def make_scraping_session(pool_size=10, max_retries=2, cache=None):
+    '''Create a requests session with a keep-alive connection pool large
+       enough to be shared by pool_size concurrent workers. If a
+       ResponseCache is given, requests are served from it when possible
+    '''
+    session = CachedSession(cache) if cache is not None else requests.Session()
+    adapter = requests.adapters.HTTPAdapter(pool_connections=pool_size,
+                                            pool_maxsize=pool_size,
+                                            max_retries=max_retries)
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    return session
+
+
+def build_nssdc_query_package(obj_name, discipline='Any Discipline',
+        launch_date=None):
+    '''Form payload for the NSSDC spacecraft search page'''
     if launch_date:
         package = {"name" : obj_name,
                    "query_discipline" : discipline,
@@ -35,14 +91,26 @@ def nasa_nssdc_scraper(obj_name, discipline='Any Discipline',
                    "submit" : "submit"
                   }
 
-    rp = requests.post(nssdc_query_url, data=package)
-    if rp.status_code != requests.codes.ok:
-        print("\nERROR: response not recieved from NASA NSSDC query engine")
-        print("\nCheck: {}".format(nssdc_query_url))
-        raise Exception
+    return package
+
+
+def parse_nssdc_query_page(content, obj_name, base_nssdc_url=NSSDC_BASE_URL,
+        parser=HTML_PARSER, parse_only=NSSDC_QUERY_STRAINER):
+    '''Parse the table of objects returned by an NSSDC catalog query
 
+       Parameter:
+           content (bytes): html of the query results page
+           obj_name (str): space object name that was searched for
+           base_nssdc_url (str): root url used to resolve object links
+           parser (str): BeautifulSoup tree builder to use
+           parse_only (SoupStrainer): restricts the tree to the tags read
+                                      here, None parses the whole page
+       Return:
+           dict mapping each returned object name to a list of
+           [object url, nssdca id, launch date]
+    '''
     # Sort out html mumbo jumbo
-    soup = BeautifulSoup(rp.content, 'html.parser')
+    soup = BeautifulSoup(content, parser, parse_only=parse_only)
 
     # parse number of objects returned by query
     num_obj_return_html = soup.find_all('p')[0].get_text()
@@ -67,16 +135,15 @@ def nasa_nssdc_scraper(obj_name, discipline='Any Discipline',
     obj_nssdca_ids = []
     obj_launch_dates = []
 
-    # Prepare a comprehensive object information dictionary to contain all
+    # Prepare a comprehensive search information dictionary to contain all
     # pertinent information for each object
-    obj_info_dict = {}
+    search_info_dict = {}
 
     # iterator to keep track of which object we are gathering info for
     obj_iter = 0
 
     for idx, obj_info in enumerate(obj_info_html):
 
-
         if idx % 3 == 0:
             obj_names.append(obj_info.get_text())
         elif idx % 3 == 1:
@@ -86,14 +153,65 @@ def nasa_nssdc_scraper(obj_name, discipline='Any Discipline',
             # Prepare new entry for dictionary. We have all info we
             # need for a specific object
             specific_obj_name = obj_names[obj_iter]
-            specific_obj_url = obj_urls_html[obj_iter+1]['href']
+            specific_obj_url = urljoin(base_nssdc_url + "/",
+                                       obj_urls_html[obj_iter+1]['href'])
             specific_obj_nssdca_id = obj_nssdca_ids[obj_iter]
-            specfic_obj_launch_date = obj_launch_dates[obj_iter]
-            search_info_dict[specfic_obj_name] = [specific_obj_url,
+            specific_obj_launch_date = obj_launch_dates[obj_iter]
+            search_info_dict[specific_obj_name] = [specific_obj_url,
                                             specific_obj_nssdca_id,
                                             specific_obj_launch_date]
             obj_iter += 1
 
+    return search_info_dict
+
+
+def query_nssdc_catalog(obj_name, discipline='Any Discipline',
+        launch_date=None, session=None, base_nssdc_url=NSSDC_BASE_URL):
+    '''Post a query to the NSSDC spacecraft search page and parse the
+       table of objects it returns
+
+       Parameter:
+           obj_name (str): space object name
+           discipline (str): mission of the space object
+           launch_date (str): date of object launch
+           session (requests.Session): session to reuse connections from
+           base_nssdc_url (str): root url of the NSSDC catalog
+       Return:
+           dict mapping each returned object name to a list of
+           [object url, nssdca id, launch date]
+    '''
+    nssdc_query_url = base_nssdc_url + "/nmc/spacecraft/query"
+    package = build_nssdc_query_package(obj_name, discipline, launch_date)
+
+    rp = (session or requests).post(nssdc_query_url, data=package)
+    if rp.status_code != requests.codes.ok:
+        print("\nERROR: response not recieved from NASA NSSDC query engine")
+        print("\nCheck: {}".format(nssdc_query_url))
+        raise Exception
+
+    return parse_nssdc_query_page(rp.content, obj_name, base_nssdc_url)
+
+
+def nasa_nssdc_scraper(obj_name, discipline='Any Discipline',
+        launch_date=None, session=None):
+    '''Function to scrape all textual data about a given object from the
+       NASA National Space Science Data Center Catalog (NSSDC)
+
+       Parameter:
+           obj_name (str): space object name
+           discipline (str): mission of the space object
+           launch_date (str): date of object launch
+           session (requests.Session): session to make requests with, e.g.
+                                       make_scraping_session(cache=...)
+       Return:
+           str with all textual information on given object in catalog
+    '''
+    nssdc_query_url = NSSDC_BASE_URL + "/nmc/spacecraft/query"
+    search_info_dict = query_nssdc_catalog(obj_name, discipline, launch_date,
+                                           session=session)
+    obj_names = list(search_info_dict.keys())
+    obj_iter = len(obj_names)
+
     # List out objects captured by search and ask user what objects 
     # they want to include in the corpus
     print('''\n{0} objects returned from search {1} that correspond with
@@ -106,7 +224,7 @@ def nasa_nssdc_scraper(obj_name, discipline='Any Discipline',
     list_of_obj_dicts = list()
     while True:
         for idx, obj in zip(obj_names, range(obj_iter)):
-            print(\n"{0}) {1}".format(idx, obj_names))
+            print("\n{0}) {1}".format(idx, obj_names))
 
         search_param = input("""\nChoose object by index number
                     or name, or exit loop by pressing 'q': """)
@@ -128,7 +246,7 @@ def nasa_nssdc_scraper(obj_name, discipline='Any Discipline',
                 continue
 
             obj_url = search_info_dict[obj_to_search][0] 
-            obj_info_dict = grab_object_nssdc_info_from_url(obj_url)
+            obj_info_dict = grab_object_nssdc_info_from_url(obj_url, session)
             list_of_obj_dicts.append(obj_info_dict)
 
         except TypeError:
@@ -137,7 +255,7 @@ def nasa_nssdc_scraper(obj_name, discipline='Any Discipline',
         # If the user input an object name
         try:
             obj_url = search_info_dict[search_param][0] 
-            obj_info_dict = grab_object_nssdc_info_from_url(obj_url)
+            obj_info_dict = grab_object_nssdc_info_from_url(obj_url, session)
             list_of_obj_dicts.append(obj_info_dict)
 
 
@@ -181,30 +299,28 @@ def nasa_nssdc_scraper(obj_name, discipline='Any Discipline',
 
 
 
-def grab_object_nssdc_info_from_url(url):
-    '''Grab text from nssdc object page to incorporate into corpus'''
+def parse_nssdc_object_page(content, parser=HTML_PARSER,
+        parse_only=NSSDC_OBJECT_STRAINER):
+    '''Parse the description, psuedonyms and brief facts from the html
+       of an NSSDC object page into a dictionary. parser and parse_only
+       are passed on to BeautifulSoup (see parse_nssdc_query_page)'''
     # NOTE: this function relies on the specific html format imposed by the
     #       NSSDC website (as of May 10, 2019). As such, this function could
     #       easily break if the format is changed, or if the format is not
     #       generalizable to every object type
-    # TODO: read up some more on website scraping and come up with a more
-    #       general method to gather the information you need from the
-    #       website that will have less risk of breaking in the event of
-    #       a website format change
-    rs = requests.get(url)
-    if rs.status_code != requests.codes.ok:
-        print("\nERROR: no response from {}".format(url))
-        raise Exception
-    soup = BeautifulSoup(rs.content, 'html.parser')
-    body = soup.find('body')
+    body = BeautifulSoup(content, parser, parse_only=parse_only)
 
     # Initialize an object dictionary to contain all relevant nssdc 
     # information
     nssdc_obj_dict = dict()
 
-    # Grab the object description 
-    obj_desc_section = body.find('div', class_='urone')#.find('p').find('p')
-    obj_desc = obj_desc_section.find('p').find('p').get_text()
+    # Grab the object description. It sits in a paragraph opened inside an
+    # unclosed <p>: html.parser nests the two while lxml closes the outer
+    # one, so take the first innermost paragraph with text to handle both
+    obj_desc_section = body.find('div', class_='urone')
+    obj_desc = next(p for p in obj_desc_section.find_all('p')
+                    if p.find('p') is None and p.get_text(strip=True)
+                    ).get_text()
     nssdc_obj_dict['description'] = obj_desc
 
     # Fetch all object psuedonyms provided by the website
@@ -239,10 +355,113 @@ def grab_object_nssdc_info_from_url(url):
     return nssdc_obj_dict
 
 
+def grab_object_nssdc_info_from_url(url, session=None):
+    '''Grab text from nssdc object page to incorporate into corpus.
+       If a requests session is given, its connection pool is reused'''
+    # NOTE: this function relies on the specific html format imposed by the
+    #       NSSDC website (as of May 10, 2019). As such, this function could
+    #       easily break if the format is changed, or if the format is not
+    #       generalizable to every object type
+    # TODO: read up some more on website scraping and come up with a more
+    #       general method to gather the information you need from the
+    #       website that will have less risk of breaking in the event of
+    #       a website format change
+    rs = (session or requests).get(url)
+    if rs.status_code != requests.codes.ok:
+        print("\nERROR: no response from {}".format(url))
+        raise Exception
+
+    return parse_nssdc_object_page(rs.content)
+
 
 
-def astriagraph_scraper(obj_name, data_source='All',  
+
+def nasa_nssdc_batch_scraper(obj_names, discipline='Any Discipline',
+        max_workers=8, requests_per_second=4.0, session=None,
+        base_nssdc_url=NSSDC_BASE_URL):
+    '''Non-interactive version of nasa_nssdc_scraper. Queries the NSSDC
+       catalog for every name in obj_names and fetches the detail page of
+       every returned object. All requests share one keep-alive session and
+       are issued concurrently from a bounded thread pool, with requests to
+       each host rate limited.
+
+       Parameter:
+           obj_names (list of str): space object names to search for
+           discipline (str): mission of the space objects
+           max_workers (int): maximum number of concurrent requests
+           requests_per_second (float): maximum request rate per host
+           session (requests.Session): session to use, one sized for
+                                       max_workers is created if None
+           base_nssdc_url (str): root url of the NSSDC catalog
+       Return:
+           dict mapping each searched name to a list of object information
+           dictionaries (see grab_object_nssdc_info_from_url). Names whose
+           query failed map to an empty list
+    '''
+    owns_session = session is None
+    if owns_session:
+        session = make_scraping_session(pool_size=max_workers)
+    limiter = HostRateLimiter(requests_per_second)
+
+    def query(obj_name):
+        limiter.wait(base_nssdc_url)
+        return query_nssdc_catalog(obj_name, discipline, session=session,
+                                   base_nssdc_url=base_nssdc_url)
+
+    def grab(url):
+        limiter.wait(url)
+        return grab_object_nssdc_info_from_url(url, session=session)
+
+    results = {obj_name: list() for obj_name in obj_names}
+    try:
+        with ThreadPoolExecutor(max_workers=max_workers) as pool:
+            # Run all of the catalog queries first
+            query_futures = {obj_name: pool.submit(query, obj_name)
+                             for obj_name in results}
+            detail_futures = list()
+            for obj_name, future in query_futures.items():
+                try:
+                    search_info_dict = future.result()
+                except Exception:
+                    print("\nERROR: NSSDC query failed for {}".format(obj_name))
+                    continue
+                for obj_url, _, _ in search_info_dict.values():
+                    detail_futures.append(
+                        (obj_name, obj_url, pool.submit(grab, obj_url)))
+
+            # Then collect the detail pages, preserving query order
+            for obj_name, obj_url, future in detail_futures:
+                try:
+                    results[obj_name].append(future.result())
+                except Exception:
+                    print("\nERROR: could not parse {}".format(obj_url))
+    finally:
+        if owns_session:
+            session.close()
+
+    return results
+
+
+ASTRIAGRAPH_URL = "http://astria.tacc.utexas.edu/AstriaGraph/"
+
+
+def build_astriagraph_package(obj_name, data_source='All',
         nat_of_origin='All', orbit_regime='All'):
+    '''Form payload for the AstriaGraph search box'''
+    return {"SearchBox" : obj_name,
+            "DataSrcSelect" : data_source,
+            "OriginSelect" : nat_of_origin,
+            "RegimeSelect" : orbit_regime
+            }
+
+
+def parse_astriagraph_page(content):
+    '''Sort out html mumbo jumbo of an AstriaGraph response'''
+    return BeautifulSoup(content, HTML_PARSER)
+
+
+def astriagraph_scraper(obj_name, data_source='All',  
+        nat_of_origin='All', orbit_regime='All', session=None):
     '''Scrapes information of space object from University of 
        Texas, Austin's AstriaGraph.
 
@@ -267,22 +486,17 @@ def astriagraph_scraper(obj_name, data_source='All',
                                 'Geo-synchronous/stationary orbit (GSO/GEO)'
                                 'High Earth Orbit (HEO)'
     '''
-    astriagraph_url = "http://astria.tacc.utexas.edu/AstriaGraph/"
-    #with requests.Session() as rs:
-    package = {"SearchBox" : obj_name,
-               "DataSrcSelect" : data_source,
-               "OriginSelect" : nat_of_origin,
-               "RegimeSelect" : orbit_regime
-               }
-
-    rp = requests.post(astriagraph_url, data=package)
+    astriagraph_url = ASTRIAGRAPH_URL
+    package = build_astriagraph_package(obj_name, data_source,
+                                        nat_of_origin, orbit_regime)
+
+    rp = (session or requests).post(astriagraph_url, data=package)
     if rp.status_code != requests.codes.ok:
         print("\nERROR: response not recieved from Astriagraph Server")
         print("\nCheck: {}".format(astriagraph_url))
         raise Exception
 
-    # Sort out html mumbo jumbo
-    soup = BeautifulSoup(rp.content, 'html.parser')
+    soup = parse_astriagraph_page(rp.content)
     print(soup.prettify())
 
 
@@ -301,6 +515,21 @@ def google_search_scraper(search_term, cs, output='xml_no_dtd',
     for arg in args: query_str + str(arg)
 
 
+SPACETRACK_BASE_URL = "https://www.space-track.org"
+SPACETRACK_LOGIN_URL = SPACETRACK_BASE_URL + "/auth/login"
+SPACETRACK_GEO_TLE_URL = (SPACETRACK_BASE_URL +
+    "/basicspace/data/query/class/tle_latest/"
+    "ORDINAL/1/EPOCH/%3Enow-30/MEAN_MOTION/0.99-1.01/ECCENTRICITY/%3C0.01/"
+    "OBJECT_TYPE/payload/orderby/NORAD_CAT_ID/format/tle")
+
+
+def parse_spacetrack_csrf_token(text):
+    '''Pull the csrf token out of the space-track login page'''
+    tree = html.fromstring(text)
+    return list(set(tree.xpath(
+        "//input[@name='spacetrack_csrf_token']/@value")))[0]
+
+
 def spacetrack_scraper(identity, password, obj_name):
     '''
     Scrapes space-track for any relevant information about the input object
@@ -317,7 +546,7 @@ def spacetrack_scraper(identity, password, obj_name):
     }
 
     sess_req = requests.session()
-    login_url = "https://www.space-track.org/auth/login"
+    login_url = SPACETRACK_LOGIN_URL
 
     try:
         login_result = sess_req.get(login_url)
@@ -326,14 +555,13 @@ def spacetrack_scraper(identity, password, obj_name):
         print(e)
         return
 
-    tree = html.fromstring(login_result.text)
-    authenticity_token = list(set(tree.xpath("//input[@name='spacetrack_csrf_token/@value")))[0]
+    authenticity_token = parse_spacetrack_csrf_token(login_result.text)
 
     login_info["spacetrack_csrf_token"] = authenticity_token
-    login_url["password"] = password
-    login_url["identity"] = identity
+    login_info["password"] = password
+    login_info["identity"] = identity
 
-    result = session_requests.post(
+    result = sess_req.post(
         login_url,
         data=login_info,
         headers=dict(referer=login_url)
@@ -357,7 +585,7 @@ def spacetrack_scraper(identity, password, obj_name):
         'valueIn2': '0.01'
     }
 
-    query_result = sessions_requests.get(query_url, params=query_params)
+    query_result = sess_req.get(query_url, params=query_params)
     print(query_result.ok)
     print(query_result.status_code)
     print(query_result.text)
@@ -365,21 +593,16 @@ def spacetrack_scraper(identity, password, obj_name):
 
     recent_tles_url = "https://www.space-track.org/#recent"
 
-    geo_tle_url = """
-        https://www.space-track.org/basicspace/data/query/class/tle_latest/
-        ORDINAL/1/EPOCH/%3Enow-30/MEAN_MOTION/0.99-1.01/ECCENTRICITY/%3C0.01/
-        OBJECT_TYPE/payload/orderby/NORAD_CAT_ID/format/tle
-        """
-
-    session_requests.headers.update
+    geo_tle_url = SPACETRACK_GEO_TLE_URL
 
     try:
-        tle_pull_result = session_requests.get(
+        tle_pull_result = sess_req.get(
             geo_tle_url,
             headers={'referer':"https://www.space-track.org"}
         )
     except Exception as e:
         print("<p>Error: %s</p>" % e)
+        return
 
     print(tle_pull_result.ok)
     print(tle_pull_result.status_code)
@@ -390,6 +613,117 @@ def spacetrack_scraper(identity, password, obj_name):
 
 
 
+class NSSDCScraper(ScraperPlugin):
+    '''FetchEngine backend for the NASA NSSDC catalog. Scraping an object
+       name returns the list of object information dictionaries for every
+       object the catalog query returned (see parse_nssdc_object_page).
+    '''
+    name = 'NSSDC'
+
+    def __init__(self, discipline='Any Discipline', launch_date=None,
+                 base_nssdc_url=NSSDC_BASE_URL):
+        self.discipline = discipline
+        self.launch_date = launch_date
+        self.base_nssdc_url = base_nssdc_url
+
+    async def fetch(self, engine, obj_name):
+        package = build_nssdc_query_package(obj_name, self.discipline,
+                                            self.launch_date)
+        response = await engine.fetch(
+            self.base_nssdc_url + "/nmc/spacecraft/query",
+            method='POST', data=package)
+        search_info_dict = parse_nssdc_query_page(response.content, obj_name,
+                                                  self.base_nssdc_url)
+
+        pages = await asyncio.gather(*[engine.fetch(obj_url)
+                                       for obj_url, _, _ in
+                                       search_info_dict.values()])
+        return [page.content for page in pages]
+
+    def parse(self, obj_name, raw):
+        return [parse_nssdc_object_page(page) for page in raw]
+
+
+class AstriaGraphScraper(ScraperPlugin):
+    '''FetchEngine backend for University of Texas, Austin's AstriaGraph.
+       See astriagraph_scraper for the possible search parameters.
+    '''
+    name = 'AstriaGraph'
+
+    def __init__(self, data_source='All', nat_of_origin='All',
+                 orbit_regime='All', astriagraph_url=ASTRIAGRAPH_URL):
+        self.data_source = data_source
+        self.nat_of_origin = nat_of_origin
+        self.orbit_regime = orbit_regime
+        self.astriagraph_url = astriagraph_url
+
+    async def fetch(self, engine, obj_name):
+        package = build_astriagraph_package(obj_name, self.data_source,
+                                            self.nat_of_origin,
+                                            self.orbit_regime)
+        response = await engine.fetch(self.astriagraph_url, method='POST',
+                                      data=package)
+        return response.content
+
+    def parse(self, obj_name, raw):
+        return parse_astriagraph_page(raw)
+
+
+class SpaceTrackScraper(ScraperPlugin):
+    '''FetchEngine backend for space-track. Logs in once per engine
+       session and returns the satellite catalog entries whose object name
+       matches the scraped name.
+    '''
+    name = 'Space-Track'
+
+    def __init__(self, identity, password,
+                 spacetrack_url=SPACETRACK_BASE_URL):
+        self.identity = identity
+        self.password = password
+        self.spacetrack_url = spacetrack_url
+        self._logged_in = None
+        self._login_lock = None
+
+    def __getstate__(self):
+        # The login state is tied to one event loop and engine session, so
+        # copies sent to parse workers are created logged out
+        state = self.__dict__.copy()
+        state['_logged_in'] = None
+        state['_login_lock'] = None
+        return state
+
+    async def login(self, engine):
+        '''Log in to space-track, once for all concurrent scrapes'''
+        if self._login_lock is None:
+            self._login_lock = asyncio.Lock()
+        async with self._login_lock:
+            if self._logged_in is engine.session:
+                return
+            login_url = self.spacetrack_url + "/auth/login"
+            login_page = await engine.fetch(login_url)
+            login_info = {
+                "identity": self.identity,
+                "password": self.password,
+                "spacetrack_csrf_token": parse_spacetrack_csrf_token(
+                    login_page.content)
+            }
+            await engine.fetch(login_url, method='POST', data=login_info,
+                               headers=dict(referer=login_url))
+            self._logged_in = engine.session
+
+    async def fetch(self, engine, obj_name):
+        await self.login(engine)
+        query_url = (self.spacetrack_url +
+                     "/basicspacedata/query/class/satcat/OBJECT_NAME/~~" +
+                     quote(obj_name) + "/format/json")
+        response = await engine.fetch(
+            query_url, headers={'referer': self.spacetrack_url})
+        return response.content
+
+    def parse(self, obj_name, raw):
+        return json.loads(raw)
+
+
 def save_object_info_to_corpus(OID, obj_info_dict, info_source,
                             *args, **kwargs):
     '''Save scraped object info into text corpus'''
@@ -401,16 +735,91 @@ def save_object_info_to_corpus(OID, obj_info_dict, info_source,
         json.dump(obj_data, ocj)
 
 
-def search_oid_by_obj_psuedonym(obj_psuedo):
+class PsuedonymIndex(object):
+    '''In-memory index mapping object psuedonyms to satellite catalog
+       numbers (OIDs). The psuedonym file is only re-read when its
+       modification time changes, so repeated lookups cost a single
+       dictionary access instead of a scan over the whole file.
+
+       Parameters:
+           psuedonym_file (str): json file mapping OID -> list of psuedonyms
+           fuzzy (bool): if True, matching ignores case, punctuation and
+                         repeated whitespace
+    '''
+
+    def __init__(self, psuedonym_file='object_psuedonyms.txt', fuzzy=False):
+        self.psuedonym_file = psuedonym_file
+        self.fuzzy = fuzzy
+        self._mtime = None
+        self._index = dict()
+
+    def normalize(self, psuedonym):
+        '''Convert a psuedonym into the key used by the index'''
+        if not self.fuzzy:
+            return psuedonym
+        psuedonym = re.sub(r'[^\w\s]', ' ', psuedonym.lower())
+        return ' '.join(psuedonym.split())
+
+    def refresh(self):
+        '''Rebuild the index if the psuedonym file changed on disk'''
+        mtime = os.path.getmtime(self.psuedonym_file)
+        if mtime == self._mtime:
+            return
+
+        with open(self.psuedonym_file, 'r') as opj:
+            psuedo_data = json.load(opj)
+
+        index = dict()
+        for OID, psuedo_list in psuedo_data.items():
+            for psuedonym in psuedo_list:
+                # Keep the first OID seen for a psuedonym, matching the
+                # behaviour of the original linear search
+                index.setdefault(self.normalize(psuedonym), OID)
+
+        self._index = index
+        self._mtime = mtime
+
+    def resolve(self, obj_psuedo):
+        '''Return the OID for a single psuedonym, or None if unknown'''
+        self.refresh()
+        return self._index.get(self.normalize(obj_psuedo))
+
+    def resolve_many(self, names):
+        '''Return a dict mapping each name to its OID (None if unknown).
+           The psuedonym file is checked for changes once per batch.
+        '''
+        self.refresh()
+        return {name: self._index.get(self.normalize(name))
+                for name in names}
+
+
+# Module level indices, one per (file, matching mode), so that every call
+# to search_oid_by_obj_psuedonym shares the same in-memory index
+_psuedonym_indices = dict()
+
+
+def get_psuedonym_index(psuedonym_file='object_psuedonyms.txt', fuzzy=False):
+    '''Return the shared PsuedonymIndex for the given file'''
+    key = (os.path.abspath(psuedonym_file), fuzzy)
+    if key not in _psuedonym_indices:
+        _psuedonym_indices[key] = PsuedonymIndex(psuedonym_file, fuzzy)
+    return _psuedonym_indices[key]
+
+
+def search_oid_by_obj_psuedonym(obj_psuedo, fuzzy=False,
+        psuedonym_file='object_psuedonyms.txt'):
     '''Searches for satellite catalog number for given object
        psuedonym
     '''
-    with open('object_psuedonyms.txt', 'r') as opj:
-        psuedo_data = json.load(opj)
-        for OID, psuedo_list in data.items():
-            for psuedonym in psuedo_list:
-                if psuedonym == obj_psuedo:
-                    return OID
+    return get_psuedonym_index(psuedonym_file, fuzzy).resolve(obj_psuedo)
+
+
+def resolve_many(names, fuzzy=False,
+        psuedonym_file='object_psuedonyms.txt'):
+    '''Searches for satellite catalog numbers for a batch of object
+       psuedonyms. Returns a dict mapping each name to its OID (or None)
+    '''
+    return get_psuedonym_index(psuedonym_file, fuzzy).resolve_many(names)
 
 if __name__ == '__main__':
     nasa_nssdc_scraper('Galaxy')
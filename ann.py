@@ -1,17 +1,21 @@
-import tensorflow as tf
-import numpy as np
-
 import argparse
 
 import os
 import functools
+import re
+import zlib
+
+from lazy_import import lazy_import
+
+# TensorFlow and NumPy are only loaded once a graph is actually built, so
+# importing this module (e.g. from test.py) stays cheap
+tf = lazy_import('tensorflow')
+np = lazy_import('numpy')
 
 # Custom modules
 #from Dataset.dataset_generator_porteng_translate import DatasetGenerator_PtToEng
 #from Dataset.tnn_encoder import PositionalEncoder
 
-slim = tf.contrib.slim
-
 def doublewrap(function):
     """
     A decorator decorator, allowing to use the decorator to be used without
@@ -79,18 +83,39 @@ class Model(object):
        author: 1st Lt Peter Thomas
     '''
     def __init__(self, input_size, label_size, batch_size, learning_rate,
-                 d_model, num_heads, enqueue_threads, val_enqueue_threads,
-                 data_dir, train_file, validation_file):
+                 d_model, num_heads, enqueue_threads=None,
+                 val_enqueue_threads=None, data_dir=None, train_file=None,
+                 validation_file=None, num_layers=6, dff=2048,
+                 dropout_rate=0.1, max_position=1000, recompute_layers=False,
+                 static_masks=False, int8_layers=()):
 
         # training parameters
-        self.input_size = input_size
-        self.label_size = label_size
+        self.input_size = input_size    # input vocabulary size
+        self.label_size = label_size    # target vocabulary size
         self.learning_rate = learning_rate
         self.batch_size = batch_size
 
         # model parameters
         self.d_model = d_model
         self.num_heads = num_heads
+        self.depth = d_model // num_heads
+        self.num_layers = num_layers
+        self.dff = dff
+        self.dropout_rate = dropout_rate
+        self.max_position = max_position
+
+        # Recompute each encoder/decoder layer's activations during the
+        # backward pass instead of keeping them, trading extra compute for
+        # activation memory that no longer grows with num_layers
+        self.recompute_layers = recompute_layers
+
+        # Build the look ahead mask from a constant table (see
+        # create_look_ahead_mask); meant for exported inference graphs
+        self.static_masks = static_masks
+
+        # Names of the fc layers (e.g. 'wq', 'fc1') that run on int8
+        # weights produced by quantize_model.py; inference only
+        self.int8_layers = frozenset(int8_layers)
 
         # computing parameters
         self.enqueue_threads = enqueue_threads
@@ -127,7 +152,7 @@ class Model(object):
 
     def print_out(self, q, k, v):
         '''Print the attention weights and the output'''
-        temp_out, temp_attn = attention(
+        temp_out, temp_attn = self.attention(
                         q, k, v, None)
         print('Attention weights are:')
         print(temp_attn)
@@ -148,9 +173,33 @@ class Model(object):
         '''Masks future tokens in sequence. Indicates which entries
            should not be used
         '''
+        if self.static_masks:
+            # Slice of a constant table, so an exported graph holds the
+            # mask as a folded constant instead of rebuilding it per run
+            table = np.triu(np.ones((self.max_position, self.max_position),
+                                    dtype=np.float32), 1)
+            return tf.constant(table)[:size, :size]
         mask = 1 - tf.linalg.band_part(tf.ones((size, size)), -1, 0)
         return mask # (seq_len, seq_len)
 
+    def create_masks(self, inp, tar):
+        '''Build the three masks used by the transformer
+
+           :param inp: batch of input token ids (batch_size, inp_seq_len)
+           :param tar: batch of decoder input ids (batch_size, tar_seq_len)
+           :return: encoder padding mask, combined look ahead and target
+                    padding mask for the decoder self attention, and the
+                    padding mask for the decoder attention over the encoder
+        '''
+        enc_padding_mask = self.create_padding_mask(inp)
+        dec_padding_mask = self.create_padding_mask(inp)
+
+        look_ahead_mask = self.create_look_ahead_mask(tf.shape(tar)[1])
+        dec_target_padding_mask = self.create_padding_mask(tar)
+        combined_mask = tf.maximum(dec_target_padding_mask, look_ahead_mask)
+
+        return enc_padding_mask, combined_mask, dec_padding_mask
+
     def weight_variable(self, shape):
 
         initial = tf.truncated_normal(shape, stddev=0.1)
@@ -166,23 +215,33 @@ class Model(object):
     def feed_forward_layer(self, x, W, b):
         return tf.nn.relu(tf.matmul(x, W) + b)
 
-    def pointwise_feed_forward_layer(self, x, W1, b1, W2, b2):
-
-        first_fc = self.fc(x, W1, b1)
-        second_fc = self.fc(first_fc, W2, b2, relu=False)
+    def pointwise_feed_forward_layer(self, x):
+        '''Two fully connected layers applied to every position
+           separately: d_model -> dff (relu) -> d_model'''
+        first_fc = self.fc(x, self.d_model, self.dff, 'fc1')
+        second_fc = self.fc(first_fc, self.dff, self.d_model, 'fc2', relu=False)
         return second_fc
 
     def fc(self, x, num_in, num_out, name, relu=True):
         '''Create a fully connected layer.
            Adopted from Justin R. Fletcher'''
         with tf.variable_scope(name) as scope:
+            biases = tf.get_variable('biases', [num_out], trainable=True)
+            if name in self.int8_layers:
+                return self.int8_fc(x, num_in, num_out, biases, scope, relu)
+
             # Create tf variables for the weights and biases
             weights = tf.get_variable('weights', shape=[num_in, num_out],
                             trainable=True)
-            biases = tf.get_variable('biases', [num_out], trainable=True)
 
-            # Matrix multiply weights and inputs and add bias
-            act = tf.nn.xw_plus_b(x, weights, biases, name=scope.name)
+            # Matrix multiply weights and inputs and add bias. Sequences
+            # (batch_size, seq_len, num_in) are multiplied along their
+            # last axis
+            if x.shape.ndims == 2:
+                act = tf.nn.xw_plus_b(x, weights, biases, name=scope.name)
+            else:
+                act = tf.add(tf.tensordot(x, weights, axes=1), biases,
+                             name=scope.name)
 
         if relu:
             # Apply ReLu non linearity
@@ -191,6 +250,69 @@ class Model(object):
         else:
             return act
 
+    def int8_fc(self, x, num_in, num_out, biases, scope, relu=True):
+        '''Fully connected layer on per output channel int8 weights, as
+           written by quantize_model.py. The weights are widened to float
+           on the fly and the channel scales are applied to the matmul
+           output rather than to the weights.
+        '''
+        weights = tf.get_variable('weights_int8', shape=[num_in, num_out],
+                                  dtype=tf.int8, trainable=False,
+                                  initializer=tf.zeros_initializer())
+        scales = tf.get_variable('weights_scale', shape=[num_out],
+                                 trainable=False,
+                                 initializer=tf.ones_initializer())
+        weights = tf.cast(weights, x.dtype)
+
+        if x.shape.ndims == 2:
+            act = tf.matmul(x, weights)
+        else:
+            act = tf.tensordot(x, weights, axes=1)
+        act = tf.add(act * scales, biases, name=scope.name)
+
+        return tf.nn.relu(act) if relu else act
+
+    def layer_norm(self, x, name, epsilon=1e-6):
+        '''Normalize x over its last (d_model) axis'''
+        with tf.variable_scope(name):
+            gamma = tf.get_variable('gamma', [self.d_model],
+                            initializer=tf.ones_initializer())
+            beta = tf.get_variable('beta', [self.d_model],
+                            initializer=tf.zeros_initializer())
+            mean, variance = tf.nn.moments(x, axes=[-1], keep_dims=True)
+            return gamma * (x - mean) * tf.math.rsqrt(variance + epsilon) + beta
+
+    def dropout(self, x, training, name):
+        '''Dropout with a seed fixed by the tower, variable scope and name,
+           so a layer recomputed on the backward pass drops the same units
+           as its forward pass did, while the towers of data_parallel.py,
+           which share their variable scopes, still drop different units'''
+        seed = None
+        if self.recompute_layers:
+            # The recomputed pass runs under the gradient name scope of the
+            # forward ops, which still contains their tower_<i> scope
+            towers = [part for part in
+                      tf.get_default_graph().get_name_scope().split('/')
+                      if re.match(r'tower_\d+$', part)]
+            scope_name = '/'.join(towers[:1] +
+                                  [tf.get_variable_scope().name, name])
+            seed = zlib.crc32(scope_name.encode('utf-8')) & 0x7FFFFFFF
+        return tf.layers.dropout(x, self.dropout_rate, training=training,
+                                 seed=seed)
+
+    def embedding(self, x, vocab_size, name):
+        '''Embed token ids and add the positional encoding'''
+        # Imported here so that importing this module stays free of the
+        # TensorFlow import done by the encoder module
+        from Dataset.ann_encoder import positional_encoding
+
+        embeddings = tf.get_variable(name, shape=[vocab_size, self.d_model])
+        x = tf.nn.embedding_lookup(embeddings, x)
+        x *= tf.math.sqrt(tf.cast(self.d_model, tf.float32))
+
+        pos_encoding = positional_encoding(self.max_position, self.d_model)
+        return x + pos_encoding[:, :tf.shape(x)[1], :]
+
     def attention(self, Q, K, V, mask=None):
         '''Implements attention layer
             Note: Q, K, and V must have matching leading dimensions
@@ -204,7 +326,7 @@ class Model(object):
         dk = tf.cast(tf.shape(K)[-1], tf.float32)
         attention_logits = tf.matmul(Q, K,
                     transpose_b=True) / tf.math.sqrt(dk)
-        if mask: attention_logits += (mask * -1e9)
+        if mask is not None: attention_logits += (mask * -1e9)
         attention_weights = tf.nn.softmax(attention_logits, axis=-1)
         output = tf.matmul(attention_weights, V)
         return output, attention_weights
@@ -220,75 +342,26 @@ class Model(object):
            :param K: matrix of set of keys
            :param V: matrix of set of values
         '''
-
-        # initialize list for parallel attention layers (or heads)
-        parallel_attention_layers = tf.Variable([],dtype=tf.float32)
-        parallel_attention_weights = list()
-
-        dk = tf.cast(tf.shape(K)[-1], tf.float32)
-        dv = tf.cast(tf.shape(V)[-1], tf.float32)
-
-        # Prepare heads
-        for _ in range(self.num_heads):
-
-            W_q = self.weight_variable([self.batch_size, self.d_model, dk])
-            W_k = self.weight_variable([self.batch_size, self.d_model, dk])
-            W_v = self.weight_variable([self.batch_size, self.d_model, dv])
-
-            QW = tf.matmul(Q, W_q)
-            KW = tf.matmul(K, W_k)
-            VW = tf.matmul(V, W_v)
-
-            attention_output, attention_weights = self.attention(
-                                QW, KW, VW, mask)
-            parallel_attention_layers = tf.concat([parallel_attention_layers,
-                                                   attention_output], 0)
-            parallel_attention_weights.append(attention_weights)
-
-        # concatenate heads
-        parallel_attention_layers = tf.reshape(parallel_attention_layers,
-                                               self.batch_size, -1, self.d_model)
-        W_o = self.weight_variable([self.num_heads * dv, self.d_model])
-        # Note: no bias parameters are actually initialized for the final
-        #       output of the multihead attention layer, this variable is
-        #       just an artifact needed as input for the feed forward layer
-        #       function
-        b_o = tf.zeros([self.d_model], dtype=tf.float32)
-        output = self.feed_forward_layer(parallel_attention_layers, W_o, b_o)
-
-        return output, parallel_attention_weights
-
-    def google_multihead_attention(self, Q, K, V, mask):
-
-        wq = self.weight_variable(tf.shape(Q)[1], self.d_model)
-        wk = self.weight_variable(tf.shape(K)[1], self.d_model)
-        wv = self.weight_variable(tf.shape(V)[1], self.d_model)
-
-        bq = self.bias_variable(self.d_model)
-        bk = self.bias_variable(self.d_model)
-        bv = self.bias_variable(self.d_model)
-
-        aq = self.feed_forward_layer(Q, wq, bq)
-        ak = self.feed_forward_layer(K, wk, bk)
-        av = self.feed_forward_layer(V, wv, bv)
-
         batch_size = tf.shape(Q)[0]
 
-        q = self.split_heads(aq, batch_size)
-        k = self.split_heads(ak, batch_size)
-        v = self.split_heads(av, batch_size)
+        # Project to d_model and split into heads. The projection weights
+        # are shared by every example, so they do not depend on the batch
+        q = self.split_heads(self.fc(Q, self.d_model, self.d_model, 'wq',
+                                     relu=False), batch_size)
+        k = self.split_heads(self.fc(K, self.d_model, self.d_model, 'wk',
+                                     relu=False), batch_size)
+        v = self.split_heads(self.fc(V, self.d_model, self.d_model, 'wv',
+                                     relu=False), batch_size)
 
-        attention, attention_weights = self.attention(q, k, v, mask)
+        # (batch_size, num_heads, seq_len_q, depth)
+        attention_output, attention_weights = self.attention(q, k, v, mask)
 
-        attention = tf.transpose(attention, perm=[0, 2, 1, 3])
-
-        concat_attention = tf.reshape(attention,
+        # concatenate heads
+        attention_output = tf.transpose(attention_output, perm=[0, 2, 1, 3])
+        concat_attention = tf.reshape(attention_output,
                         (batch_size, -1, self.d_model))
-
-        wa = self.weight_variable(tf.shape(concat_attention)[1], self.d_model)
-        ba = self.weight_variable(tf.shape(self.d_model))
-
-        output = self.feed_forward_layer(concat_attention, wa, ba)
+        output = self.fc(concat_attention, self.d_model, self.d_model, 'wo',
+                         relu=False)
 
         return output, attention_weights
 
@@ -297,110 +370,171 @@ class Model(object):
         x = tf.reshape(x, (batch_size, -1, self.num_heads, self.depth))
         return tf.transpose(x, perm=[0, 2, 1, 3])
 
-    def encoder_layer(self, x, rate):
+    def encoder_layer(self, x, mask, training):
         '''An encoder layer consists of the following sublayers:
-                1. Multi-head attention (with padding''''' \
-
-        # TODO: complete pure TensorFlow implementation of encoder layer
-        attn_output, _ = self.multihead_attention(x, x, x, mask)
-        attn_output = tf.nn.Dropout(attn_output, rate)
-        output1 = tf.layers.batch_normalization(attn_output, epsilon=1e-6)
-
-        W_ffn = self.weight_variable()
-        b_ffn = self.bias_variable()
-        ffn_output = self.pointwise_feed_forward_layer(output1, )
-
-
-    def decoder_layer(self, x, rate, look_ahead_mask, padding_mask):
-
-        # TODO: complete pure TensorFlow implementation of decoder layer
-        attn1, attn_W = self.multihead_attention(x, x, x, look_ahead_mask)
-
-    def encoder(self, num_layers, input=None, input_vocab_size=None, rate=0.1):
+                1. Multi-head attention (with padding mask)
+                2. Point wise feed forward network
+           each followed by dropout, a residual connection and layer
+           normalization'''
+        with tf.variable_scope('multihead_attention'):
+            attn_output, _ = self.multihead_attention(x, x, x, mask)
+        attn_output = self.dropout(attn_output, training, 'attention_dropout')
+        output1 = self.layer_norm(x + attn_output, 'layer_norm1')
+
+        with tf.variable_scope('ffn'):
+            ffn_output = self.pointwise_feed_forward_layer(output1)
+        ffn_output = self.dropout(ffn_output, training, 'ffn_dropout')
+        output2 = self.layer_norm(output1 + ffn_output, 'layer_norm2')
+
+        return output2
+
+    def decoder_layer(self, x, enc_output, training, look_ahead_mask,
+                      padding_mask):
+        '''A decoder layer consists of the following sublayers:
+                1. Masked multi-head self attention (with look ahead mask)
+                2. Multi-head attention over the encoder output (with
+                   padding mask)
+                3. Point wise feed forward network
+           each followed by dropout, a residual connection and layer
+           normalization'''
+        with tf.variable_scope('masked_multihead_attention'):
+            attn1, attn_weights_block1 = self.multihead_attention(
+                x, x, x, look_ahead_mask)
+        attn1 = self.dropout(attn1, training, 'attention_dropout1')
+        out1 = self.layer_norm(attn1 + x, 'layer_norm1')
+
+        with tf.variable_scope('multihead_attention'):
+            attn2, attn_weights_block2 = self.multihead_attention(
+                out1, enc_output, enc_output, padding_mask)
+        attn2 = self.dropout(attn2, training, 'attention_dropout2')
+        out2 = self.layer_norm(attn2 + out1, 'layer_norm2')
+
+        with tf.variable_scope('ffn'):
+            ffn_output = self.pointwise_feed_forward_layer(out2)
+        ffn_output = self.dropout(ffn_output, training, 'ffn_dropout')
+        out3 = self.layer_norm(ffn_output + out2, 'layer_norm3')
+
+        return out3, attn_weights_block1, attn_weights_block2
+
+    def encoder(self, inp, training, mask):
         '''
-        input: tensor of input corpus. if none, uses instantiation input
-        output: tensor of computed logits
+        input: tensor of input token ids (batch_size, inp_seq_len)
+        output: tensor of encoded inputs (batch_size, inp_seq_len, d_model)
         '''
-        # TODO: complete pure tensorflow implementation of encoder, based on Justin's code
-        ###############################
-
-        print_tensor_shape(self.stimulus_placeholder, 'corpus shape')
-        print_tensor_shape(self.target_placeholder, 'label shape')
-
-        # resize the image tensors to add channels, 1 in this case
-        # required to pass the images to various layers upcoming in the graph
-        images_re = tf.reshape(self.stimulus_placeholder, [-1, 28, 28, 1])
-        print_tensor_shape(images_re, 'reshaped images shape')
-
-
-        pos_encoding = positional_encoding(input_vocab_size, self.d_model)
-
-        for n in range(num_layers):
-            with tf.name_scope('encoding_layer' + n):
-                h_enc_output = self.encoder_layer(h_enc_output, rate)
-
-        # Convolution layer.
-        with tf.name_scope('Conv1'):
-
-            # weight variable 4d tensor, first two dims are patch (kernel) size
-            # 3rd dim is number of input channels, 4th dim is output channels
-            W_conv1 = self.weight_variable([5, 5, 1, 32])
-            b_conv1 = self.bias_variable([32])
-            h_conv1 = tf.nn.relu(self.conv2d(images_re, W_conv1) + b_conv1)
-            print_tensor_shape(h_conv1, 'Conv1 shape')
+        x = self.embedding(inp, self.input_size, 'input_embedding')
+        x = self.dropout(x, training, 'embedding_dropout')
 
-        # Pooling layer.
-        with tf.name_scope('Pool1'):
+        encoder_layer = lambda x, mask: self.encoder_layer(x, mask, training)
+        if self.recompute_layers and training:
+            # Only the layer inputs are kept for the backward pass
+            encoder_layer = tf.contrib.layers.recompute_grad(encoder_layer)
 
-            h_pool1 = self.max_pool_2x2(h_conv1)
-            print_tensor_shape(h_pool1, 'MaxPool1 shape')
+        for n in range(self.num_layers):
+            with tf.variable_scope('encoding_layer' + str(n)):
+                x = encoder_layer(x, mask)
 
-        # Conv layer.
-        with tf.name_scope('Conv2'):
+        return x
 
-            W_conv2 = self.weight_variable([5, 5, 32, 64])
-            b_conv2 = self.bias_variable([64])
-            h_conv2 = tf.nn.relu(self.conv2d(h_pool1, W_conv2) + b_conv2)
-            print_tensor_shape(h_conv2, 'Conv2 shape')
-
-        # Pooling layer.
-        with tf.name_scope('Pool2'):
-
-            h_pool2 = self.max_pool_2x2(h_conv2)
-            print_tensor_shape(h_pool2, 'MaxPool2 shape')
-
-        # Fully-connected layer.
-        with tf.name_scope('fully_connected1'):
-
-            h_pool2_flat = tf.reshape(h_pool2, [-1, 7 * 7 * 64])
-            print_tensor_shape(h_pool2_flat, 'MaxPool2_flat shape')
-
-            W_fc1 = self.weight_variable([7 * 7 * 64, 1024])
-            b_fc1 = self.bias_variable([1024])
-
-            h_fc1 = tf.nn.relu(tf.matmul(h_pool2_flat, W_fc1) + b_fc1)
-            print_tensor_shape(h_fc1, 'FullyConnected1 shape')
-
-        # Dropout layer.
-        with tf.name_scope('dropout'):
-
-            h_fc1_drop = tf.nn.dropout(h_fc1, self.keep_prob)
-
-        # Output layer (will be transformed via stable softmax)
-        with tf.name_scope('readout'):
+    def decoder(self, tar, enc_output, training, look_ahead_mask,
+                padding_mask):
+        '''
+        input: tensor of target token ids (batch_size, tar_seq_len) and the
+               encoder output
+        output: tensor of decoded targets (batch_size, tar_seq_len, d_model)
+                and a dictionary of the attention weights of every layer
+        '''
+        attention_weights = dict()
+
+        x = self.embedding(tar, self.label_size, 'target_embedding')
+        x = self.dropout(x, training, 'embedding_dropout')
+
+        decoder_layer = lambda x, enc_output, look_ahead_mask, padding_mask: \
+            self.decoder_layer(x, enc_output, training, look_ahead_mask,
+                               padding_mask)
+        if self.recompute_layers and training:
+            # Only the layer inputs are kept for the backward pass
+            decoder_layer = tf.contrib.layers.recompute_grad(decoder_layer)
+
+        for n in range(self.num_layers):
+            with tf.variable_scope('decoding_layer' + str(n)):
+                x, block1, block2 = decoder_layer(
+                    x, enc_output, look_ahead_mask, padding_mask)
+            attention_weights['decoder_layer{}_block1'.format(n)] = block1
+            attention_weights['decoder_layer{}_block2'.format(n)] = block2
+
+        return x, attention_weights
+
+    def transformer(self, inp, tar, training):
+        '''Build the full transformer on a batch of input ids and decoder
+           input ids. Variables are created on the first call and reused on
+           later ones, so training, validation and inference graphs can be
+           built from the same Model and share their weights.
+
+           :return: logits (batch_size, tar_seq_len, label_size) and the
+                    decoder attention weights
+        '''
+        enc_output = self.transformer_encode(inp, training)
+        dec_output, attention_weights = self.transformer_decode(
+            tar, enc_output, inp, training)
+        return self.output_layer(dec_output), attention_weights
 
-            W_fc2 = self.weight_variable([1024, 10])
-            b_fc2 = self.bias_variable([10])
+    def transformer_encode(self, inp, training):
+        '''Encoder half of the transformer, run once per input batch when
+           decoding
 
-            readout = tf.matmul(h_fc1_drop, W_fc2) + b_fc2
-            print_tensor_shape(readout, 'readout shape')
+           :return: encoder output (batch_size, inp_seq_len, d_model)
+        '''
+        with tf.variable_scope('transformer', reuse=tf.AUTO_REUSE):
+            enc_padding_mask = self.create_padding_mask(inp)
+            with tf.variable_scope('encoder'):
+                return self.encoder(inp, training, enc_padding_mask)
 
-        return readout
-        ###############################
+    def transformer_decode(self, tar, enc_output, inp, training):
+        '''Decoder half of the transformer. inp is only used to mask the
+           padding of the encoder output
 
-    def decoder(self):
-        # TODO: complete pure tensorflow implementation of transformer decoder
-        pass
+           :return: decoder output (batch_size, tar_seq_len, d_model) and
+                    the decoder attention weights
+        '''
+        with tf.variable_scope('transformer', reuse=tf.AUTO_REUSE):
+            _, combined_mask, dec_padding_mask = self.create_masks(inp, tar)
+            with tf.variable_scope('decoder'):
+                return self.decoder(tar, enc_output, training, combined_mask,
+                                    dec_padding_mask)
+
+    def output_layer(self, dec_output):
+        '''Project decoder outputs to logits over the target vocabulary'''
+        with tf.variable_scope('transformer', reuse=tf.AUTO_REUSE):
+            return self.fc(dec_output, self.d_model, self.label_size,
+                           'final_layer', relu=False)
+
+    def loss_function(self, real, logits):
+        '''Cross entropy averaged over the non padding target tokens
+
+           :return: mean loss and the number of non padding tokens
+        '''
+        mask = tf.cast(tf.math.not_equal(real, 0), tf.float32)
+        loss_ = tf.nn.sparse_softmax_cross_entropy_with_logits(
+            labels=real, logits=logits)
+        num_tokens = tf.reduce_sum(mask)
+        loss = tf.reduce_sum(loss_ * mask) / tf.maximum(num_tokens, 1.0)
+        return loss, num_tokens
+
+    def learning_rate_schedule(self, global_step, warmup_steps):
+        '''Linear warmup to self.learning_rate over warmup_steps, followed
+           by inverse square root decay, as in "Attention Is All You Need"
+        '''
+        step = tf.cast(global_step, tf.float32) + 1.0
+        if not warmup_steps:
+            return tf.constant(self.learning_rate)
+        warmup_steps = float(warmup_steps)
+        return self.learning_rate * tf.minimum(
+            step / warmup_steps, tf.math.rsqrt(step / warmup_steps))
+
+    def optimizer(self, learning_rate):
+        '''Adam with the hyperparameters used in the paper'''
+        return tf.train.AdamOptimizer(learning_rate, beta1=0.9, beta2=0.98,
+                                      epsilon=1e-9)
 
 
 ############################################################
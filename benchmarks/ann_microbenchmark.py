@@ -0,0 +1,318 @@
+"""
+Micro-benchmarks of the building blocks of ann.Model: attention,
+multihead_attention, split_heads, the pointwise feed forward network,
+create_padding_mask and positional_encoding.
+
+Every block is timed on random inputs over a sweep of batch size,
+sequence length, d_model and num_heads (only the parameters a block
+depends on are swept for it), forward only and forward + backward, with
+warmup runs and the median of repeated runs. Throughput is reported in
+tokens (batch_size * seq_len) per second, along with the peak RSS of the
+process while the case ran. Results are saved as json with the commit and
+library versions they were measured with, and can be compared against an
+earlier run:
+
+    python benchmarks/ann_microbenchmark.py --output_json blocks.json
+    python benchmarks/ann_microbenchmark.py --baseline_json blocks.json
+
+Inputs are variables rather than constants, so that grappler cannot fold
+the benchmarked ops away, and outputs are not fetched, so that copying
+them out of the session is not timed.
+"""
+
+import argparse
+import itertools
+import json
+import os
+import platform
+import re
+import statistics
+import subprocess
+import sys
+import time
+
+import numpy as np
+import tensorflow as tf
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_ROOT)
+
+from ann import Model
+from Dataset.ann_encoder import positional_encoding
+
+
+# block -> the sweep parameters it depends on
+BLOCKS = {
+    'attention': ('batch_size', 'seq_len', 'd_model', 'num_heads'),
+    'multihead_attention': ('batch_size', 'seq_len', 'd_model', 'num_heads'),
+    'split_heads': ('batch_size', 'seq_len', 'd_model', 'num_heads'),
+    'ffn': ('batch_size', 'seq_len', 'd_model'),
+    'create_padding_mask': ('batch_size', 'seq_len'),
+    'positional_encoding': ('seq_len', 'd_model'),
+}
+SWEEP = ('batch_size', 'seq_len', 'd_model', 'num_heads')
+
+
+def reset_peak_rss():
+    '''Reset the peak RSS of the process (Linux only)'''
+    try:
+        with open('/proc/self/clear_refs', 'w') as cf:
+            cf.write('5')
+    except OSError:
+        pass
+
+
+def peak_rss_mb():
+    '''Peak RSS of the process since the last reset_peak_rss, in MiB'''
+    try:
+        with open('/proc/self/status', 'r') as sf:
+            return int(re.search(r'VmHWM:\s+(\d+)', sf.read()).group(1)) / 1024
+    except (OSError, AttributeError):
+        import resource
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def time_runs(run, warmup_runs, num_runs):
+    '''Median wall time of run() in seconds, after warmup_runs calls'''
+    for _ in range(warmup_runs):
+        run()
+    times = list()
+    for _ in range(num_runs):
+        start_time = time.perf_counter()
+        run()
+        times.append(time.perf_counter() - start_time)
+    return statistics.median(times)
+
+
+def build_block(block, model, rng, batch_size, seq_len):
+    '''Graph of one block on random variable inputs, returning its output'''
+    d_model, num_heads = model.d_model, model.num_heads
+
+    def variable(name, value, dtype=tf.float32):
+        return tf.get_variable(name, initializer=value.astype(dtype.as_numpy_dtype),
+                               trainable=dtype.is_floating)
+
+    # Token ids with a random amount of trailing padding per sentence
+    lengths = rng.randint(seq_len // 2, seq_len + 1, size=batch_size)
+    ids = rng.randint(1, model.input_size, size=(batch_size, seq_len))
+    ids[np.arange(seq_len)[np.newaxis, :] >= lengths[:, np.newaxis]] = 0
+
+    if block == 'create_padding_mask':
+        return model.create_padding_mask(
+            variable('ids', ids, tf.int64))
+    if block == 'attention':
+        shape = (batch_size, num_heads, seq_len, d_model // num_heads)
+        q, k, v = [variable(name, rng.randn(*shape)) for name in 'qkv']
+        mask = model.create_padding_mask(tf.constant(ids))
+        output, _ = model.attention(q, k, v, mask)
+        return output
+
+    x = variable('x', rng.randn(batch_size, seq_len, d_model))
+    if block == 'split_heads':
+        return model.split_heads(x, batch_size)
+    if block == 'multihead_attention':
+        mask = model.create_padding_mask(tf.constant(ids))
+        with tf.variable_scope('multihead_attention'):
+            output, _ = model.multihead_attention(x, x, x, mask)
+        return output
+    if block == 'ffn':
+        with tf.variable_scope('ffn'):
+            return model.pointwise_feed_forward_layer(x)
+    raise ValueError("Unknown block " + block)
+
+
+def benchmark_case(flags, block, batch_size, seq_len, d_model, num_heads):
+    '''Time one block in one configuration, returning a result dictionary'''
+    tf.reset_default_graph()
+    tf.set_random_seed(0)
+    rng = np.random.RandomState(0)
+    reset_peak_rss()
+    num_tokens = (batch_size or 1) * seq_len
+
+    backward_time = None
+    if block == 'positional_encoding':
+        # Computed in numpy and embedded as a constant while the graph is
+        # built, so building it is what is timed
+        forward_time = time_runs(lambda: positional_encoding(seq_len, d_model),
+                                 flags.warmup_runs, flags.num_runs)
+    else:
+        # Blocks that do not depend on d_model or num_heads still need a
+        # valid Model
+        model = Model(input_size=flags.vocab_size, label_size=flags.vocab_size,
+                      batch_size=batch_size, learning_rate=0.0,
+                      d_model=d_model or 64, num_heads=num_heads or 1,
+                      dff=flags.dff_multiplier * (d_model or 64),
+                      max_position=seq_len)
+        output = build_block(block, model, rng, batch_size, seq_len)
+        grads = None
+        if output.dtype.is_floating:
+            grads = [grad for grad in tf.gradients(tf.reduce_sum(output),
+                                                   tf.trainable_variables())
+                     if grad is not None]
+
+        config = tf.ConfigProto(
+            intra_op_parallelism_threads=flags.intra_op_threads,
+            inter_op_parallelism_threads=flags.inter_op_threads)
+        with tf.Session(config=config) as sess:
+            sess.run(tf.global_variables_initializer())
+            forward_time = time_runs(lambda: sess.run(output.op),
+                                     flags.warmup_runs, flags.num_runs)
+            if grads:
+                grad_ops = [grad.op for grad in grads]
+                backward_time = time_runs(lambda: sess.run(grad_ops),
+                                          flags.warmup_runs, flags.num_runs)
+
+    return {
+        'block': block,
+        'batch_size': batch_size,
+        'seq_len': seq_len,
+        'd_model': d_model,
+        'num_heads': num_heads,
+        'forward_ms': 1000 * forward_time,
+        'forward_backward_ms': 1000 * backward_time if backward_time else None,
+        'forward_tokens_per_second': num_tokens / forward_time,
+        'forward_backward_tokens_per_second':
+            num_tokens / backward_time if backward_time else None,
+        'peak_rss_mb': peak_rss_mb(),
+    }
+
+
+def cases(flags):
+    '''Every (block, batch_size, seq_len, d_model, num_heads) to run, with
+       the parameters a block does not depend on set to None'''
+    grid = list(itertools.product(flags.batch_sizes, flags.seq_lens,
+                                  flags.dim_models, flags.num_heads))
+    seen = set()
+    for block in flags.blocks:
+        for values in grid:
+            params = dict(zip(SWEEP, values))
+            if params['d_model'] % params['num_heads']:
+                continue
+            case = (block,) + tuple(params[name] if name in BLOCKS[block]
+                                    else None for name in SWEEP)
+            if case not in seen:
+                seen.add(case)
+                yield case
+
+
+def environment():
+    '''What the results were measured with'''
+    try:
+        commit = subprocess.check_output(['git', 'rev-parse', 'HEAD'],
+                                         cwd=REPO_ROOT,
+                                         stderr=subprocess.DEVNULL).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {'commit': commit,
+            'tensorflow': tf.__version__,
+            'numpy': np.__version__,
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'cpu_count': os.cpu_count()}
+
+
+def case_key(result):
+    return tuple(result[name] for name in ('block',) + SWEEP)
+
+
+def main(flags):
+    baseline = dict()
+    if flags.baseline_json:
+        with open(flags.baseline_json, 'r') as bf:
+            baseline = {case_key(result): result
+                        for result in json.load(bf)['results']}
+
+    def fmt(value):
+        return '-' if value is None else str(value)
+
+    print("{0:<20} {1:>5} {2:>5} {3:>6} {4:>5} {5:>10} {6:>10} {7:>12} {8:>9}".format(
+        'block', 'batch', 'seq', 'd_mod', 'heads', 'fwd ms', 'fwd+bwd ms',
+        'fwd tok/s', 'rss MiB'))
+    results = list()
+    for case in cases(flags):
+        result = benchmark_case(flags, *case)
+        results.append(result)
+
+        line = "{0:<20} {1:>5} {2:>5} {3:>6} {4:>5} {5:10.3f} {6:>10} {7:12.0f} {8:9.1f}".format(
+            result['block'], fmt(result['batch_size']), fmt(result['seq_len']),
+            fmt(result['d_model']), fmt(result['num_heads']),
+            result['forward_ms'],
+            '-' if result['forward_backward_ms'] is None
+            else '{0:.3f}'.format(result['forward_backward_ms']),
+            result['forward_tokens_per_second'], result['peak_rss_mb'])
+        previous = baseline.get(case_key(result))
+        if previous is not None:
+            line += "  fwd {0:+.1%}".format(
+                result['forward_ms'] / previous['forward_ms'] - 1)
+            if result['forward_backward_ms'] and previous['forward_backward_ms']:
+                line += ", fwd+bwd {0:+.1%}".format(
+                    result['forward_backward_ms'] /
+                    previous['forward_backward_ms'] - 1)
+        print(line)
+
+    if flags.output_json:
+        with open(flags.output_json, 'w') as of:
+            json.dump({'flags': vars(flags), 'environment': environment(),
+                       'results': results}, of, indent=2)
+
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser()
+
+    parser.add_argument('--blocks', nargs='+',
+                        choices=sorted(BLOCKS),
+                        default=sorted(BLOCKS),
+                        help="Blocks to benchmark")
+
+    parser.add_argument('--batch_sizes', type=int, nargs='+',
+                        default=[1, 32],
+                        help="Batch sizes to sweep")
+
+    parser.add_argument('--seq_lens', type=int, nargs='+',
+                        default=[32, 128],
+                        help="Sequence lengths to sweep")
+
+    parser.add_argument('--dim_models', type=int, nargs='+',
+                        default=[128, 512],
+                        help="Values of d_model to sweep")
+
+    parser.add_argument('--num_heads', type=int, nargs='+',
+                        default=[8],
+                        help="Numbers of attention heads to sweep")
+
+    parser.add_argument('--dff_multiplier', type=int,
+                        default=4,
+                        help="Inner layer size of the FFN as a multiple of d_model")
+
+    parser.add_argument('--vocab_size', type=int,
+                        default=8194,
+                        help="Size of the synthetic vocabulary")
+
+    parser.add_argument('--warmup_runs', type=int,
+                        default=5,
+                        help="Untimed runs before measuring")
+
+    parser.add_argument('--num_runs', type=int,
+                        default=20,
+                        help="Timed runs per case; the median is reported")
+
+    parser.add_argument('--intra_op_threads', type=int,
+                        default=0,
+                        help="Threads per op (0 lets TensorFlow decide)")
+
+    parser.add_argument('--inter_op_threads', type=int,
+                        default=0,
+                        help="Ops run in parallel (0 lets TensorFlow decide)")
+
+    parser.add_argument('--output_json', type=str,
+                        default=None,
+                        help="Where to save the results")
+
+    parser.add_argument('--baseline_json', type=str,
+                        default=None,
+                        help="Earlier results to compare against")
+
+    parsed_flags, _ = parser.parse_known_args()
+
+    main(parsed_flags)
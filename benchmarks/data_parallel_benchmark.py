@@ -0,0 +1,164 @@
+"""
+Scaling benchmark for data-parallel training (data_parallel.py). The same
+transformer is trained on synthetic token batches with 1, 2, 4 and 8
+workers on a single machine, and the training throughput and the scaling
+efficiency relative to one worker are reported:
+
+    python benchmarks/data_parallel_benchmark.py --output_json scaling.json
+
+Every worker processes --batch_size sentences per step, so the effective
+batch grows with the number of workers.
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+
+import numpy as np
+import tensorflow as tf
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import data_parallel
+from ann import Model
+
+
+def synthetic_dataset(flags, seed=0):
+    '''Endless batches of random (input, target) token ids'''
+    rng = np.random.RandomState(seed)
+    num_examples = flags.batch_size * 16
+    inp = rng.randint(1, flags.vocab_size,
+                      size=(num_examples, flags.seq_len)).astype(np.int64)
+    tar = rng.randint(1, flags.vocab_size,
+                      size=(num_examples, flags.seq_len + 1)).astype(np.int64)
+    dataset = tf.data.Dataset.from_tensor_slices((inp, tar))
+    return dataset.batch(flags.batch_size, drop_remainder=True).repeat()
+
+
+def time_workers(flags, num_workers):
+    '''Train with num_workers replicas, returning a result dictionary'''
+    tf.reset_default_graph()
+    use_gpus = flags.use_gpus
+    devices = data_parallel.worker_devices(num_workers, use_gpus)
+
+    model = Model(input_size=flags.vocab_size, label_size=flags.vocab_size,
+                  batch_size=flags.batch_size,
+                  learning_rate=flags.learning_rate,
+                  d_model=flags.dim_model, num_heads=flags.num_heads,
+                  num_layers=flags.num_layers, dff=flags.dff)
+
+    with tf.device('/cpu:0'):
+        iterators, init_op = data_parallel.worker_iterators(
+            [synthetic_dataset(flags, seed=index)
+             for index in range(num_workers)], devices)
+        global_step = tf.train.get_or_create_global_step()
+    train_op, loss = data_parallel.build_train_op(
+        model, iterators, devices, model.optimizer(flags.learning_rate),
+        global_step)
+
+    config = data_parallel.session_config(num_workers, use_gpus,
+                                          flags.num_cores)
+    with tf.Session(config=config) as sess:
+        sess.run([tf.global_variables_initializer(), init_op])
+        for _ in range(flags.warmup_steps):
+            sess.run(train_op)
+
+        start_time = time.perf_counter()
+        for _ in range(flags.num_steps):
+            _, step_loss = sess.run([train_op, loss])
+        elapsed = time.perf_counter() - start_time
+
+    sentences = flags.num_steps * flags.batch_size * num_workers
+    return {
+        'num_workers': num_workers,
+        'step_time': elapsed / flags.num_steps,
+        'sentences_per_second': sentences / elapsed,
+        'final_loss': float(step_loss),
+    }
+
+
+def main(flags):
+    results = list()
+    for num_workers in flags.num_workers:
+        result = time_workers(flags, num_workers)
+        result['speedup'] = (result['sentences_per_second'] /
+                             results[0]['sentences_per_second']
+                             if results else 1.0)
+        result['efficiency'] = result['speedup'] * flags.num_workers[0] / num_workers
+        results.append(result)
+        print("{0:2d} worker(s): {1:8.4f} s/step, {2:9.1f} sentences/s, "
+              "speedup {3:5.2f}x, efficiency {4:6.1%}".format(
+                  num_workers, result['step_time'],
+                  result['sentences_per_second'], result['speedup'],
+                  result['efficiency']))
+
+    if flags.output_json:
+        with open(flags.output_json, 'w') as of:
+            json.dump({'flags': vars(flags), 'results': results}, of, indent=2)
+
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser()
+
+    parser.add_argument('--num_workers', type=int, nargs='+',
+                        default=[1, 2, 4, 8],
+                        help="Worker counts to benchmark")
+
+    parser.add_argument('--use_gpus', action='store_true',
+                        default=False,
+                        help="Use one GPU per worker instead of CPU devices")
+
+    parser.add_argument('--num_cores', type=int,
+                        default=None,
+                        help="Cores split between the CPU workers (default: all)")
+
+    parser.add_argument('--batch_size', type=int,
+                        default=16,
+                        help="Sentences per step on each worker")
+
+    parser.add_argument('--seq_len', type=int,
+                        default=40,
+                        help="Tokens per synthetic sentence")
+
+    parser.add_argument('--vocab_size', type=int,
+                        default=8194,
+                        help="Size of the synthetic vocabularies")
+
+    parser.add_argument('--dim_model', type=int,
+                        default=128,
+                        help="Dimension of embeddings")
+
+    parser.add_argument('--num_layers', type=int,
+                        default=2,
+                        help="Number of transformer layers")
+
+    parser.add_argument('--dff', type=int,
+                        default=512,
+                        help="Dimensionality of the inner layer")
+
+    parser.add_argument('--num_heads', type=int,
+                        default=8,
+                        help="Number of parallel attention layers")
+
+    parser.add_argument('--learning_rate', type=float,
+                        default=1e-4,
+                        help="Learning rate")
+
+    parser.add_argument('--warmup_steps', type=int,
+                        default=5,
+                        help="Untimed steps before measuring")
+
+    parser.add_argument('--num_steps', type=int,
+                        default=20,
+                        help="Timed steps per worker count")
+
+    parser.add_argument('--output_json', type=str,
+                        default=None,
+                        help="Where to save the results")
+
+    parsed_flags, _ = parser.parse_known_args()
+
+    main(parsed_flags)
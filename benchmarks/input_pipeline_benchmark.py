@@ -0,0 +1,246 @@
+"""
+Throughput of the input pipelines without a model attached. Every
+pipeline is drained for up to --num_batches batches per epoch, and
+examples/sec, non padding tokens/sec and the fraction of padding in the
+batches are reported for every combination of num_parallel_calls,
+shuffle buffer size and caching:
+
+    python benchmarks/input_pipeline_benchmark.py --pipelines pt_to_en text_tfrecord
+
+Pipelines:
+    pt_to_en       DatasetGenerator_PtToEng's training pipeline (tf_encode
+                   py_function, length filter, cache, shuffle,
+                   padded_batch), fed translation_sources.SyntheticSource
+                   instead of the ted_hrlr_translate download
+    text_tfrecord  sharded TFRecords of make_text_example records, as
+                   written by Dataset/corpus_pipeline.py, parsed, shuffled
+                   and padded into batches of token ids
+    skipgram       text_DatasetGenerator.generate_batch, timed only when
+                   Dataset/dataset_generator.py can be imported
+
+Everything runs offline: the corpus, the tokenizers and the shards are
+generated under --work_dir. Caching only pays off from the second epoch
+on, so every epoch is reported separately.
+"""
+
+import argparse
+import itertools
+import json
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+import tensorflow as tf
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from Dataset.dataset_generator_porteng_translate import DatasetGenerator_PtToEng
+from Dataset.save_text_data import make_text_example
+from Dataset.translation_sources import SyntheticSource
+
+
+def drain(dataset, num_epochs, max_batches):
+    '''Pull batches for num_epochs epochs (of at most max_batches batches),
+       returning per epoch throughput and padding statistics'''
+    iterator = dataset.make_initializable_iterator()
+    next_batch = iterator.get_next()
+    epochs = list()
+    with tf.Session() as sess:
+        for epoch in range(num_epochs):
+            sess.run(iterator.initializer)
+            num_batches, num_examples, num_tokens, num_cells = 0, 0, 0, 0
+            start_time = time.perf_counter()
+            while not max_batches or num_batches < max_batches:
+                try:
+                    batch = sess.run(next_batch)
+                except tf.errors.OutOfRangeError:
+                    break
+                arrays = batch if isinstance(batch, tuple) else (batch,)
+                num_batches += 1
+                num_examples += len(arrays[0])
+                num_tokens += sum(np.count_nonzero(a) for a in arrays)
+                num_cells += sum(a.size for a in arrays)
+            elapsed = time.perf_counter() - start_time
+            epochs.append({
+                'epoch': epoch,
+                'num_batches': num_batches,
+                'seconds': elapsed,
+                'examples_per_second': num_examples / elapsed,
+                'tokens_per_second': num_tokens / elapsed,
+                'padding_ratio': 1 - num_tokens / max(num_cells, 1),
+            })
+    return epochs
+
+
+def pt_to_en_dataset(flags, source, num_parallel_calls, buffer_size, cache):
+    '''DatasetGenerator_PtToEng's training dataset over the synthetic pairs'''
+    data = DatasetGenerator_PtToEng(
+        target_vocab_size=flags.target_vocab_size, buffer_size=buffer_size,
+        batch_size=flags.batch_size, num_parallel_calls=num_parallel_calls,
+        vocab_file_prefix=os.path.join(flags.work_dir, 'vocab'),
+        source=source, cache=cache)
+    return data.train_dataset
+
+
+def write_text_shards(flags, pairs):
+    '''make_text_example shards of the English side, with token ids'''
+    rng = np.random.RandomState(0)
+    paths = [os.path.join(flags.work_dir, 'corpus-{0:05d}.tfrecord'.format(i))
+             for i in range(flags.num_shards)]
+    writers = [tf.python_io.TFRecordWriter(path) for path in paths]
+    for i, (_, en) in enumerate(pairs):
+        token_ids = rng.randint(1, flags.target_vocab_size,
+                                size=len(en.split()) + 2).tolist()
+        example = make_text_example('synthetic', str(i), en, token_ids)
+        writers[i % len(writers)].write(example.SerializeToString())
+    for writer in writers:
+        writer.close()
+    return paths
+
+
+def text_tfrecord_dataset(flags, paths, num_parallel_calls, buffer_size, cache):
+    '''Batches of token ids read from the TFRecord shards'''
+    def parse(record):
+        features = tf.parse_single_example(
+            record, {'token_ids': tf.VarLenFeature(tf.int64)})
+        return tf.sparse.to_dense(features['token_ids'])
+
+    dataset = tf.data.TFRecordDataset(paths, num_parallel_reads=num_parallel_calls)
+    dataset = dataset.map(parse, num_parallel_calls=num_parallel_calls)
+    if cache:
+        dataset = dataset.cache()
+    dataset = dataset.shuffle(buffer_size).padded_batch(flags.batch_size,
+                                                        padded_shapes=[-1])
+    return dataset.prefetch(tf.data.experimental.AUTOTUNE)
+
+
+def benchmark_skipgram(flags):
+    '''Time generate_batch on random word ids, or explain why it cannot be'''
+    try:
+        from Dataset.dataset_generator import text_DatasetGenerator
+    except SyntaxError as e:
+        return {'skipped': "Dataset/dataset_generator.py cannot be imported: "
+                           "{0} (line {1})".format(e.msg, e.lineno)}
+
+    rng = np.random.RandomState(0)
+    words = (rng.zipf(1.3, size=100000) % flags.target_vocab_size).tolist()
+    num_batches = flags.num_batches or 100
+    try:
+        start_time = time.perf_counter()
+        for _ in range(num_batches):
+            text_DatasetGenerator.generate_batch(None, words, flags.batch_size,
+                                                 num_skips=2, skip_window=1)
+        elapsed = time.perf_counter() - start_time
+    except Exception as e:
+        return {'skipped': "generate_batch failed: {0!r}".format(e)}
+    return {'examples_per_second': num_batches * flags.batch_size / elapsed}
+
+
+def main(flags):
+    if flags.work_dir is None:
+        flags.work_dir = tempfile.mkdtemp(prefix='pipeline_benchmark_')
+    os.makedirs(flags.work_dir, exist_ok=True)
+
+    source = SyntheticSource(num_train=flags.num_sentences, num_validation=1)
+    pairs = list(zip(*source.pairs('train')))
+    builders = {'pt_to_en': lambda *args: pt_to_en_dataset(flags, source, *args)}
+    if 'text_tfrecord' in flags.pipelines:
+        paths = write_text_shards(flags, pairs)
+        builders['text_tfrecord'] = lambda *args: text_tfrecord_dataset(
+            flags, paths, *args)
+
+    print("{0:<14} {1:>6} {2:>8} {3:>6} {4:>6} {5:>10} {6:>12} {7:>9}".format(
+        'pipeline', 'calls', 'buffer', 'cache', 'epoch', 'examples/s',
+        'tokens/s', 'padding'))
+    results = list()
+    for pipeline in flags.pipelines:
+        if pipeline == 'skipgram':
+            result = dict(pipeline=pipeline, **benchmark_skipgram(flags))
+            results.append(result)
+            print("{0:<14} {1}".format(pipeline, result.get(
+                'skipped', "{0:.1f} examples/s".format(
+                    result.get('examples_per_second', 0.0)))))
+            continue
+
+        for num_parallel_calls, buffer_size, cache in itertools.product(
+                flags.num_parallel_calls, flags.buffer_sizes, flags.cache):
+            tf.reset_default_graph()
+            dataset = builders[pipeline](num_parallel_calls, buffer_size,
+                                         cache == 'on')
+            epochs = drain(dataset, flags.num_epochs, flags.num_batches)
+            results.append({'pipeline': pipeline,
+                            'num_parallel_calls': num_parallel_calls,
+                            'buffer_size': buffer_size,
+                            'cache': cache == 'on',
+                            'epochs': epochs})
+            for epoch in epochs:
+                print("{0:<14} {1:>6} {2:>8} {3:>6} {4:>6} {5:10.1f} "
+                      "{6:12.1f} {7:8.1%}".format(
+                          pipeline, num_parallel_calls, buffer_size, cache,
+                          epoch['epoch'], epoch['examples_per_second'],
+                          epoch['tokens_per_second'], epoch['padding_ratio']))
+
+    if flags.output_json:
+        with open(flags.output_json, 'w') as of:
+            json.dump({'flags': vars(flags), 'results': results}, of, indent=2)
+
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser()
+
+    parser.add_argument('--pipelines', nargs='+',
+                        choices=['pt_to_en', 'text_tfrecord', 'skipgram'],
+                        default=['pt_to_en', 'text_tfrecord', 'skipgram'],
+                        help="Pipelines to benchmark")
+
+    parser.add_argument('--num_parallel_calls', type=int, nargs='+',
+                        default=[1, 4, tf.data.experimental.AUTOTUNE],
+                        help="Values of num_parallel_calls to sweep (-1 is AUTOTUNE)")
+
+    parser.add_argument('--buffer_sizes', type=int, nargs='+',
+                        default=[1000, 20000],
+                        help="Shuffle buffer sizes to sweep")
+
+    parser.add_argument('--cache', nargs='+',
+                        choices=['on', 'off'],
+                        default=['on', 'off'],
+                        help="Whether to cache the encoded examples")
+
+    parser.add_argument('--num_sentences', type=int,
+                        default=20000,
+                        help="Sentence pairs in the synthetic corpus")
+
+    parser.add_argument('--num_shards', type=int,
+                        default=8,
+                        help="TFRecord shards the synthetic corpus is written to")
+
+    parser.add_argument('--target_vocab_size', type=int,
+                        default=2**10,
+                        help="Target size of the subword vocabularies")
+
+    parser.add_argument('--batch_size', type=int,
+                        default=64,
+                        help="Examples per batch")
+
+    parser.add_argument('--num_batches', type=int,
+                        default=0,
+                        help="Batches drained per epoch (0 drains the whole epoch)")
+
+    parser.add_argument('--num_epochs', type=int,
+                        default=2,
+                        help="Epochs drained per configuration")
+
+    parser.add_argument('--work_dir', type=str,
+                        default=None,
+                        help="Where the vocabularies and shards are written (a temporary directory by default)")
+
+    parser.add_argument('--output_json', type=str,
+                        default=None,
+                        help="Where to save the results")
+
+    parsed_flags, _ = parser.parse_known_args()
+
+    main(parsed_flags)
@@ -0,0 +1,123 @@
+"""
+Load test for inference_server.py. A pool of concurrent clients sends
+translation requests to a running server for a fixed duration, and the
+client side p50/p99 latency and throughput are reported next to the
+server's own /metrics:
+
+    python inference_server.py --vocab_file_prefix vocab &
+    python benchmarks/load_test.py --concurrency 1 4 16 64
+
+Sentences are read one per line from --sentences_file, or taken from a
+small built-in set of Portuguese sentences.
+"""
+
+import argparse
+import json
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import requests
+
+
+DEFAULT_SENTENCES = [
+    'este é um problema que temos que resolver.',
+    'os meus vizinhos ouviram sobre esta ideia.',
+    'vou então muito rapidamente partilhar convosco algumas histórias '
+    'de algumas coisas mágicas que aconteceram.',
+    'este é o primeiro livro que eu fiz.',
+    'obrigado.',
+    'e qual é a diferença entre um satélite e um foguetão?',
+]
+
+
+def run_client(url, sentences, stop_time, client_id, latencies, errors):
+    '''Send requests back to back until stop_time'''
+    session = requests.Session()
+    i = client_id
+    while time.time() < stop_time:
+        start_time = time.perf_counter()
+        try:
+            response = session.post(url + '/translate',
+                                    json={'text': sentences[i % len(sentences)]},
+                                    timeout=60)
+            response.raise_for_status()
+            latencies.append(time.perf_counter() - start_time)
+        except requests.RequestException:
+            errors.append(i)
+        i += 1
+
+
+def load_test(flags, sentences, concurrency):
+    '''Drive the server with concurrency clients, returning a result dict'''
+    latencies, errors = list(), list()
+    stop_time = time.time() + flags.duration
+    start_time = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        for client_id in range(concurrency):
+            executor.submit(run_client, flags.url, sentences, stop_time,
+                            client_id, latencies, errors)
+    elapsed = time.perf_counter() - start_time
+
+    latencies_ms = np.array(latencies) * 1000
+    return {
+        'concurrency': concurrency,
+        'num_requests': len(latencies),
+        'num_errors': len(errors),
+        'requests_per_second': len(latencies) / elapsed,
+        'p50_latency_ms': float(np.percentile(latencies_ms, 50)) if len(latencies) else None,
+        'p99_latency_ms': float(np.percentile(latencies_ms, 99)) if len(latencies) else None,
+        'server_metrics': requests.get(flags.url + '/metrics').json(),
+    }
+
+
+def main(flags):
+    sentences = DEFAULT_SENTENCES
+    if flags.sentences_file:
+        with open(flags.sentences_file, 'r') as sf:
+            sentences = [line.strip() for line in sf if line.strip()]
+
+    results = list()
+    for concurrency in flags.concurrency:
+        result = load_test(flags, sentences, concurrency)
+        results.append(result)
+        server = result['server_metrics']
+        print("{0:4d} clients: {1:8.1f} req/s, p50 {2:8.1f} ms, p99 {3:8.1f} ms, "
+              "{4} errors (server mean batch size {5:.1f})".format(
+                  concurrency, result['requests_per_second'],
+                  result['p50_latency_ms'] or float('nan'),
+                  result['p99_latency_ms'] or float('nan'),
+                  result['num_errors'], server.get('mean_batch_size', 0.0)))
+
+    if flags.output_json:
+        with open(flags.output_json, 'w') as of:
+            json.dump({'flags': vars(flags), 'results': results}, of, indent=2)
+
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser()
+
+    parser.add_argument('--url', type=str,
+                        default='http://127.0.0.1:8500',
+                        help="Address of the inference server")
+
+    parser.add_argument('--concurrency', type=int, nargs='+',
+                        default=[1, 4, 16, 64],
+                        help="Numbers of concurrent clients to test")
+
+    parser.add_argument('--duration', type=float,
+                        default=10.0,
+                        help="Seconds to run each concurrency level")
+
+    parser.add_argument('--sentences_file', type=str,
+                        default=None,
+                        help="File with one sentence to translate per line")
+
+    parser.add_argument('--output_json', type=str,
+                        default=None,
+                        help="Where to save the results")
+
+    parsed_flags, _ = parser.parse_known_args()
+
+    main(parsed_flags)
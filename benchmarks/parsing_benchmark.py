@@ -0,0 +1,102 @@
+"""
+Parse time of the NSSDC query and object pages: BeautifulSoup's
+html.parser building the full tree, against lxml building only the tags
+SoupStrainer keeps (the scrapers' defaults). Pages are read from
+--page_dir, which --save_object_name fills with a fresh download first:
+
+    python benchmarks/parsing_benchmark.py --save_object_name sputnik
+    python benchmarks/parsing_benchmark.py --page_dir nssdc_pages
+"""
+
+import argparse
+import glob
+import os
+import sys
+import time
+
+import requests
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from Website_Scrapers.scraping_functions import (NSSDC_BASE_URL,
+        build_nssdc_query_package, parse_nssdc_object_page,
+        parse_nssdc_query_page)
+
+
+def save_nssdc_pages(obj_name, save_dir, max_objects=20):
+    '''Download an NSSDC query page and the object pages it links to into
+       save_dir, so parsing can be benchmarked offline'''
+    os.makedirs(save_dir, exist_ok=True)
+    with requests.Session() as session:
+        rp = session.post(NSSDC_BASE_URL + "/nmc/spacecraft/query",
+                          data=build_nssdc_query_package(obj_name))
+        with open(os.path.join(save_dir, 'query_0.html'), 'wb') as f:
+            f.write(rp.content)
+
+        search_info_dict = parse_nssdc_query_page(rp.content, obj_name)
+        for idx, obj_info in enumerate(list(search_info_dict.values())[:max_objects]):
+            rs = session.get(obj_info[0])
+            with open(os.path.join(save_dir,
+                                   'object_{}.html'.format(idx)), 'wb') as f:
+                f.write(rs.content)
+
+
+def time_parser(parse_function, pages, repeats, **kwargs):
+    '''Best-of-repeats time in seconds to parse every page once'''
+    best = float('inf')
+    for _ in range(repeats):
+        start_time = time.perf_counter()
+        for page in pages:
+            parse_function(page, **kwargs)
+        best = min(best, time.perf_counter() - start_time)
+    return best
+
+
+def main(flags):
+    if flags.save_object_name:
+        print("Saving NSSDC pages for {}...".format(flags.save_object_name))
+        save_nssdc_pages(flags.save_object_name, flags.page_dir)
+
+    query_pages = [open(f, 'rb').read() for f in
+                   sorted(glob.glob(os.path.join(flags.page_dir, 'query_*.html')))]
+    object_pages = [open(f, 'rb').read() for f in
+                    sorted(glob.glob(os.path.join(flags.page_dir, 'object_*.html')))]
+    print("Loaded {0} query pages and {1} object pages from {2}".format(
+        len(query_pages), len(object_pages), flags.page_dir))
+
+    benchmarks = [
+        ('query pages', lambda page, **kw: parse_nssdc_query_page(page, '', **kw),
+         query_pages),
+        ('object pages', parse_nssdc_object_page, object_pages),
+    ]
+    for name, parse_function, pages in benchmarks:
+        if not pages:
+            continue
+        baseline = time_parser(parse_function, pages, flags.repeats,
+                               parser='html.parser', parse_only=None)
+        optimized = time_parser(parse_function, pages, flags.repeats)
+        print("{0:>12}: html.parser full tree {1:8.2f} ms/page | "
+              "lxml + SoupStrainer {2:8.2f} ms/page | speedup {3:5.2f}x".format(
+                  name, 1000 * baseline / len(pages),
+                  1000 * optimized / len(pages), baseline / optimized))
+
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser()
+
+    parser.add_argument('--page_dir', type=str,
+                        default='nssdc_pages',
+                        help="Directory of saved query_*.html and object_*.html NSSDC pages")
+
+    parser.add_argument('--save_object_name', type=str,
+                        default=None,
+                        help="If set, first download NSSDC pages for this object name into page_dir")
+
+    parser.add_argument('--repeats', type=int,
+                        default=5,
+                        help="Number of timed passes over the pages; the fastest is reported")
+
+    parsed_flags, _ = parser.parse_known_args()
+
+    main(parsed_flags)
@@ -0,0 +1,167 @@
+"""
+Time of the validation PR curves: StreamingPRCurveEvaluator against a
+brute-force evaluation that re-runs the greedy matching, in python, for
+every IoU threshold, confidence threshold and image, as a generic
+detection analysis does. Both run on the same random detections, with the
+thresholds of TensorboardValidationCallback, and their counts are checked
+to agree:
+
+    python benchmarks/pr_curve_benchmark.py --num_images 100
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from callbacks.StreamingPRCurveEvaluator import StreamingPRCurveEvaluator
+
+
+def validation_thresholds():
+    '''The IoU and confidence thresholds of TensorboardValidationCallback'''
+    iou_thresholds = np.linspace(0.5, 0.9, 3)
+    confidence_thresholds = 1 / (1 + np.exp(-np.linspace(-100, 100, 100)))
+    confidence_thresholds = np.concatenate([[0.0], confidence_thresholds, [1.0]])
+    return iou_thresholds, confidence_thresholds
+
+
+def random_boxes(rng, num_boxes):
+    '''[ymin, xmin, ymax, xmax] boxes inside the unit square'''
+    corners = rng.uniform(0.0, 0.8, size=(num_boxes, 2))
+    sizes = rng.uniform(0.05, 0.2, size=(num_boxes, 2))
+    return np.concatenate([corners, corners + sizes], axis=1)
+
+
+def random_detections(rng, num_images, num_predictions, num_ground_truth):
+    '''Per image predicted boxes, scores and ground truth boxes. Half of the
+       predictions are jittered copies of ground truth boxes, so every IoU
+       threshold sees matches'''
+    pred_boxes, pred_scores, gt_boxes = list(), list(), list()
+    for _ in range(num_images):
+        gt = random_boxes(rng, rng.randint(0, num_ground_truth + 1))
+        boxes = random_boxes(rng, num_predictions)
+        if len(gt):
+            near = rng.rand(num_predictions) < 0.5
+            boxes[near] = (gt[rng.randint(len(gt), size=near.sum())] +
+                           rng.normal(0.0, 0.01, size=(near.sum(), 4)))
+        pred_boxes.append(boxes)
+        pred_scores.append(rng.rand(num_predictions))
+        gt_boxes.append(gt)
+    return pred_boxes, pred_scores, gt_boxes
+
+
+def box_iou(box_a, box_b):
+    '''Intersection over union of two [ymin, xmin, ymax, xmax] boxes'''
+    inter_h = max(0.0, min(box_a[2], box_b[2]) - max(box_a[0], box_b[0]))
+    inter_w = max(0.0, min(box_a[3], box_b[3]) - max(box_a[1], box_b[1]))
+    intersection = inter_h * inter_w
+    union = ((box_a[2] - box_a[0]) * (box_a[3] - box_a[1]) +
+             (box_b[2] - box_b[0]) * (box_b[3] - box_b[1]) - intersection)
+    return intersection / union if union > 0 else 0.0
+
+
+def brute_force_counts(pred_boxes, pred_scores, gt_boxes, iou_thresholds,
+                       confidence_thresholds):
+    '''True and false positive counts, (num_iou, num_confidence) arrays,
+       from a separate greedy matching for every threshold pair and image:
+       the predictions at or above the confidence threshold are matched in
+       order of decreasing confidence to the unmatched ground truth box of
+       highest IoU, if it reaches the IoU threshold'''
+    shape = (len(iou_thresholds), len(confidence_thresholds))
+    true_positives = np.zeros(shape, dtype=np.int64)
+    false_positives = np.zeros(shape, dtype=np.int64)
+    for i, iou_threshold in enumerate(iou_thresholds):
+        for j, confidence_threshold in enumerate(confidence_thresholds):
+            for boxes, scores, gt in zip(pred_boxes, pred_scores, gt_boxes):
+                order = sorted((p for p in range(len(boxes))
+                                if scores[p] >= confidence_threshold),
+                               key=lambda p: -scores[p])
+                matched = [False] * len(gt)
+                for p in order:
+                    best, best_iou = None, -1.0
+                    for g in range(len(gt)):
+                        iou = box_iou(boxes[p], gt[g])
+                        if not matched[g] and iou > best_iou:
+                            best, best_iou = g, iou
+                    if best is not None and best_iou >= iou_threshold:
+                        matched[best] = True
+                        true_positives[i, j] += 1
+                    else:
+                        false_positives[i, j] += 1
+    return true_positives, false_positives
+
+
+def main(flags):
+    rng = np.random.RandomState(flags.seed)
+    detections = random_detections(rng, flags.num_images,
+                                   flags.num_predictions,
+                                   flags.num_ground_truth)
+    iou_thresholds, confidence_thresholds = validation_thresholds()
+
+    start_time = time.perf_counter()
+    evaluator = StreamingPRCurveEvaluator(iou_thresholds, confidence_thresholds)
+    for start in range(0, flags.num_images, flags.batch_size):
+        evaluator.add_batch(*[d[start:start + flags.batch_size]
+                              for d in detections])
+    streaming_time = time.perf_counter() - start_time
+
+    start_time = time.perf_counter()
+    true_positives, false_positives = brute_force_counts(
+        *detections, iou_thresholds, confidence_thresholds)
+    brute_force_time = time.perf_counter() - start_time
+
+    agree = (np.array_equal(true_positives, evaluator.true_positives) and
+             np.array_equal(false_positives, evaluator.false_positives))
+    print("{0} images, {1} predictions and up to {2} ground truth boxes each, "
+          "{3} x {4} thresholds".format(
+              flags.num_images, flags.num_predictions, flags.num_ground_truth,
+              len(iou_thresholds), len(confidence_thresholds)))
+    print("brute force: {0:8.3f} s | streaming: {1:8.3f} s | speedup {2:6.1f}x"
+          " | counts agree: {3}".format(brute_force_time, streaming_time,
+                                       brute_force_time / streaming_time,
+                                       agree))
+
+    if flags.output_json:
+        with open(flags.output_json, 'w') as of:
+            json.dump({'flags': vars(flags),
+                       'brute_force_seconds': brute_force_time,
+                       'streaming_seconds': streaming_time,
+                       'counts_agree': agree}, of, indent=2)
+
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser()
+
+    parser.add_argument('--num_images', type=int,
+                        default=100,
+                        help="Validation images")
+
+    parser.add_argument('--num_predictions', type=int,
+                        default=50,
+                        help="Predicted boxes per image")
+
+    parser.add_argument('--num_ground_truth', type=int,
+                        default=10,
+                        help="Largest number of ground truth boxes per image")
+
+    parser.add_argument('--batch_size', type=int,
+                        default=16,
+                        help="Images per add_batch call")
+
+    parser.add_argument('--seed', type=int,
+                        default=0,
+                        help="Seed of the random detections")
+
+    parser.add_argument('--output_json', type=str,
+                        default=None,
+                        help="Where to save the results")
+
+    parsed_flags, _ = parser.parse_known_args()
+
+    main(parsed_flags)
@@ -0,0 +1,149 @@
+"""
+Memory/time trade-off of recomputing layer activations on the backward
+pass (Model(recompute_layers=True)). One training step of the same model
+is run with and without recomputation on synthetic batches, and the peak
+memory of every allocator (from a traced step's RunMetadata) is reported
+along with the median step time:
+
+    python benchmarks/recompute_benchmark.py --seq_len 128 --num_layers 6
+"""
+
+import argparse
+import json
+import os
+import statistics
+import sys
+import time
+
+import numpy as np
+import tensorflow as tf
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from ann import Model
+
+
+def peak_memory(run_metadata):
+    '''Peak bytes in use per allocator during a traced step'''
+    peaks = dict()
+    for device_stats in run_metadata.step_stats.dev_stats:
+        for node_stats in device_stats.node_stats:
+            for memory in node_stats.memory:
+                peaks[memory.allocator_name] = max(
+                    peaks.get(memory.allocator_name, 0), memory.peak_bytes)
+    return peaks
+
+
+def time_training_step(flags, recompute_layers):
+    '''Train on one synthetic batch, returning a result dictionary'''
+    tf.reset_default_graph()
+    tf.set_random_seed(0)
+
+    rng = np.random.RandomState(0)
+    inp = tf.constant(rng.randint(1, flags.vocab_size,
+                                  size=(flags.batch_size, flags.seq_len)))
+    tar = tf.constant(rng.randint(1, flags.vocab_size,
+                                  size=(flags.batch_size, flags.seq_len + 1)))
+
+    model = Model(input_size=flags.vocab_size, label_size=flags.vocab_size,
+                  batch_size=flags.batch_size, learning_rate=1e-4,
+                  d_model=flags.dim_model, num_heads=flags.num_heads,
+                  num_layers=flags.num_layers, dff=flags.dff,
+                  recompute_layers=recompute_layers)
+    logits, _ = model.transformer(inp, tar[:, :-1], training=True)
+    loss, _ = model.loss_function(tar[:, 1:], logits)
+    train_op = model.optimizer(1e-4).minimize(loss)
+
+    with tf.Session() as sess:
+        sess.run(tf.global_variables_initializer())
+        for _ in range(flags.warmup_steps):
+            sess.run(train_op)
+
+        step_times = list()
+        for _ in range(flags.num_steps):
+            start_time = time.perf_counter()
+            sess.run(train_op)
+            step_times.append(time.perf_counter() - start_time)
+
+        run_metadata = tf.RunMetadata()
+        sess.run(train_op,
+                 options=tf.RunOptions(trace_level=tf.RunOptions.FULL_TRACE),
+                 run_metadata=run_metadata)
+
+    return {
+        'recompute_layers': recompute_layers,
+        'step_time': statistics.median(step_times),
+        'peak_bytes': peak_memory(run_metadata),
+    }
+
+
+def main(flags):
+    baseline = time_training_step(flags, recompute_layers=False)
+    recompute = time_training_step(flags, recompute_layers=True)
+
+    print("{0:>32} {1:>14} {2:>14} {3:>10}".format(
+        'peak memory (MiB)', 'stored', 'recomputed', 'saved'))
+    for allocator in sorted(baseline['peak_bytes']):
+        before = baseline['peak_bytes'][allocator] / 2**20
+        after = recompute['peak_bytes'].get(allocator, 0) / 2**20
+        print("{0:>32} {1:14.1f} {2:14.1f} {3:9.1%}".format(
+            allocator, before, after, 1 - after / before if before else 0.0))
+
+    overhead = recompute['step_time'] / baseline['step_time'] - 1
+    print("{0:>32} {1:14.4f} {2:14.4f} {3:+9.1%}".format(
+        'step time (s)', baseline['step_time'], recompute['step_time'],
+        overhead))
+
+    if flags.output_json:
+        with open(flags.output_json, 'w') as of:
+            json.dump({'flags': vars(flags),
+                       'results': [baseline, recompute]}, of, indent=2)
+
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser()
+
+    parser.add_argument('--batch_size', type=int,
+                        default=32,
+                        help="Sentences per batch")
+
+    parser.add_argument('--seq_len', type=int,
+                        default=128,
+                        help="Tokens per synthetic sentence")
+
+    parser.add_argument('--vocab_size', type=int,
+                        default=8194,
+                        help="Size of the synthetic vocabularies")
+
+    parser.add_argument('--dim_model', type=int,
+                        default=512,
+                        help="Dimension of embeddings")
+
+    parser.add_argument('--num_layers', type=int,
+                        default=6,
+                        help="Number of transformer layers")
+
+    parser.add_argument('--dff', type=int,
+                        default=2048,
+                        help="Dimensionality of the inner layer")
+
+    parser.add_argument('--num_heads', type=int,
+                        default=8,
+                        help="Number of parallel attention layers")
+
+    parser.add_argument('--warmup_steps', type=int,
+                        default=2,
+                        help="Untimed steps before measuring")
+
+    parser.add_argument('--num_steps', type=int,
+                        default=10,
+                        help="Timed steps per configuration")
+
+    parser.add_argument('--output_json', type=str,
+                        default=None,
+                        help="Where to save the results")
+
+    parsed_flags, _ = parser.parse_known_args()
+
+    main(parsed_flags)
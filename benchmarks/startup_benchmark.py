@@ -0,0 +1,123 @@
+"""
+Startup benchmark for the repository entry points. Every entry point is run
+in a fresh interpreter under `python -X importtime`, and the wall clock time
+until it exits (i.e. until its first useful piece of work is done, such as
+printing --help) is reported along with the slowest top level imports.
+
+Results can be saved as json and compared against an earlier run:
+
+    python benchmarks/startup_benchmark.py --output_json startup.json
+    python benchmarks/startup_benchmark.py --baseline_json startup.json
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# name -> interpreter arguments, run from the repository root
+ENTRY_POINTS = {
+    'test.py --help': ['test.py', '--help'],
+    'import ann': ['-c', 'import ann'],
+    'import TensorboardValidationCallback':
+        ['-c', 'import callbacks.TensorboardValidationCallback'],
+    'ann.py': ['ann.py'],
+}
+
+
+def parse_importtime(stderr):
+    '''Return {top level module: cumulative import time in seconds} from
+       the -X importtime report in stderr'''
+    imports = dict()
+    for line in stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative, name = line[len('import time:'):].split('|')
+        # Nested imports are indented below their parent
+        if name.startswith('  ') or not name.strip():
+            continue
+        imports[name.strip()] = int(cumulative) / 1e6
+    return imports
+
+
+def time_entry_point(args, repeats):
+    '''Run an entry point repeats times, returning a result dictionary'''
+    wall_times = list()
+    imports = dict()
+    returncode = 0
+    for _ in range(repeats):
+        start_time = time.perf_counter()
+        result = subprocess.run([sys.executable, '-X', 'importtime'] + args,
+                                cwd=REPO_ROOT, stdout=subprocess.DEVNULL,
+                                stderr=subprocess.PIPE,
+                                universal_newlines=True)
+        wall_times.append(time.perf_counter() - start_time)
+        imports = parse_importtime(result.stderr)
+        returncode = result.returncode
+
+    return {
+        'wall_time': statistics.median(wall_times),
+        'import_time': sum(imports.values()),
+        'slowest_imports': sorted(imports.items(), key=lambda kv: -kv[1])[:5],
+        'returncode': returncode,
+    }
+
+
+def main(flags):
+    names = flags.entry_points or list(ENTRY_POINTS.keys())
+    baseline = dict()
+    if flags.baseline_json:
+        with open(flags.baseline_json, 'r') as bf:
+            baseline = json.load(bf)
+
+    results = dict()
+    for name in names:
+        results[name] = time_entry_point(ENTRY_POINTS[name], flags.repeats)
+        result = results[name]
+
+        line = "{0:>40}: {1:7.3f} s to first useful work, {2:7.3f} s importing".format(
+            name, result['wall_time'], result['import_time'])
+        if name in baseline:
+            line += " ({:+.3f} s vs baseline)".format(
+                result['wall_time'] - baseline[name]['wall_time'])
+        if result['returncode'] != 0:
+            line += " [exit code {}]".format(result['returncode'])
+        print(line)
+        for module, seconds in result['slowest_imports']:
+            print("{0:>40}  {1:7.3f} s  {2}".format('', seconds, module))
+
+    if flags.output_json:
+        with open(flags.output_json, 'w') as of:
+            json.dump(results, of, indent=2)
+
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser()
+
+    parser.add_argument('--entry_points', nargs='*',
+                        choices=sorted(ENTRY_POINTS.keys()),
+                        default=None,
+                        help="Entry points to time (default: all)")
+
+    parser.add_argument('--repeats', type=int,
+                        default=5,
+                        help="Number of runs per entry point; the median is reported")
+
+    parser.add_argument('--output_json', type=str,
+                        default=None,
+                        help="Where to save the results")
+
+    parser.add_argument('--baseline_json', type=str,
+                        default=None,
+                        help="Earlier results to compare against")
+
+    parsed_flags, _ = parser.parse_known_args()
+
+    main(parsed_flags)
@@ -0,0 +1,131 @@
+import tensorflow as tf
+
+import glob
+import json
+import os
+import threading
+import time
+
+
+class AsyncCheckpointCallback(object):
+    '''Periodically checkpoints the model variables without stalling the
+       training loop. Every save first copies the variables into a set of
+       snapshot variables on the host (a single cheap session run), and the
+       slow write to disk then happens in a background thread while
+       training carries on with the live variables.
+
+       The snapshot saver maps the snapshots back onto the original
+       variable names, so the checkpoints restore directly into the
+       training graph. Training loop state that is not held in variables
+       (e.g. the epoch and the early stopping counters) can be passed to
+       save and is written next to the checkpoint as a json file.
+
+       Parameters:
+           checkpoint_dir (str): directory the checkpoints are written to
+           save_every_n_steps (int): steps between periodic checkpoints
+           max_to_keep (int): number of periodic checkpoints to keep
+           var_list (list): variables to save, all global variables
+                            (including optimizer slots and the global
+                            step) by default
+    '''
+
+    def __init__(self, checkpoint_dir, save_every_n_steps=1000,
+                 max_to_keep=5, var_list=None):
+        self.checkpoint_dir = checkpoint_dir
+        self.checkpoint_prefix = os.path.join(checkpoint_dir, 'model.ckpt')
+        self.best_checkpoint_prefix = os.path.join(checkpoint_dir, 'best',
+                                                   'model.ckpt')
+        self.save_every_n_steps = save_every_n_steps
+        tf.gfile.MakeDirs(os.path.join(checkpoint_dir, 'best'))
+
+        if var_list is None:
+            var_list = tf.global_variables()
+        self.var_list = var_list
+
+        # Host copies of every variable, kept out of GLOBAL_VARIABLES so
+        # they are neither saved by other savers nor trained
+        snapshots = dict()
+        assign_ops = list()
+        with tf.device('/cpu:0'), tf.variable_scope('checkpoint_snapshot'):
+            for var in var_list:
+                name = var.op.name
+                snapshot = tf.get_variable(
+                    name, shape=var.shape, dtype=var.dtype.base_dtype,
+                    trainable=False,
+                    collections=[tf.GraphKeys.LOCAL_VARIABLES])
+                snapshots[name] = snapshot
+                assign_ops.append(tf.assign(snapshot, var))
+        self.snapshot_op = tf.group(*assign_ops)
+
+        self.snapshot_saver = tf.train.Saver(snapshots, max_to_keep=max_to_keep)
+        self.best_saver = tf.train.Saver(snapshots, max_to_keep=1)
+        self.restore_saver = tf.train.Saver(var_list)
+
+        self._thread = None
+        self.save_time = 0.0
+
+    def on_step_end(self, sess, step, state=None):
+        '''Save a periodic checkpoint every save_every_n_steps steps'''
+        if self.save_every_n_steps and step % self.save_every_n_steps == 0:
+            self.save(sess, step, state=state)
+
+    def save(self, sess, step, best=False, state=None):
+        '''Snapshot the variables and write them in the background. If
+           best, the snapshot is written as the best model instead. state
+           is an optional json serializable dict saved with the checkpoint
+        '''
+        # Only one write may use the snapshot at a time
+        self.join()
+        start_time = time.time()
+        sess.run(self.snapshot_op)
+        self.save_time += time.time() - start_time
+
+        saver = self.best_saver if best else self.snapshot_saver
+        prefix = self.best_checkpoint_prefix if best else self.checkpoint_prefix
+        self._thread = threading.Thread(
+            target=self._write, args=(saver, sess, prefix, step, state))
+        self._thread.start()
+
+    @staticmethod
+    def _write(saver, sess, prefix, step, state):
+        checkpoint_path = saver.save(sess, prefix, global_step=step,
+                                     write_meta_graph=False)
+        if state is None:
+            return
+        state_path = checkpoint_path + '.state.json'
+        with open(state_path + '.tmp', 'w') as sf:
+            json.dump(state, sf)
+        os.replace(state_path + '.tmp', state_path)
+
+        # Drop the states of checkpoints the saver has already deleted
+        for path in glob.glob(prefix + '-*.state.json'):
+            if path[:-len('.state.json')] not in saver.last_checkpoints:
+                os.remove(path)
+
+    def join(self):
+        '''Wait for the checkpoint being written, if any'''
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def restore(self, sess, best=False):
+        '''Restore the latest (or best) checkpoint into the live variables.
+           Returns the restored checkpoint path, or None if there is none
+        '''
+        checkpoint_dir = os.path.dirname(self.best_checkpoint_prefix) if best \
+            else self.checkpoint_dir
+        checkpoint_path = tf.train.latest_checkpoint(checkpoint_dir)
+        if checkpoint_path is not None:
+            self.restore_saver.restore(sess, checkpoint_path)
+        return checkpoint_path
+
+    @staticmethod
+    def load_state(checkpoint_path):
+        '''State saved with the checkpoint at checkpoint_path, or None if
+           it was saved without one
+        '''
+        state_path = checkpoint_path + '.state.json'
+        if not os.path.exists(state_path):
+            return None
+        with open(state_path, 'r') as sf:
+            return json.load(sf)
@@ -0,0 +1,49 @@
+import numpy as np
+
+
+class EarlyStoppingCallback(object):
+    '''Stops training once the validation loss has not improved for
+       patience epochs.
+
+       Parameters:
+           patience (int): epochs without improvement before stopping
+           min_delta (float): smallest decrease in loss that counts as an
+                              improvement
+    '''
+
+    def __init__(self, patience=10, min_delta=0.0):
+        self.patience = patience
+        self.min_delta = min_delta
+        self.best_loss = np.inf
+        self.best_epoch = None
+        self.wait = 0
+        self.stop_training = False
+
+    def on_epoch_end(self, epoch, val_loss):
+        '''Record the validation loss of an epoch. Returns True if this
+           epoch is the best one so far
+        '''
+        if val_loss < self.best_loss - self.min_delta:
+            self.best_loss = val_loss
+            self.best_epoch = epoch
+            self.wait = 0
+            return True
+
+        self.wait += 1
+        if self.wait >= self.patience:
+            self.stop_training = True
+        return False
+
+    def get_state(self):
+        '''Json serializable state, to be saved with a checkpoint'''
+        return {'best_loss': float(self.best_loss),
+                'best_epoch': self.best_epoch,
+                'wait': self.wait,
+                'stop_training': self.stop_training}
+
+    def set_state(self, state):
+        '''Resume from a state returned by get_state'''
+        self.best_loss = state['best_loss']
+        self.best_epoch = state['best_epoch']
+        self.wait = state['wait']
+        self.stop_training = state['stop_training']
@@ -0,0 +1,200 @@
+import tensorflow as tf
+from tensorflow.python.client import timeline
+
+import collections
+import os
+import time
+
+import numpy as np
+
+
+# Stages a training step is broken down into, matched against the
+# variable scopes of ann.Model in this order
+SCOPE_STAGES = (('Adam', 'optimizer'),
+                ('masked_multihead_attention', 'attention'),
+                ('multihead_attention', 'attention'),
+                ('ffn', 'ffn'),
+                ('layer_norm', 'layer_norm'),
+                ('embedding', 'embedding'),
+                ('final_layer', 'output_layer'))
+
+
+def op_type(node_stats):
+    '''Op type of a traced node, from its "name = Type(inputs)" label'''
+    label = node_stats.timeline_label
+    if ' = ' in label:
+        return label.split(' = ', 1)[1].split('(', 1)[0]
+    return node_stats.node_name.split(':')[0].split('/')[-1]
+
+
+def scope_of(node_name, depth):
+    '''Variable scope of a node, truncated to depth levels, with the tower
+       and gradient name scopes removed
+
+       :return: the scope and whether the node belongs to the backward pass
+    '''
+    parts = node_name.split(':')[0].split('/')
+    backward = 'gradients' in parts
+    if backward:
+        parts = parts[len(parts) - parts[::-1].index('gradients'):]
+    parts = [part for part in parts if not part.startswith('tower_')]
+    return '/'.join(parts[:-1][:depth]) or parts[-1], backward
+
+
+def stage_of(scope, op):
+    '''Coarse stage of a node: input, attention, ffn, layer_norm,
+       embedding, output_layer, optimizer, summaries or other'''
+    if op.startswith('IteratorGetNext'):
+        return 'input'
+    if 'Summary' in op:
+        return 'summaries'
+    if op.startswith(('Apply', 'ResourceApply')):
+        return 'optimizer'
+    for part in scope.split('/'):
+        for prefix, stage in SCOPE_STAGES:
+            if part.startswith(prefix) or part.endswith(prefix):
+                return stage
+    return 'other'
+
+
+class StepProfilerCallback(object):
+    '''Times every training step run through it, and traces sampled steps
+       with a full RunMetadata trace. Traced op times are aggregated by
+       variable scope (e.g. transformer/encoder/encoding_layer0/
+       multihead_attention) and by stage, split into the forward and
+       backward pass, and each trace is written as a Chrome trace
+       (chrome://tracing) to profile_dir.
+
+       Input wait is the time the step spends in IteratorGetNext, i.e.
+       waiting for the input pipeline (tf_encode's py_function runs in the
+       pipeline's own threads, so it only shows up as this wait). Op times
+       of ops running in parallel overlap, so their sum can exceed the wall
+       time of the step.
+
+       Parameters:
+           profile_dir (str): where the Chrome traces and the table go
+           profile_every_n_steps (int): steps between traced steps; 0 only
+                                        times the steps
+           skip_first_n_steps (int): warmup steps that are never traced
+           scope_depth (int): variable scope levels kept when aggregating
+           max_rows (int): number of scopes and op types in the table
+    '''
+
+    def __init__(self, profile_dir, profile_every_n_steps=100,
+                 skip_first_n_steps=10, scope_depth=4, max_rows=20):
+        self.profile_dir = profile_dir
+        self.profile_every_n_steps = profile_every_n_steps
+        self.skip_first_n_steps = skip_first_n_steps
+        self.scope_depth = scope_depth
+        self.max_rows = max_rows
+        if profile_every_n_steps:
+            tf.gfile.MakeDirs(profile_dir)
+
+        self.num_steps = 0
+        self.step_times = list()
+        self.traced_step_times = list()
+        self.input_wait_times = list()
+        # Seconds of op time, [forward, backward]
+        self.scope_times = collections.defaultdict(lambda: np.zeros(2))
+        self.stage_times = collections.defaultdict(lambda: np.zeros(2))
+        self.op_type_times = collections.Counter()
+
+    def run(self, sess, fetches, feed_dict=None):
+        '''sess.run(fetches, feed_dict), traced if this step is sampled'''
+        self.num_steps += 1
+        steps_after_warmup = self.num_steps - self.skip_first_n_steps
+        traced = (self.profile_every_n_steps > 0 and steps_after_warmup > 0 and
+                  (steps_after_warmup - 1) % self.profile_every_n_steps == 0)
+
+        start_time = time.perf_counter()
+        if traced:
+            run_metadata = tf.RunMetadata()
+            results = sess.run(fetches, feed_dict,
+                               options=tf.RunOptions(
+                                   trace_level=tf.RunOptions.FULL_TRACE),
+                               run_metadata=run_metadata)
+            # Tracing slows the step down, so it is kept out of step_times
+            self.add_trace(run_metadata.step_stats,
+                           time.perf_counter() - start_time)
+        else:
+            results = sess.run(fetches, feed_dict)
+            self.step_times.append(time.perf_counter() - start_time)
+        return results
+
+    def add_trace(self, step_stats, wall_time):
+        '''Aggregate the StepStats of one traced step and write its Chrome
+           trace'''
+        devices = [device_stats.device for device_stats in step_stats.dev_stats]
+        input_wait = 0.0
+        for device_stats in step_stats.dev_stats:
+            device = device_stats.device
+            # GPU kernels are counted once, from stream:all, rather than
+            # again per stream and from the host side launches
+            if '/stream:' in device and not device.endswith('/stream:all'):
+                continue
+            if device + '/stream:all' in devices or 'memcpy' in device:
+                continue
+            for node_stats in device_stats.node_stats:
+                duration = node_stats.all_end_rel_micros / 1e6
+                op = op_type(node_stats)
+                scope, backward = scope_of(node_stats.node_name,
+                                           self.scope_depth)
+                stage = stage_of(scope, op)
+                self.scope_times[scope][int(backward)] += duration
+                self.stage_times[stage][int(backward)] += duration
+                self.op_type_times[op] += duration
+                # Every tower waits for its own batch, in parallel
+                if stage == 'input':
+                    input_wait = max(input_wait, duration)
+
+        self.traced_step_times.append(wall_time)
+        self.input_wait_times.append(input_wait)
+
+        trace = timeline.Timeline(step_stats).generate_chrome_trace_format()
+        trace_path = os.path.join(self.profile_dir,
+                                  'timeline_step_{0}.json'.format(self.num_steps))
+        with tf.gfile.GFile(trace_path, 'w') as tf_file:
+            tf_file.write(trace)
+
+    def report(self):
+        '''Table of the step times and of the traced op times per step'''
+        lines = ["Steps: {0} timed, mean {1:.1f} ms; {2} traced".format(
+            len(self.step_times), 1000 * np.mean(self.step_times or [0.0]),
+            len(self.traced_step_times))]
+        num_traced = len(self.traced_step_times)
+        if not num_traced:
+            return '\n'.join(lines)
+
+        wall = 1000 * np.mean(self.traced_step_times)
+        wait = 1000 * np.mean(self.input_wait_times)
+        lines.append("Traced step {0:.1f} ms: input wait {1:.1f} ms ({2:.0f}%), "
+                     "compute {3:.1f} ms".format(wall, wait, 100 * wait / wall,
+                                                  wall - wait))
+
+        total = sum(times.sum() for times in self.stage_times.values())
+        row = "{0:<60} {1:>10} {2:>10} {3:>7}"
+        for title, times in (('stage', self.stage_times),
+                             ('scope', self.scope_times)):
+            lines.append('')
+            lines.append(row.format(title, 'fwd ms', 'bwd ms', '%'))
+            ranked = sorted(times.items(), key=lambda kv: -kv[1].sum())
+            for name, (forward, backward) in ranked[:self.max_rows]:
+                lines.append("{0:<60} {1:10.2f} {2:10.2f} {3:6.1f}%".format(
+                    name, 1000 * forward / num_traced,
+                    1000 * backward / num_traced,
+                    100 * (forward + backward) / total))
+
+        lines.append('')
+        lines.append("{0:<60} {1:>10} {2:>7}".format('op type', 'ms', '%'))
+        for op, seconds in self.op_type_times.most_common(self.max_rows):
+            lines.append("{0:<60} {1:10.2f} {2:6.1f}%".format(
+                op, 1000 * seconds / num_traced, 100 * seconds / total))
+        return '\n'.join(lines)
+
+    def on_epoch_end(self, epoch):
+        '''Print the table and save it next to the traces'''
+        table = self.report()
+        print(table)
+        with tf.gfile.GFile(os.path.join(self.profile_dir, 'profile.txt'),
+                            'w') as tf_file:
+            tf_file.write("Epoch {0}\n{1}\n".format(epoch, table))
@@ -0,0 +1,122 @@
+import numpy as np
+
+
+def iou_matrix(boxes_a, boxes_b):
+    """
+    Pairwise intersection over union of two sets of [ymin, xmin, ymax, xmax]
+    boxes.
+
+    :return: array of shape (len(boxes_a), len(boxes_b))
+    """
+    boxes_a = boxes_a[:, np.newaxis, :]
+    boxes_b = boxes_b[np.newaxis, :, :]
+    inter_h = np.clip(np.minimum(boxes_a[..., 2], boxes_b[..., 2]) -
+                      np.maximum(boxes_a[..., 0], boxes_b[..., 0]), 0, None)
+    inter_w = np.clip(np.minimum(boxes_a[..., 3], boxes_b[..., 3]) -
+                      np.maximum(boxes_a[..., 1], boxes_b[..., 1]), 0, None)
+    intersection = inter_h * inter_w
+    area_a = (boxes_a[..., 2] - boxes_a[..., 0]) * (boxes_a[..., 3] - boxes_a[..., 1])
+    area_b = (boxes_b[..., 2] - boxes_b[..., 0]) * (boxes_b[..., 3] - boxes_b[..., 1])
+    union = area_a + area_b - intersection
+    return np.where(union > 0, intersection / np.maximum(union, 1e-12), 0.0)
+
+
+class StreamingPRCurveEvaluator(object):
+    """
+    Accumulates detection true positive, false positive and false negative
+    counts for every (IoU threshold, confidence threshold) pair, one batch
+    at a time, so memory does not grow with the size of the dataset.
+
+    Predictions are greedily matched to ground truth boxes in order of
+    decreasing confidence. Because a greedy match never depends on lower
+    confidence predictions, the matches at any confidence threshold are a
+    prefix of the full matching, and a single matching per image and IoU
+    threshold is enough for every confidence threshold.
+
+    :param iou_thresholds: IoU needed for a prediction to match a box
+    :param confidence_thresholds: increasing confidence thresholds; a
+                                  prediction counts at every threshold
+                                  less than or equal to its confidence
+    """
+
+    def __init__(self, iou_thresholds, confidence_thresholds):
+        self.iou_thresholds = np.asarray(iou_thresholds)
+        self.confidence_thresholds = np.asarray(confidence_thresholds)
+        shape = (len(self.iou_thresholds), len(self.confidence_thresholds))
+        self.true_positives = np.zeros(shape, dtype=np.int64)
+        self.false_positives = np.zeros(shape, dtype=np.int64)
+        self.num_ground_truth = 0
+
+    def match(self, pred_boxes, pred_scores, gt_boxes):
+        """
+        Greedy matching of one image's predictions for every IoU threshold.
+
+        :return: boolean array (num_iou_thresholds, num_predictions), True
+                 where the prediction is a true positive
+        """
+        is_tp = np.zeros((len(self.iou_thresholds), len(pred_boxes)), dtype=bool)
+        if not len(pred_boxes) or not len(gt_boxes):
+            return is_tp
+
+        ious = iou_matrix(pred_boxes, gt_boxes)
+        matched = np.zeros((len(self.iou_thresholds), len(gt_boxes)), dtype=bool)
+        thresholds = self.iou_thresholds[:, np.newaxis]
+        for p in np.argsort(-pred_scores, kind='stable'):
+            # Best still unmatched ground truth box, per IoU threshold
+            candidate_ious = np.where(matched, -1.0, ious[p][np.newaxis, :])
+            best = candidate_ious.argmax(axis=1)
+            hit = candidate_ious[np.arange(len(best)), best] >= thresholds[:, 0]
+            matched[hit, best[hit]] = True
+            is_tp[:, p] = hit
+        return is_tp
+
+    def add_batch(self, pred_boxes, pred_scores, gt_boxes):
+        """
+        Add the predictions and ground truths of a batch of images.
+
+        :param pred_boxes: per image arrays of predicted boxes (N, 4)
+        :param pred_scores: per image arrays of prediction confidences (N,)
+        :param gt_boxes: per image arrays of ground truth boxes (M, 4),
+                         without padding
+        """
+        num_thresholds = len(self.confidence_thresholds)
+        for boxes, scores, gt in zip(pred_boxes, pred_scores, gt_boxes):
+            self.num_ground_truth += len(gt)
+            if not len(boxes):
+                continue
+            is_tp = self.match(boxes, scores, gt)
+
+            # Index of the highest threshold each prediction passes, turned
+            # into per threshold counts with a reversed cumulative sum
+            buckets = np.searchsorted(self.confidence_thresholds, scores,
+                                      side='right') - 1
+            passes = buckets >= 0
+            for i in range(len(self.iou_thresholds)):
+                tp = np.bincount(buckets[passes & is_tp[i]],
+                                 minlength=num_thresholds)
+                fp = np.bincount(buckets[passes & ~is_tp[i]],
+                                 minlength=num_thresholds)
+                self.true_positives[i] += np.cumsum(tp[::-1])[::-1]
+                self.false_positives[i] += np.cumsum(fp[::-1])[::-1]
+
+    def compute_statistics(self):
+        """
+        :return: dictionary keyed by IoU threshold of dictionaries holding
+                 the true_positives, false_positives, false_negatives,
+                 precision and recall arrays over the confidence thresholds
+        """
+        statistics = dict()
+        for i, iou in enumerate(self.iou_thresholds):
+            tp = self.true_positives[i]
+            fp = self.false_positives[i]
+            fn = self.num_ground_truth - tp
+            precision = np.where(tp + fp > 0, tp / np.maximum(tp + fp, 1), 1.0)
+            recall = np.where(tp + fn > 0, tp / np.maximum(tp + fn, 1), 0.0)
+            statistics[iou] = {
+                "true_positives": tp,
+                "false_positives": fp,
+                "false_negatives": fn,
+                "precision": precision,
+                "recall": recall,
+            }
+        return statistics
@@ -1,15 +1,20 @@
-import matplotlib.pyplot as plt
-import matplotlib.patches as patches
-from matplotlib.colors import Normalize
-
 import tensorflow as tf
-from tensorboard import summary as summary_lib
+from tensorflow.keras import backend as K
+from tensorflow.keras.callbacks import Callback
+
+from callbacks.StreamingPRCurveEvaluator import StreamingPRCurveEvaluator
 
 import numpy as np
-from PIL import Image
-import cv2
 import io
+import queue
+import threading
 import time
+import traceback
+import warnings
+
+# cv2, PIL and tensorboard's summary library are only needed when plots
+# and PR curves are produced, so they are imported inside the methods that
+# use them instead of when the callback module is loaded
 
 
 def print_time(seconds):
@@ -30,90 +35,147 @@ class TensorboardValidationCallback(Callback):
                  validation_generator,
                  summarization_analysis,
                  tensorboard_callback,
-                 num_plot_images=5):
+                 num_plot_images=5,
+                 monitor_offset=0,
+                 async_validation=False,
+                 infer_model_builder=None):
+        """
+        :param summarization_analysis: deprecated and ignored; the PR curves
+                                       are computed by
+                                       StreamingPRCurveEvaluator. Pass None
+        :param async_validation: run the epoch end plotting and PR curves on
+                                 a background thread against a snapshot of
+                                 the weights, so training continues
+                                 immediately. The summaries go to
+                                 tensorboard_callback's writer, which the
+                                 TensorBoard callback closes in its
+                                 on_train_end, so list this callback before
+                                 it in fit(callbacks=...). The worker reads
+                                 the validation set through its own
+                                 iterator in the training session while fit
+                                 runs, so nothing else may use that
+                                 iterator (self.valid_iterator)
+        :param infer_model_builder: used with async_validation; builds a
+                                    fresh inference model (same interface as
+                                    infer_model) in the current default
+                                    graph, whose set_weights() accepts the
+                                    trained model's get_weights()
+        """
         super().__init__()
         self.training_generator = training_generator
         self.validation_generator = validation_generator
         self.infer_model = infer_model
-        self.summarization_analysis = summarization_analysis
         self.tensorboard_callback = tensorboard_callback
-
-        # Now we load in the images to monitor
-        train_idxs = np.sort(np.random.choice(training_generator.num_images, num_plot_images, replace=False))
-        valid_idxs = np.sort(np.random.choice(validation_generator.num_images, num_plot_images, replace=False))
-        train_batch_size = training_generator.batch_size
-        valid_batch_size = validation_generator.batch_size
-
-        sess = K.get_session()
-
-        # Collect the training examples we care about
-        start_time = time.time()
-        data_iterator = self.training_generator.get_iterator()
-        next_batch = data_iterator.get_next()
-        current_index = 0
-        self.train_images = []
-        self.train_gt = []
-        self.train_filenames = []
-        for i in range(len(self.training_generator)):
-            batch = sess.run(next_batch)
-            images, gt, filenames = batch[0], batch[1], batch[2]
-            match_found = True
-            while match_found:
-                match_found = False
-                if current_index < len(train_idxs) and train_idxs[current_index] < (i + 1) * train_batch_size:
-                    index_in_batch = train_idxs[current_index] % train_batch_size
-                    self.train_images.append(images[index_in_batch, :, :, :])
-                    self.train_gt.append(gt[index_in_batch, :, :])
-                    self.train_filenames.append(filenames[index_in_batch])
-                    current_index += 1
-                    match_found = True
-        print("Initial Training Pass Time: " + print_time(time.time() - start_time))
-
-        # Collect the validation examples we care about
+        if summarization_analysis is not None:
+            warnings.warn("summarization_analysis is deprecated and ignored: "
+                          "the PR curves are computed by "
+                          "StreamingPRCurveEvaluator", FutureWarning,
+                          stacklevel=2)
+
+        # Now we load in the images to monitor. Only the first
+        # monitor_offset + num_plot_images examples of each generator are
+        # read, instead of a full pass over both datasets
+        self.train_images, self.train_gt, self.train_filenames = \
+            self.select_monitor_samples(training_generator, num_plot_images,
+                                        monitor_offset, "Training")
+        self.valid_images, self.valid_gt, self.valid_filenames = \
+            self.select_monitor_samples(validation_generator, num_plot_images,
+                                        monitor_offset, "Validation")
+
+        # The validation data is always read through the training session,
+        # with one iterator re-initialized every epoch rather than new
+        # iterator ops added to the graph each time. With async_validation
+        # it is read while fit runs, so it belongs to this callback alone
+        self.data_session = K.get_session()
+        self.valid_iterator = \
+            validation_generator.get_dataset().make_initializable_iterator()
+        self.valid_next_batch = self.valid_iterator.get_next()
+
+        self.async_validation = async_validation
+        if async_validation:
+            if infer_model_builder is None:
+                raise ValueError("async_validation needs an infer_model_builder")
+            self.infer_model_builder = infer_model_builder
+            # Holds at most the latest snapshot; a stale one still waiting
+            # when the next epoch ends is dropped
+            self._snapshots = queue.Queue(maxsize=1)
+            self._worker = threading.Thread(target=self._validation_worker,
+                                            daemon=True)
+            self._worker.start()
+
+    def select_monitor_samples(self, generator, num_samples, offset=0,
+                               name=""):
+        """
+        Pull a fixed set of examples to monitor: examples offset to
+        offset + num_samples of the generator's dataset, read with a
+        single skip/take pass and a single sess.run. The same examples are
+        picked on every run only if the generator does not shuffle its
+        dataset (shuffle=False, its default); from a shuffled generator
+        they are whichever examples the shuffle puts first.
+
+        :return: lists of images, ground truths and filenames
+        """
         start_time = time.time()
-        data_iterator = self.validation_generator.get_iterator()
-        next_batch = data_iterator.get_next()
-        current_index = 0
-        self.valid_images = []
-        self.valid_gt = []
-        self.valid_filenames = []
-        for i in range(len(self.validation_generator)):
-            batch = sess.run(next_batch)
-            images, gt, filenames = batch[0], batch[1], batch[2]
-            match_found = True
-            while match_found:
-                match_found = False
-                if current_index < len(valid_idxs) and valid_idxs[current_index] < (i + 1) * valid_batch_size:
-                    index_in_batch = valid_idxs[current_index] % valid_batch_size
-                    self.valid_images.append(images[index_in_batch, :, :, :])
-                    self.valid_gt.append(gt[index_in_batch, :, :])
-                    self.valid_filenames.append(filenames[index_in_batch])
-                    current_index += 1
-                    match_found = True
-        print("Initial Validation Pass Time: " + print_time(time.time() - start_time))
-
-    def plot_images_in_tensorboard(self, image, gt, epoch, plot_tag="TB Image Plot"):
-        sess = K.get_session()
-
-        # Make a fake batch so we can use the default inference model
-        curr_image = np.expand_dims(image, axis=0)
-        image_batch = np.repeat(curr_image, self.infer_model.infer_batch_size, axis=0)
-
-        # Execute the model on this image
-        infer_results = self.infer_model(image_batch)
-        infer_results = infer_results[0, :, :]
+        dataset = generator.get_dataset().apply(tf.data.experimental.unbatch())
+        dataset = dataset.skip(offset).take(num_samples)
+        # Ground truths are padded per batch, so re-pad across the batches
+        dataset = dataset.padded_batch(num_samples, dataset.output_shapes)
+        batch = K.get_session().run(
+            dataset.make_one_shot_iterator().get_next())
+        images, gt, filenames = batch[0], batch[1], batch[2]
+        elapsed = time.time() - start_time
+
+        print("Initial {0} Sample Selection Time: {1} ({2} of {3} examples "
+              "read)".format(name, print_time(elapsed), offset + len(images),
+                             generator.num_images))
+
+        return list(images), list(gt), list(filenames)
+
+    def infer(self, image_batch, infer_model=None):
+        """Run the inference model on a full batch, returning numpy results"""
+        infer_model = infer_model or self.infer_model
+        infer_results = infer_model(image_batch)
+        if isinstance(infer_results, tf.Tensor):
+            infer_results = K.get_session().run(infer_results)
+        return infer_results
+
+    def plot_images_in_tensorboard(self, images, gts, epoch, plot_tags,
+                                   infer_model=None):
+        """
+        Run the model on all monitored images at once, draw the predicted
+        and ground truth boxes, and push every plot to TensorBoard in a
+        single summary.
+        """
+        from concurrent.futures import ThreadPoolExecutor
+
+        # Pack the images into real batches of the inference model's batch
+        # size, padding the last one by repeating its final image
+        infer_model = infer_model or self.infer_model
+        batch_size = infer_model.infer_batch_size
+        images = np.stack(images)
+        num_padded = -len(images) % batch_size
+        image_batches = np.concatenate(
+            [images, np.repeat(images[-1:], num_padded, axis=0)], axis=0)
+        infer_results = np.concatenate(
+            [self.infer(image_batches[start:start + batch_size], infer_model)
+             for start in range(0, len(image_batches), batch_size)],
+            axis=0)[:len(images)]
 
         # Because continuous "not a valid bounding box" warnings make me anxious...
-        corrected_infer_results = tf.maximum(infer_results, 0.0)
-        corrected_infer_results = tf.minimum(corrected_infer_results, 1.0)
-        corrected_infer_results = sess.run(corrected_infer_results)
+        infer_results = np.clip(infer_results, 0.0, 1.0)
+
+        # Mark up the images with the predicted bounding boxes and encode
+        # them; PNG encoding releases the GIL, so it runs in threads
+        def render(i):
+            drawn_image = self.markup_images(images[i], infer_results[i], gts[i])
+            return self.make_image_protobuf(drawn_image)
 
-        # Mark up the images with the predicted bounding boxes
-        drawn_images = self.markup_images(curr_image[0, :, :, :], corrected_infer_results, gt)
-        image_protobuf = self.make_image_protobuf(drawn_images)
+        with ThreadPoolExecutor(max_workers=min(8, len(images))) as executor:
+            image_protobufs = list(executor.map(render, range(len(images))))
 
-        # Push a sample image from this batch to TensorBoard
-        summary = tf.Summary(value=[tf.Summary.Value(tag=plot_tag, image=image_protobuf)])
+        # Push all of the plots to TensorBoard with a single write
+        summary = tf.Summary(value=[tf.Summary.Value(tag=tag, image=image_protobuf)
+                                    for tag, image_protobuf in zip(plot_tags, image_protobufs)])
         self.get_writer().add_summary(summary, epoch)
         self.get_writer().flush()
 
@@ -125,6 +187,8 @@ class TensorboardValidationCallback(Callback):
         Convert an numpy representation image to Image protobuf.
         Copied from https://github.com/lanpa/tensorboard-pytorch/
         """
+        from PIL import Image
+
         height, width, channel = tensor.shape
         image = Image.fromarray(tensor)
         output = io.BytesIO()
@@ -137,6 +201,8 @@ class TensorboardValidationCallback(Callback):
                                 encoded_image_string=image_string)
 
     def markup_images(self, image, pred_boxes, gt_boxes, confidence_threshold=0.5):
+        import cv2
+
         # Make this an RGB on the appropriate scale/dtype
         image = np.stack([image[:, :, -1], image[:, :, -1], image[:, :, -1]], axis=-1)
         image_min = np.min(image)
@@ -166,61 +232,89 @@ class TensorboardValidationCallback(Callback):
         return image
 
     def on_epoch_end(self, epoch, logs={}):
-        start_time = time.time()
-        # First make plots of our training images
-        count = 1
-        for img, gt_boxes, filename in zip(self.train_images, self.train_gt, self.train_filenames):
-            self.plot_images_in_tensorboard(img, gt_boxes, epoch, "Training Image " + str(count))
-            count += 1
-
-        # Now plots the validation images
-        count = 1
-        for img, gt_boxes, filename in zip(self.valid_images, self.valid_gt, self.valid_filenames):
-            self.plot_images_in_tensorboard(img, gt_boxes, epoch, "Validation Image " + str(count))
-            count += 1
-        print("Image Plotting Time: " + print_time(time.time() - start_time))
+        if not self.async_validation:
+            self.run_validation(epoch, self.infer_model)
+            return
 
-        # Need to gather a record of this test
+        # Copying the weights to host memory is all the training thread
+        # waits for
+        start_time = time.time()
+        snapshot = (epoch, self.model.get_weights())
+        try:
+            stale_epoch, _ = self._snapshots.get_nowait()
+            print("Validation of epoch {0} skipped, the background worker "
+                  "is still busy".format(stale_epoch))
+        except queue.Empty:
+            pass
+        self._snapshots.put(snapshot)
+        print("Weight Snapshot Time: " + print_time(time.time() - start_time))
+
+        # The last epoch is validated before fit returns, so its summaries
+        # are written even if the TensorBoard callback's on_train_end runs
+        # (and closes the writer) before ours
+        if epoch + 1 >= self.params.get('epochs', float('inf')):
+            self.join_worker()
+
+    def on_train_end(self, logs={}):
+        if self.async_validation:
+            self.join_worker()
+
+    def join_worker(self):
+        """Wait for the queued snapshot to be validated and stop the worker"""
+        if not self._worker.is_alive():
+            return
         start_time = time.time()
-        inferred_boxes = dict()
-        truth_boxes = dict()
+        self._snapshots.put(None)
+        self._worker.join()
+        print("Waited for Background Validation: " +
+              print_time(time.time() - start_time))
 
-        data_iterator = self.validation_generator.get_iterator()
-        next_batch = data_iterator.get_next()
+    def _validation_worker(self):
+        """
+        Background thread: owns a copy of the inference model in its own
+        graph and session, loads each snapshot into it and validates.
+        Summaries go to the shared writer, which is thread safe.
+        """
+        graph = tf.Graph()
+        with graph.as_default():
+            sess = tf.Session(graph=graph)
+            # Keras picks up the thread's default session
+            with sess.as_default():
+                infer_model = self.infer_model_builder()
+                while True:
+                    snapshot = self._snapshots.get()
+                    if snapshot is None:
+                        break
+                    epoch, weights = snapshot
+                    try:
+                        infer_model.set_weights(weights)
+                        self.run_validation(epoch, infer_model)
+                    except Exception:
+                        print("Background validation of epoch {0} failed:".format(epoch))
+                        traceback.print_exc()
+            sess.close()
+
+    def run_validation(self, epoch, infer_model):
+        """
+        Plot the monitored images and write the PR curves of the whole
+        validation set for this epoch.
+        """
+        from tensorboard import summary as summary_lib
 
-        sess = K.get_session()
-        for i in range(len(self.validation_generator)):
-            valid_batch = sess.run(next_batch)
-            test_images, test_gt, test_filenames = valid_batch[0], valid_batch[1], valid_batch[2]
+        start_time = time.time()
+        # Plot the training and validation images together
+        plot_tags = (["Training Image " + str(count)
+                      for count in range(1, len(self.train_images) + 1)] +
+                     ["Validation Image " + str(count)
+                      for count in range(1, len(self.valid_images) + 1)])
+        self.plot_images_in_tensorboard(self.train_images + self.valid_images,
+                                        self.train_gt + self.valid_gt,
+                                        epoch, plot_tags, infer_model)
+        print("Image Plotting Time: " + print_time(time.time() - start_time))
 
-            # Run the model on this validation batch
-            infer_results = self.infer_model(test_images)
-
-            # Loop over the batch, adding each record to the detection dictionary
-            for j in range(infer_results.shape[0]):
-                image_results = infer_results[j, :, :]
-                image_gt = test_gt[j, :, :]
-                image_filename = test_filenames[j][0]
-
-                # Removed the padded (i.e. non-positive) bounding boxes from the ground truth
-                gt_positives = image_gt[:, 4] > 0
-                image_gt = image_gt[gt_positives, :]
-
-                # Record the results
-                # Iterate over the list of inferred boxes and scores...
-                predicted_boxes = image_results[:, :4]
-                predicted_scores = image_results[:, 5]
-                scored_boxes = []
-                for box, score in zip(predicted_boxes, predicted_scores):
-                    scored_box = {
-                        "box": box,
-                        "confidence": score,
-                    }
-                    scored_boxes.append(scored_box)
-                inferred_boxes[image_filename] = list(scored_boxes)
-                truth_boxes[image_filename] = list(image_gt[:, :4])
-
-        # Run the analysis/Compute the statistics
+        # Evaluate the validation set batch by batch, accumulating the
+        # detection counts for every threshold as we go
+        start_time = time.time()
         iou_list = np.linspace(0.5, 0.9, 3)
 
         def sigmoid(x):
@@ -228,31 +322,33 @@ class TensorboardValidationCallback(Callback):
 
         confidence_list = sigmoid(np.linspace(-100, 100, 100))
         confidence_list = np.concatenate([[0.0], confidence_list, [1.0]], axis=0)
-        detection_analysis = self.summarization_analysis(truth_boxes,
-                                                         inferred_boxes,
-                                                         iou_thresholds=iou_list,
-                                                         confidence_thresholds=confidence_list)
-        total_df = detection_analysis.compute_statistics()
+        evaluator = StreamingPRCurveEvaluator(iou_thresholds=iou_list,
+                                              confidence_thresholds=confidence_list)
+
+        self.data_session.run(self.valid_iterator.initializer)
+        for i in range(len(self.validation_generator)):
+            valid_batch = self.data_session.run(self.valid_next_batch)
+            test_images, test_gt = valid_batch[0], valid_batch[1]
+
+            # Run the model on this validation batch
+            infer_results = self.infer(test_images, infer_model)
+            # Removed the padded (i.e. non-positive) bounding boxes from the ground truth
+            gt_boxes = [image_gt[image_gt[:, 4] > 0, :4] for image_gt in test_gt]
+            evaluator.add_batch(infer_results[:, :, :4], infer_results[:, :, 5],
+                                gt_boxes)
+
+        statistics = evaluator.compute_statistics()
 
         # Now produce a summary for each IOU threshold
         for iou_val in iou_list:
-            iou_df = total_df.loc[iou_val, :]
-            tp = iou_df["true_positives"].tolist()
+            iou_stats = statistics[iou_val]
+            tp = iou_stats["true_positives"].tolist()
             num_unique_confidences = len(tp)
-            fp = iou_df["false_positives"].tolist()
+            fp = iou_stats["false_positives"].tolist()
             tn = num_unique_confidences * [0]
-            fn = iou_df["false_negatives"].tolist()
-            precision = iou_df["precision"].tolist()
-            recall = iou_df["recall"].tolist()
-
-            # print("true_positive_counts = " + str(len(tp)))
-            # print("false_positive_counts = " + str(len(fp)))
-            # print("true_negative_counts = " + str(len(tn)))
-            # print("false_negative_counts = " + str(len(fn)))
-            # print("precision = " + str(len(precision)))
-            # print("recall = " + str(len(recall)))
-            # print("num_thresholds = " + str(len(confidence_list)))
-            # print("-----------------------------------------------------------")
+            fn = iou_stats["false_negatives"].tolist()
+            precision = iou_stats["precision"].tolist()
+            recall = iou_stats["recall"].tolist()
 
             pr_summary = summary_lib.pr_curve_raw_data_pb(
                 name='PR Curve (IOU = ' + str(iou_val) + ")",
@@ -0,0 +1,193 @@
+import tensorflow as tf
+
+import io
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from decoding import (TransformerDecoder, bleu_from_statistics,
+                      bleu_statistics, ids_to_text, length_sorted_batches)
+
+
+def pad_sequences(sequences):
+    '''Stack id arrays of different lengths, padding them with zeros'''
+    width = max(len(sequence) for sequence in sequences)
+    return np.stack([np.pad(sequence, (0, width - len(sequence)), 'constant')
+                     for sequence in sequences])
+
+
+def downsample_heatmap(heatmap, max_size):
+    '''Average blocks of a 2D map so neither side exceeds max_size'''
+    for axis in (0, 1):
+        size = heatmap.shape[axis]
+        if size > max_size:
+            edges = np.linspace(0, size, max_size + 1).astype(np.int64)
+            counts = np.expand_dims(np.diff(edges), 1 - axis)
+            heatmap = np.add.reduceat(heatmap, edges[:-1], axis=axis) / counts
+    return heatmap
+
+
+class TranslationValidationCallback(object):
+    '''Epoch end validation of the translation model: perplexity under
+       teacher forcing and corpus BLEU of the decoded validation sentences,
+       a few sampled translations, and heatmaps of the encoder-decoder
+       attention of the last decoder layer for those samples.
+
+       Only the session runs (teacher forced losses and batched decoding)
+       happen on the training thread. Detokenizing, BLEU, heatmap rendering
+       and the summary writes run on a background thread while training
+       carries on.
+
+       Parameters:
+           model (Model): the transformer being trained; the validation
+                          graphs share its weights
+           validation_pairs (list): (pt ids, en ids) pairs, as returned by
+                                    decoding.load_validation_set
+           tokenizer_pt, tokenizer_en: the subword tokenizers
+           summary_writer (tf.summary.FileWriter): where summaries go
+           batch_size (int): sentences decoded together
+           method (str): 'greedy' or 'beam'
+           num_samples (int): sampled translations logged every epoch; the
+                              same sentences are used every epoch
+           heatmap_size (int): attention heatmaps are averaged down to at
+                               most heatmap_size cells per side
+    '''
+
+    def __init__(self, model, validation_pairs, tokenizer_pt, tokenizer_en,
+                 summary_writer, batch_size=64, max_length=40,
+                 method='greedy', beam_size=4, alpha=0.6, num_samples=3,
+                 heatmap_size=32, seed=0):
+        self.tokenizer_pt = tokenizer_pt
+        self.tokenizer_en = tokenizer_en
+        self.writer = summary_writer
+        self.method = method
+        self.beam_size = beam_size
+        self.alpha = alpha
+        self.heatmap_size = heatmap_size
+
+        # Sorting here keeps the decoded outputs in the order of the pairs
+        pairs = sorted(validation_pairs, key=lambda pair: len(pair[0]))
+        self.batches = length_sorted_batches(pairs, batch_size)
+        self.references = [en for _, en in pairs]
+
+        rng = np.random.RandomState(seed)
+        self.sample_indices = np.sort(rng.choice(
+            len(pairs), min(num_samples, len(pairs)), replace=False))
+        self.sample_inputs = pad_sequences(
+            [pairs[i][0] for i in self.sample_indices])
+        self.sample_targets = pad_sequences(
+            [pairs[i][1] for i in self.sample_indices])
+
+        # The session is handed over at every epoch end
+        self.decoder = TransformerDecoder(
+            model, None, start_token=tokenizer_en.vocab_size,
+            end_token=tokenizer_en.vocab_size + 1, max_length=max_length)
+
+        # Teacher forced losses and attention, without dropout
+        with tf.name_scope('translation_validation'):
+            self.inp = tf.placeholder(tf.int64, [None, None])
+            self.tar = tf.placeholder(tf.int64, [None, None])
+            logits, attention_weights = model.transformer(
+                self.inp, self.tar[:, :-1], training=False)
+            self.loss, self.num_tokens = model.loss_function(self.tar[:, 1:],
+                                                             logits)
+            # (batch_size, tar_seq_len, inp_seq_len), averaged over heads
+            self.attention = tf.reduce_mean(attention_weights[
+                'decoder_layer{}_block2'.format(model.num_layers - 1)], axis=1)
+
+        self._executor = ThreadPoolExecutor(max_workers=1)
+        self._pending = None
+
+    def on_epoch_end(self, sess, epoch, step):
+        '''Run the validation set through the model and queue the summaries
+           for this step'''
+        start_time = time.time()
+        self.decoder.sess = sess
+
+        total_loss, total_tokens = 0.0, 0.0
+        outputs = list()
+        for inputs, targets in self.batches:
+            batch_loss, batch_tokens = sess.run(
+                [self.loss, self.num_tokens],
+                {self.inp: inputs, self.tar: pad_sequences(targets)})
+            total_loss += batch_loss * batch_tokens
+            total_tokens += batch_tokens
+
+            if self.method == 'greedy':
+                outputs.extend(self.decoder.greedy(inputs))
+            else:
+                outputs.extend(self.decoder.beam_search(
+                    inputs, beam_size=self.beam_size, alpha=self.alpha))
+        perplexity = float(np.exp(total_loss / max(total_tokens, 1.0)))
+
+        attention = sess.run(self.attention, {self.inp: self.sample_inputs,
+                                              self.tar: self.sample_targets})
+
+        # One epoch's summaries at a time
+        self.join()
+        self._pending = self._executor.submit(
+            self._write_summaries, epoch, step, outputs, perplexity, attention)
+        print("Translation Validation Time: {0:.2f} s".format(
+            time.time() - start_time))
+
+    def join(self):
+        '''Wait for the queued summaries to be written'''
+        if self._pending is not None:
+            self._pending.result()
+            self._pending = None
+
+    def _write_summaries(self, epoch, step, outputs, perplexity, attention):
+        statistics = 0
+        for output, reference in zip(outputs, self.references):
+            statistics = statistics + bleu_statistics(
+                ids_to_text(self.tokenizer_en, output).split(),
+                ids_to_text(self.tokenizer_en, reference).split())
+        bleu = bleu_from_statistics(statistics)
+
+        values = [tf.Summary.Value(tag='validation/perplexity',
+                                   simple_value=perplexity),
+                  tf.Summary.Value(tag='validation/bleu', simple_value=bleu)]
+
+        rows = ["| source | reference | translation |", "|---|---|---|"]
+        for sample, index in enumerate(self.sample_indices):
+            inp_length = np.count_nonzero(self.sample_inputs[sample])
+            # The decoder input is the reference without its end token
+            tar_length = np.count_nonzero(self.sample_targets[sample]) - 1
+            heatmap = downsample_heatmap(
+                attention[sample, :tar_length, :inp_length], self.heatmap_size)
+            values.append(tf.Summary.Value(
+                tag='Attention Sample ' + str(sample + 1),
+                image=self.make_heatmap_protobuf(heatmap)))
+
+            rows.append("| {0} | {1} | {2} |".format(
+                ids_to_text(self.tokenizer_pt, self.sample_inputs[sample]),
+                ids_to_text(self.tokenizer_en, self.references[index]),
+                ids_to_text(self.tokenizer_en, outputs[index])))
+
+        from tensorboard import summary as summary_lib
+
+        self.writer.add_summary(tf.Summary(value=values), step)
+        self.writer.add_summary(
+            summary_lib.text_pb('validation/translations', '\n'.join(rows)),
+            step)
+        self.writer.flush()
+        print("Epoch {0}: validation BLEU {1:.2f}, perplexity {2:.2f}".format(
+            epoch, bleu, perplexity))
+
+    def make_heatmap_protobuf(self, heatmap, image_size=256):
+        '''Grayscale PNG Image protobuf of a heatmap, with each cell scaled
+           up to a square block of pixels'''
+        from PIL import Image
+
+        heatmap = heatmap / max(heatmap.max(), 1e-12)
+        cell = max(1, image_size // max(heatmap.shape))
+        pixels = np.kron((255 * heatmap).astype(np.uint8),
+                         np.ones((cell, cell), dtype=np.uint8))
+        output = io.BytesIO()
+        Image.fromarray(pixels, mode='L').save(output, format='PNG')
+        image_string = output.getvalue()
+        output.close()
+        return tf.Summary.Image(height=pixels.shape[0], width=pixels.shape[1],
+                                colorspace=1,
+                                encoded_image_string=image_string)
@@ -0,0 +1,188 @@
+"""
+In-graph data-parallel training for the transformer Model. The model is
+replicated once per worker device (a "tower"), every tower reads batches
+of its own disjoint shard of the training examples, and the tower
+gradients are averaged (an all-reduce over the towers) before a single
+optimizer step updates the shared weights.
+
+On a many-core CPU box the workers are virtual CPU devices, created with
+session_config(num_workers), each running its ops on its own share of the
+cores. On a GPU box the workers are the visible GPUs.
+"""
+
+import os
+
+from lazy_import import lazy_import
+
+tf = lazy_import('tensorflow')
+
+
+def worker_devices(num_workers, use_gpus=False):
+    '''Device names of the replicas, one per worker'''
+    device_type = 'gpu' if use_gpus else 'cpu'
+    return ['/{0}:{1}'.format(device_type, i) for i in range(num_workers)]
+
+
+def session_config(num_workers, use_gpus=False, num_cores=None):
+    '''ConfigProto exposing num_workers CPU devices when training on the
+       CPU, with the cores split evenly between the workers
+    '''
+    config = tf.ConfigProto(allow_soft_placement=True)
+    config.gpu_options.allow_growth = True
+    if not use_gpus:
+        num_cores = num_cores or os.cpu_count() or 1
+        config.device_count['CPU'] = num_workers
+        config.intra_op_parallelism_threads = max(num_cores // num_workers, 1)
+        config.inter_op_parallelism_threads = num_workers
+    return config
+
+
+def worker_iterators(datasets, devices, buffer_size=1):
+    '''One initializable iterator per worker over that worker's dataset,
+       prefetched onto its device. The datasets should be disjoint shards
+       of the examples (DatasetGenerator_PtToEng's train_datasets), split
+       before they are shuffled and batched, so that every step averages
+       the gradients of different batches
+
+       :return: list of iterators and an op initializing all of them
+    '''
+    iterators = list()
+    for dataset, device in zip(datasets, devices):
+        if device.startswith('/gpu'):
+            dataset = dataset.apply(tf.data.experimental.prefetch_to_device(
+                device, buffer_size))
+        iterators.append(dataset.make_initializable_iterator())
+    return iterators, tf.group(*[it.initializer for it in iterators])
+
+
+def average_gradients(tower_grads):
+    '''All-reduce of the towers' gradients: for every variable, average the
+       gradient computed by each tower
+
+       :param tower_grads: list over towers of (gradient, variable) lists
+       :return: a single list of (averaged gradient, variable)
+    '''
+    if len(tower_grads) == 1:
+        return tower_grads[0]
+
+    average_grads = list()
+    for grads_and_vars in zip(*tower_grads):
+        var = grads_and_vars[0][1]
+        grads = [g for g, _ in grads_and_vars if g is not None]
+        if not grads:
+            average_grads.append((None, var))
+            continue
+        if isinstance(grads[0], tf.IndexedSlices):
+            # Embedding gradients stay sparse
+            grad = tf.IndexedSlices(
+                tf.concat([g.values for g in grads], 0) / len(grads),
+                tf.concat([g.indices for g in grads], 0),
+                grads[0].dense_shape)
+        else:
+            grad = tf.add_n(grads) / len(grads)
+        average_grads.append((grad, var))
+    return average_grads
+
+
+def build_tower_losses(model, iterators, devices, training=True):
+    '''Replicate the model on every device, each tower reading batches from
+       its own iterator. Variables are shared between the towers.
+
+       :return: list over towers of (loss, number of target tokens)
+    '''
+    tower_losses = list()
+    for index, (iterator, device) in enumerate(zip(iterators, devices)):
+        with tf.device(device), tf.name_scope('tower_{}'.format(index)):
+            inp, tar = iterator.get_next()
+            # The decoder sees the target shifted right and learns to
+            # predict the next token
+            logits, _ = model.transformer(inp, tar[:, :-1], training=training)
+            tower_losses.append(model.loss_function(tar[:, 1:], logits))
+    return tower_losses
+
+
+def build_tower_gradients(model, iterators, devices, optimizer):
+    '''Per tower losses and gradients, averaged over the towers
+
+       :return: averaged (gradient, variable) list and the mean loss
+    '''
+    tower_losses = build_tower_losses(model, iterators, devices,
+                                      training=True)
+
+    tower_grads = list()
+    for (loss, _), device in zip(tower_losses, devices):
+        with tf.device(device):
+            # Colocating with the forward ops keeps every tower's backward
+            # pass on its own worker
+            tower_grads.append(optimizer.compute_gradients(
+                loss, colocate_gradients_with_ops=True))
+
+    with tf.device('/cpu:0'):
+        grads_and_vars = average_gradients(tower_grads)
+        loss = tf.add_n([l for l, _ in tower_losses]) / len(tower_losses)
+    return grads_and_vars, loss
+
+
+def build_train_op(model, iterators, devices, optimizer, global_step):
+    '''Data-parallel training step: per tower losses and gradients, an
+       average over the towers, and one optimizer update
+
+       :return: train op and the mean loss over the towers
+    '''
+    grads_and_vars, loss = build_tower_gradients(model, iterators, devices,
+                                                 optimizer)
+    train_op = optimizer.apply_gradients(grads_and_vars,
+                                         global_step=global_step)
+    return train_op, loss
+
+
+def build_accumulating_train_op(model, iterators, devices, optimizer,
+                                global_step):
+    '''Data-parallel training step with gradient accumulation. Running
+       accumulate_op computes the gradients of one micro-batch per tower and
+       adds them to non-trainable accumulators; running apply_op updates the
+       weights with the mean accumulated gradient and resets the
+       accumulators. Only one micro-batch of activations is alive at a time,
+       so the effective batch can grow without growing peak memory.
+
+       :return: accumulate op, apply op and the mean micro-batch loss
+    '''
+    grads_and_vars, loss = build_tower_gradients(model, iterators, devices,
+                                                 optimizer)
+    grads_and_vars = [(g, v) for g, v in grads_and_vars if g is not None]
+
+    accumulate_ops = list()
+    accumulators = list()
+    with tf.variable_scope('gradient_accumulation'):
+        count = tf.get_variable('count', shape=[], dtype=tf.float32,
+                                initializer=tf.zeros_initializer(),
+                                trainable=False,
+                                collections=[tf.GraphKeys.LOCAL_VARIABLES])
+        for grad, var in grads_and_vars:
+            # Keep each accumulator next to its variable
+            with tf.device(var.device):
+                accumulator = tf.get_variable(
+                    var.op.name, shape=var.shape, dtype=var.dtype.base_dtype,
+                    initializer=tf.zeros_initializer(), trainable=False,
+                    collections=[tf.GraphKeys.LOCAL_VARIABLES])
+                if isinstance(grad, tf.IndexedSlices):
+                    # Only the embedding rows seen by the micro-batch
+                    accumulate_ops.append(tf.scatter_add(
+                        accumulator, grad.indices, grad.values))
+                else:
+                    accumulate_ops.append(tf.assign_add(accumulator, grad))
+            accumulators.append(accumulator)
+
+    with tf.control_dependencies(accumulate_ops):
+        accumulate_op = tf.assign_add(count, 1.0)
+
+    mean_grads = [(accumulator / tf.maximum(count, 1.0), var)
+                  for accumulator, (_, var) in zip(accumulators, grads_and_vars)]
+    update_op = optimizer.apply_gradients(mean_grads, global_step=global_step)
+    with tf.control_dependencies([update_op]):
+        reset_ops = [tf.assign(accumulator, tf.zeros_like(accumulator))
+                     for accumulator in accumulators]
+        reset_ops.append(tf.assign(count, 0.0))
+        apply_op = tf.group(*reset_ops)
+
+    return accumulate_op, apply_op, loss
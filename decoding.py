@@ -0,0 +1,411 @@
+"""
+Batched greedy and beam search decoding for the transformer Model.
+
+The encoder runs once per batch of input sentences. The decoder is then
+stepped one token at a time. A sequence leaves the batch as soon as it
+emits the end token (tokenizer_en.vocab_size + 1), so later steps only
+pay for the sentences that are still being decoded. Beam search scores
+hypotheses with the GNMT length penalty ((5 + length) / 6) ** alpha.
+
+Running this module decodes the validation split with a trained checkpoint
+and reports the throughput in sentences per second:
+
+    python decoding.py --checkpoint_dir checkpoints --vocab_file_prefix vocab
+"""
+
+import argparse
+import collections
+import os
+import time
+
+from lazy_import import lazy_import
+
+tf = lazy_import('tensorflow')
+np = lazy_import('numpy')
+
+
+def length_penalty(length, alpha):
+    '''GNMT length penalty; alpha = 0 disables length normalization'''
+    return ((5.0 + length) / 6.0) ** alpha
+
+
+def trim_padding(inp):
+    '''Drop the trailing columns of a batch that only hold padding'''
+    lengths = np.count_nonzero(inp, axis=1)
+    return inp[:, :max(lengths.max(), 1)] if len(inp) else inp
+
+
+class TransformerDecoder(object):
+    '''Decodes batches of input token ids with a trained Model.
+
+       Parameters:
+           model (Model): the transformer, whose variables live in sess
+           sess (tf.Session): session holding the trained weights
+           start_token (int): first decoder input (tokenizer_en.vocab_size)
+           end_token (int): token that finishes a sequence
+                            (tokenizer_en.vocab_size + 1)
+           max_length (int): maximum number of generated tokens
+    '''
+
+    def __init__(self, model, sess, start_token, end_token, max_length=40):
+        self.model = model
+        self.sess = sess
+        self.start_token = start_token
+        self.end_token = end_token
+        self.max_length = max_length
+
+        # Encoder graph, run once per batch
+        self.inp = tf.placeholder(tf.int64, [None, None], name='decode_inp')
+        self.enc_output = tf.identity(
+            model.transformer_encode(self.inp, training=False),
+            name='encoder_output')
+
+        # Decoder step: log probabilities of the next token given the
+        # encoder output and the tokens decoded so far. Only the last
+        # position goes through the output projection
+        self.enc_output_in = tf.placeholder(tf.float32,
+                                            [None, None, model.d_model],
+                                            name='decode_enc_output')
+        self.tar = tf.placeholder(tf.int64, [None, None], name='decode_tar')
+        dec_output, _ = model.transformer_decode(
+            self.tar, self.enc_output_in, self.inp, training=False)
+        logits = model.output_layer(dec_output[:, -1, :])
+        self.log_probs = tf.nn.log_softmax(logits, name='decode_log_probs')
+
+    def encode(self, inp):
+        return self.sess.run(self.enc_output, {self.inp: inp})
+
+    def step(self, inp, enc_output, tar):
+        '''Log probabilities (batch_size, vocab) of the next token'''
+        return self.sess.run(self.log_probs, {self.inp: inp,
+                                              self.enc_output_in: enc_output,
+                                              self.tar: tar})
+
+    def greedy(self, inp):
+        '''Greedy decoding of a batch of input ids
+
+           :return: list of generated token id lists, without the start and
+                    end tokens
+        '''
+        inp = trim_padding(np.asarray(inp))
+        enc_output = self.encode(inp)
+        results = [None] * len(inp)
+        active = np.arange(len(inp))
+        tar = np.full((len(inp), 1), self.start_token, dtype=np.int64)
+
+        for _ in range(self.max_length):
+            next_tokens = self.step(inp, enc_output, tar).argmax(axis=-1)
+            tar = np.concatenate([tar, next_tokens[:, np.newaxis]], axis=1)
+
+            finished = next_tokens == self.end_token
+            for row in np.flatnonzero(finished):
+                results[active[row]] = tar[row, 1:-1].tolist()
+
+            # Compact finished sequences out of the active batch
+            if finished.any():
+                keep = ~finished
+                active, tar = active[keep], tar[keep]
+                inp = trim_padding(inp[keep])
+                enc_output = enc_output[keep, :inp.shape[1]]
+                if not len(active):
+                    break
+
+        for row, idx in enumerate(active):
+            results[idx] = tar[row, 1:].tolist()
+        return results
+
+    def beam_search(self, inp, beam_size=4, alpha=0.6):
+        '''Beam search decoding of a batch of input ids. Every sentence keeps
+           beam_size live hypotheses, and stops once beam_size hypotheses
+           have finished or no live hypothesis can beat the best finished
+           one under the length penalty.
+
+           :return: list of the best token id lists, without the start and
+                    end tokens
+        '''
+        inp = trim_padding(np.asarray(inp))
+        num_sentences = len(inp)
+        enc_output = self.encode(inp)
+
+        # Rows of the decoder batch are (sentence, beam) pairs
+        active = np.arange(num_sentences)
+        inp = np.repeat(inp, beam_size, axis=0)
+        enc_output = np.repeat(enc_output, beam_size, axis=0)
+        tar = np.full((num_sentences * beam_size, 1), self.start_token,
+                      dtype=np.int64)
+        # Only the first beam is live before the first step
+        scores = np.full((num_sentences, beam_size), -np.inf)
+        scores[:, 0] = 0.0
+
+        finished = [list() for _ in range(num_sentences)]
+        for t in range(1, self.max_length + 1):
+            log_probs = self.step(inp, enc_output, tar)
+            vocab_size = log_probs.shape[-1]
+            candidates = (scores[:, :, np.newaxis] +
+                          log_probs.reshape(len(active), beam_size, vocab_size))
+            candidates = candidates.reshape(len(active), -1)
+
+            # The 2 * beam_size best continuations are enough to refill
+            # every beam even if half of them end the sequence
+            top = np.argpartition(-candidates, 2 * beam_size, axis=1)[:, :2 * beam_size]
+            top_scores = np.take_along_axis(candidates, top, axis=1)
+            order = np.argsort(-top_scores, axis=1)
+            top = np.take_along_axis(top, order, axis=1)
+            top_scores = np.take_along_axis(top_scores, order, axis=1)
+
+            new_rows = np.repeat(np.arange(len(active))[:, np.newaxis] * beam_size,
+                                 beam_size, axis=1)
+            new_tokens = np.zeros((len(active), beam_size), dtype=np.int64)
+            new_scores = np.full((len(active), beam_size), -np.inf)
+            done = np.zeros(len(active), dtype=bool)
+            for i, sentence in enumerate(active):
+                num_live = 0
+                for candidate, score in zip(top[i], top_scores[i]):
+                    if not np.isfinite(score) or num_live == beam_size:
+                        break
+                    beam, token = divmod(candidate, vocab_size)
+                    row = i * beam_size + beam
+                    if token == self.end_token:
+                        finished[sentence].append(
+                            (score / length_penalty(t, alpha),
+                             tar[row, 1:].tolist()))
+                        continue
+                    new_rows[i, num_live] = row
+                    new_tokens[i, num_live] = token
+                    new_scores[i, num_live] = score
+                    num_live += 1
+
+                # Early exit: log probabilities only decrease, so a live
+                # hypothesis scores at best its current score under the
+                # largest length penalty
+                best_finished = max([s for s, _ in finished[sentence]],
+                                    default=-np.inf)
+                best_live = new_scores[i].max() / length_penalty(
+                    self.max_length, alpha)
+                done[i] = (len(finished[sentence]) >= beam_size or
+                           best_finished >= best_live)
+
+            tar = np.concatenate([tar[new_rows.ravel()],
+                                  new_tokens.reshape(-1, 1)], axis=1)
+            scores = new_scores
+
+            # Compact finished sentences (all of their beams) out of the
+            # active batch
+            if done.any():
+                keep = ~done
+                keep_rows = np.repeat(keep, beam_size)
+                active, scores = active[keep], scores[keep]
+                tar, inp = tar[keep_rows], trim_padding(inp[keep_rows])
+                enc_output = enc_output[keep_rows, :inp.shape[1]]
+                if not len(active):
+                    break
+
+        # Sentences that hit max_length fall back to their live beams
+        for i, sentence in enumerate(active):
+            for beam in range(beam_size):
+                if np.isfinite(scores[i, beam]):
+                    finished[sentence].append(
+                        (scores[i, beam] / length_penalty(tar.shape[1] - 1, alpha),
+                         tar[i * beam_size + beam, 1:].tolist()))
+
+        return [max(hypotheses, key=lambda h: h[0])[1] if hypotheses else []
+                for hypotheses in finished]
+
+
+def bleu_statistics(hypothesis, reference, max_order=4):
+    '''n-gram matches, n-gram totals and lengths of one tokenized sentence
+       pair, as one array that can be summed over a corpus'''
+    statistics = np.zeros(2 * max_order + 2, dtype=np.int64)
+    for n in range(1, max_order + 1):
+        hyp_ngrams = collections.Counter(
+            tuple(hypothesis[i:i + n]) for i in range(len(hypothesis) - n + 1))
+        ref_ngrams = collections.Counter(
+            tuple(reference[i:i + n]) for i in range(len(reference) - n + 1))
+        statistics[n - 1] = sum((hyp_ngrams & ref_ngrams).values())
+        statistics[max_order + n - 1] = max(len(hypothesis) - n + 1, 0)
+    statistics[-2:] = len(hypothesis), len(reference)
+    return statistics
+
+
+def bleu_from_statistics(statistics, max_order=4):
+    '''Corpus BLEU from summed bleu_statistics'''
+    matches = statistics[:max_order]
+    totals = statistics[max_order:2 * max_order]
+    hyp_length, ref_length = statistics[-2:]
+    if min(matches) == 0:
+        return 0.0
+    log_precision = sum(np.log(m / t) for m, t in zip(matches, totals)) / max_order
+    brevity_penalty = min(1.0, np.exp(1 - ref_length / max(hyp_length, 1)))
+    return float(100 * brevity_penalty * np.exp(log_precision))
+
+
+def corpus_bleu(hypotheses, references, max_order=4):
+    '''Corpus level BLEU (single reference, uniform n-gram weights and
+       brevity penalty) of tokenized hypotheses against references'''
+    statistics = np.zeros(2 * max_order + 2, dtype=np.int64)
+    for hypothesis, reference in zip(hypotheses, references):
+        statistics += bleu_statistics(hypothesis, reference, max_order)
+    return bleu_from_statistics(statistics, max_order)
+
+
+def load_validation_set(data, max_sentences=None):
+    '''(pt ids, en ids) pairs of the validation split, padding removed'''
+    with tf.device('/cpu:0'):
+        next_batch = data.val_dataset.make_one_shot_iterator().get_next()
+    pairs = list()
+    with tf.Session() as sess:
+        while not max_sentences or len(pairs) < max_sentences:
+            try:
+                pt_batch, en_batch = sess.run(next_batch)
+            except tf.errors.OutOfRangeError:
+                break
+            pairs.extend((pt[pt > 0], en[en > 0])
+                         for pt, en in zip(pt_batch, en_batch))
+    return pairs[:max_sentences] if max_sentences else pairs
+
+
+def length_sorted_batches(pairs, batch_size):
+    '''Padded input batches of sentences of similar length, which keeps
+       padding to a minimum, with the matching reference id lists'''
+    pairs = sorted(pairs, key=lambda pair: len(pair[0]))
+    batches = list()
+    for start in range(0, len(pairs), batch_size):
+        batch = pairs[start:start + batch_size]
+        width = max(len(pt) for pt, _ in batch)
+        inputs = np.stack([np.pad(pt, (0, width - len(pt)), 'constant')
+                           for pt, _ in batch])
+        batches.append((inputs, [en for _, en in batch]))
+    return batches
+
+
+def ids_to_text(tokenizer, ids):
+    '''Text of a sequence of token ids, leaving out the padding (0) and
+       the start and end tokens (tokenizer.vocab_size and above)'''
+    return tokenizer.decode([int(i) for i in ids
+                             if 0 < i < tokenizer.vocab_size])
+
+
+def evaluate(decoder, batches, tokenizer_en, method='greedy', beam_size=4,
+             alpha=0.6):
+    '''Decode every batch, returning the decoded sentences, the decoding
+       throughput in sentences/sec and the BLEU score'''
+    outputs, references = list(), list()
+    start_time = time.time()
+    for inputs, targets in batches:
+        if method == 'greedy':
+            outputs.extend(decoder.greedy(inputs))
+        else:
+            outputs.extend(decoder.beam_search(inputs, beam_size=beam_size,
+                                               alpha=alpha))
+        references.extend(targets)
+    elapsed = time.time() - start_time
+
+    sentences = [ids_to_text(tokenizer_en, ids) for ids in outputs]
+    bleu = corpus_bleu([s.split() for s in sentences],
+                       [ids_to_text(tokenizer_en, ids).split()
+                        for ids in references])
+    return sentences, len(outputs) / elapsed, bleu
+
+
+def main(flags):
+    from ann import Model
+    from Dataset.dataset_generator_porteng_translate import DatasetGenerator_PtToEng
+
+    data = DatasetGenerator_PtToEng(batch_size=flags.batch_size,
+                                    vocab_file_prefix=flags.vocab_file_prefix)
+    tokenizer_en = data.tokenizer_en
+
+    # Pull the validation set up front so that only decoding is timed
+    batches = length_sorted_batches(
+        load_validation_set(data, flags.max_sentences), flags.batch_size)
+
+    model = Model(input_size=data.tokenizer_pt.vocab_size + 2,
+                  label_size=tokenizer_en.vocab_size + 2,
+                  batch_size=flags.batch_size, learning_rate=0.0,
+                  d_model=flags.dim_model, num_heads=flags.num_heads,
+                  num_layers=flags.num_layers, dff=flags.dff)
+
+    with tf.Session() as sess:
+        decoder = TransformerDecoder(model, sess,
+                                     start_token=tokenizer_en.vocab_size,
+                                     end_token=tokenizer_en.vocab_size + 1,
+                                     max_length=flags.max_length)
+        checkpoint_path = tf.train.latest_checkpoint(flags.checkpoint_dir)
+        tf.train.Saver(tf.global_variables()).restore(sess, checkpoint_path)
+        print("Restored " + checkpoint_path)
+
+        for method in flags.methods:
+            sentences, sentences_per_second, bleu = evaluate(
+                decoder, batches, tokenizer_en, method, flags.beam_size,
+                flags.alpha)
+            print("{0}: {1} sentences, {2:.1f} sentences/s, BLEU {3:.2f}".format(
+                method, len(sentences), sentences_per_second, bleu))
+
+            if flags.output_dir:
+                os.makedirs(flags.output_dir, exist_ok=True)
+                output_file = os.path.join(flags.output_dir, method + '.txt')
+                with open(output_file, 'w') as of:
+                    for sentence in sentences:
+                        of.write(sentence + '\n')
+
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser()
+
+    parser.add_argument('--checkpoint_dir', type=str,
+                        default='checkpoints',
+                        help="Directory holding the trained checkpoints")
+
+    parser.add_argument('--vocab_file_prefix', type=str,
+                        default=None,
+                        help="Where the subword vocabularies were saved")
+
+    parser.add_argument('--methods', nargs='+',
+                        choices=['greedy', 'beam'],
+                        default=['greedy', 'beam'],
+                        help="Decoding methods to run")
+
+    parser.add_argument('--beam_size', type=int,
+                        default=4,
+                        help="Number of hypotheses kept per sentence")
+
+    parser.add_argument('--alpha', type=float,
+                        default=0.6,
+                        help="Length penalty exponent (0 disables it)")
+
+    parser.add_argument('--max_length', type=int,
+                        default=40,
+                        help="Maximum number of generated tokens")
+
+    parser.add_argument('--max_sentences', type=int,
+                        default=None,
+                        help="Only decode the first max_sentences sentences")
+
+    parser.add_argument('--batch_size', type=int,
+                        default=64,
+                        help="Sentences decoded together")
+
+    parser.add_argument('--output_dir', type=str,
+                        default=None,
+                        help="Where to write the decoded sentences")
+
+    parser.add_argument('--dim_model', type=int,
+                        default=512,
+                        help="Dimension of embeddings")
+
+    parser.add_argument('--num_layers', type=int,
+                        default=6,
+                        help="Number of transformer layers")
+
+    parser.add_argument('--dff', type=int,
+                        default=2048,
+                        help="Dimensionality of the inner layer")
+
+    parser.add_argument('--num_heads', type=int,
+                        default=8,
+                        help="Number of parallel attention layers")
+
+    parsed_flags, _ = parser.parse_known_args()
+
+    main(parsed_flags)
@@ -0,0 +1,303 @@
+"""
+Export a trained transformer checkpoint as a frozen, pruned inference
+graph.
+
+The decoding graph of decoding.TransformerDecoder is built without
+dropout and with constant look ahead masks (Model(static_masks=True)),
+the checkpoint variables are frozen into constants, and everything not
+needed by the two signatures below is pruned: initializers, savers,
+summaries, tf.Print/Assert/CheckNumerics nodes and identities. The
+positional encoding table, the mask table and every other subgraph that
+only depends on constants are then folded.
+
+    encode       inputs: inp (int64 [batch, inp_len])
+                 outputs: enc_output (float32 [batch, inp_len, d_model])
+    decode_step  inputs: inp, enc_output, tar (int64 [batch, tar_len])
+                 outputs: log_probs (float32 [batch, vocab]) of the next token
+
+The frozen GraphDef is written to <export_dir>/frozen_graph.pb and a
+SavedModel with the same signatures to <export_dir>/saved_model. With
+--compare, load time and single sentence greedy decoding latency of the
+exported graph are compared against building the graph from ann.py and
+restoring the checkpoint.
+
+    python export_model.py --checkpoint_dir checkpoints --vocab_file_prefix vocab --compare
+"""
+
+import argparse
+import os
+import statistics
+import time
+
+from decoding import TransformerDecoder
+from lazy_import import lazy_import
+
+tf = lazy_import('tensorflow')
+np = lazy_import('numpy')
+
+
+# Names of the signature tensors, as given by TransformerDecoder
+INPUT_NAMES = {'inp': 'decode_inp', 'enc_output': 'decode_enc_output',
+               'tar': 'decode_tar'}
+OUTPUT_NAMES = {'enc_output': 'encoder_output', 'log_probs': 'decode_log_probs'}
+
+# Debugging and checking ops that only forward their first input
+PASSTHROUGH_OPS = ('Print', 'CheckNumerics', 'Identity', 'StopGradient')
+# Checking and logging ops that control dependencies can safely skip
+CHECK_OPS = ('Assert', 'Print')
+
+
+def build_model(flags, vocab_size_pt, vocab_size_en, static_masks):
+    from ann import Model
+    return Model(input_size=vocab_size_pt + 2, label_size=vocab_size_en + 2,
+                 batch_size=1, learning_rate=0.0, d_model=flags.dim_model,
+                 num_heads=flags.num_heads, num_layers=flags.num_layers,
+                 dff=flags.dff, max_position=flags.max_position,
+                 static_masks=static_masks)
+
+
+def strip_passthrough_nodes(graph_def, keep_names):
+    '''Rewire the consumers of tf.Print, CheckNumerics, Identity and
+       StopGradient nodes to the node's input and drop the node. Control
+       inputs on the dropped nodes and on Assert and Print nodes are
+       removed, which leaves asserts unreachable so pruning drops them;
+       every other control input is kept.
+    '''
+    from tensorflow.core.framework import graph_pb2
+
+    forward = dict()
+    check_nodes = set()
+    for node in graph_def.node:
+        if node.op in PASSTHROUGH_OPS and node.name not in keep_names:
+            forward[node.name] = node.input[0]
+        if node.op in CHECK_OPS:
+            check_nodes.add(node.name)
+
+    def resolve(name):
+        while name.split(':')[0] in forward:
+            name = forward[name.split(':')[0]]
+        return name
+
+    stripped = graph_pb2.GraphDef()
+    stripped.versions.CopyFrom(graph_def.versions)
+    for node in graph_def.node:
+        if node.name in forward:
+            continue
+        new_node = stripped.node.add()
+        new_node.CopyFrom(node)
+        del new_node.input[:]
+        new_node.input.extend([resolve(i) for i in node.input
+                               if not i.startswith('^')])
+        new_node.input.extend([i for i in node.input if i.startswith('^') and
+                               i[1:] not in forward and
+                               i[1:] not in check_nodes])
+    return stripped
+
+
+def freeze_graph(sess, output_names):
+    '''Frozen, pruned and constant folded GraphDef of the session graph'''
+    graph_def = tf.graph_util.convert_variables_to_constants(
+        sess, sess.graph.as_graph_def(), output_names)
+    graph_def = strip_passthrough_nodes(
+        graph_def, set(output_names) | set(INPUT_NAMES.values()))
+    graph_def = tf.graph_util.extract_sub_graph(graph_def, output_names)
+
+    from tensorflow.tools.graph_transforms import TransformGraph
+    return TransformGraph(graph_def, list(INPUT_NAMES.values()), output_names,
+                          ['fold_constants(ignore_errors=true)',
+                           'strip_unused_nodes',
+                           'sort_by_execution_order'])
+
+
+def write_saved_model(graph_def, export_dir):
+    '''SavedModel holding the frozen graph with the fixed signatures'''
+    graph = tf.Graph()
+    with graph.as_default():
+        tf.import_graph_def(graph_def, name='')
+    tensor = lambda name: graph.get_tensor_by_name(name + ':0')
+
+    signatures = {
+        'encode': tf.saved_model.signature_def_utils.predict_signature_def(
+            inputs={'inp': tensor(INPUT_NAMES['inp'])},
+            outputs={'enc_output': tensor(OUTPUT_NAMES['enc_output'])}),
+        'decode_step': tf.saved_model.signature_def_utils.predict_signature_def(
+            inputs={k: tensor(v) for k, v in INPUT_NAMES.items()},
+            outputs={'log_probs': tensor(OUTPUT_NAMES['log_probs'])}),
+    }
+    with tf.Session(graph=graph) as sess:
+        builder = tf.saved_model.builder.SavedModelBuilder(export_dir)
+        builder.add_meta_graph_and_variables(
+            sess, [tf.saved_model.tag_constants.SERVING],
+            signature_def_map=signatures)
+        builder.save()
+
+
+class FrozenTransformerDecoder(TransformerDecoder):
+    '''TransformerDecoder running on an exported graph instead of one built
+       from ann.py'''
+
+    def __init__(self, sess, start_token, end_token, max_length=40):
+        self.sess = sess
+        self.start_token = start_token
+        self.end_token = end_token
+        self.max_length = max_length
+        tensor = lambda name: sess.graph.get_tensor_by_name(name + ':0')
+        self.inp = tensor(INPUT_NAMES['inp'])
+        self.enc_output_in = tensor(INPUT_NAMES['enc_output'])
+        self.tar = tensor(INPUT_NAMES['tar'])
+        self.enc_output = tensor(OUTPUT_NAMES['enc_output'])
+        self.log_probs = tensor(OUTPUT_NAMES['log_probs'])
+
+
+def load_checkpoint_decoder(flags, vocab_size_pt, vocab_size_en):
+    '''Build the decoding graph from ann.py and restore the checkpoint'''
+    graph = tf.Graph()
+    with graph.as_default():
+        model = build_model(flags, vocab_size_pt, vocab_size_en,
+                            static_masks=False)
+        sess = tf.Session(graph=graph)
+        decoder = TransformerDecoder(model, sess, vocab_size_en,
+                                     vocab_size_en + 1, flags.max_length)
+        tf.train.Saver(tf.global_variables()).restore(
+            sess, tf.train.latest_checkpoint(flags.checkpoint_dir))
+    return decoder
+
+
+def load_frozen_decoder(flags, graph_path, vocab_size_en):
+    '''Import the exported GraphDef'''
+    graph_def = tf.GraphDef()
+    with tf.gfile.GFile(graph_path, 'rb') as gf:
+        graph_def.ParseFromString(gf.read())
+    graph = tf.Graph()
+    with graph.as_default():
+        tf.import_graph_def(graph_def, name='')
+    sess = tf.Session(graph=graph)
+    return FrozenTransformerDecoder(sess, vocab_size_en, vocab_size_en + 1,
+                                    flags.max_length)
+
+
+def compare(flags, graph_path, vocab_size_pt, vocab_size_en):
+    '''Print load time and per request latency of both graphs'''
+    rng = np.random.RandomState(0)
+    requests = [np.concatenate([[vocab_size_pt],
+                                rng.randint(1, vocab_size_pt, size=length),
+                                [vocab_size_pt + 1]])[np.newaxis, :]
+                for length in rng.randint(5, flags.max_length - 2,
+                                          size=flags.num_requests)]
+
+    loaders = [('checkpoint', lambda: load_checkpoint_decoder(
+                    flags, vocab_size_pt, vocab_size_en)),
+               ('frozen', lambda: load_frozen_decoder(
+                    flags, graph_path, vocab_size_en))]
+    for name, loader in loaders:
+        start_time = time.perf_counter()
+        decoder = loader()
+        # The first run pays for graph optimization, so it counts as load
+        decoder.greedy(requests[0])
+        load_time = time.perf_counter() - start_time
+
+        latencies = list()
+        for inp in requests:
+            start_time = time.perf_counter()
+            decoder.greedy(inp)
+            latencies.append(time.perf_counter() - start_time)
+        num_nodes = len(decoder.sess.graph.as_graph_def().node)
+        decoder.sess.close()
+
+        print("{0:>10}: {1:6d} nodes, load {2:7.3f} s, latency p50 {3:7.2f} ms, "
+              "p99 {4:7.2f} ms".format(
+                  name, num_nodes, load_time,
+                  1000 * statistics.median(latencies),
+                  1000 * float(np.percentile(latencies, 99))))
+
+
+def main(flags):
+    import tensorflow_datasets as tfds
+
+    # The subword vocabularies saved by DatasetGenerator_PtToEng
+    encoder = tfds.features.text.SubwordTextEncoder
+    vocab_size_en = encoder.load_from_file(
+        flags.vocab_file_prefix + '_en').vocab_size
+    vocab_size_pt = encoder.load_from_file(
+        flags.vocab_file_prefix + '_pt').vocab_size
+
+    output_names = list(OUTPUT_NAMES.values())
+    with tf.Graph().as_default():
+        model = build_model(flags, vocab_size_pt, vocab_size_en,
+                            static_masks=True)
+        with tf.Session() as sess:
+            TransformerDecoder(model, sess, vocab_size_en, vocab_size_en + 1)
+            checkpoint_path = tf.train.latest_checkpoint(flags.checkpoint_dir)
+            tf.train.Saver(tf.global_variables()).restore(sess, checkpoint_path)
+            num_nodes = len(sess.graph.as_graph_def().node)
+            graph_def = freeze_graph(sess, output_names)
+
+    print("Froze {0}: {1} nodes -> {2} nodes".format(
+        checkpoint_path, num_nodes, len(graph_def.node)))
+
+    tf.gfile.MakeDirs(flags.export_dir)
+    graph_path = os.path.join(flags.export_dir, 'frozen_graph.pb')
+    with tf.gfile.GFile(graph_path, 'wb') as gf:
+        gf.write(graph_def.SerializeToString())
+    saved_model_dir = os.path.join(flags.export_dir, 'saved_model')
+    if tf.gfile.Exists(saved_model_dir):
+        tf.gfile.DeleteRecursively(saved_model_dir)
+    write_saved_model(graph_def, saved_model_dir)
+    print("Wrote " + graph_path + " and " + saved_model_dir)
+
+    if flags.compare:
+        compare(flags, graph_path, vocab_size_pt, vocab_size_en)
+
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser()
+
+    parser.add_argument('--checkpoint_dir', type=str,
+                        default='checkpoints',
+                        help="Directory holding the trained checkpoints")
+
+    parser.add_argument('--vocab_file_prefix', type=str,
+                        required=True,
+                        help="Where the subword vocabularies were saved")
+
+    parser.add_argument('--export_dir', type=str,
+                        default='export',
+                        help="Where to write the frozen graph and SavedModel")
+
+    parser.add_argument('--max_position', type=int,
+                        default=64,
+                        help="Longest sequence the exported graph accepts; "
+                             "sizes the constant position and mask tables")
+
+    parser.add_argument('--compare', action='store_true',
+                        default=False,
+                        help="Compare load time and latency with the checkpoint graph")
+
+    parser.add_argument('--num_requests', type=int,
+                        default=100,
+                        help="Single sentence requests timed by --compare")
+
+    parser.add_argument('--max_length', type=int,
+                        default=40,
+                        help="Maximum number of generated tokens")
+
+    parser.add_argument('--dim_model', type=int,
+                        default=512,
+                        help="Dimension of embeddings")
+
+    parser.add_argument('--num_layers', type=int,
+                        default=6,
+                        help="Number of transformer layers")
+
+    parser.add_argument('--dff', type=int,
+                        default=2048,
+                        help="Dimensionality of the inner layer")
+
+    parser.add_argument('--num_heads', type=int,
+                        default=8,
+                        help="Number of parallel attention layers")
+
+    parsed_flags, _ = parser.parse_known_args()
+
+    main(parsed_flags)
@@ -0,0 +1,373 @@
+"""
+Local HTTP inference server for Pt->En translation with dynamic
+micro-batching.
+
+Requests are queued, and a single batching thread turns them into
+batches: once a request arrives it waits at most --max_latency_ms for
+more, then runs the decoder once for up to --max_batch_size requests of
+similar length. Requests are bucketed by token length so that short
+sentences are not padded out to the longest one in the queue.
+
+    python inference_server.py --checkpoint_dir checkpoints --vocab_file_prefix vocab
+
+    POST /translate   {"text": "..."}  ->  {"translation": "..."}
+    GET  /metrics     p50/p99 latency, throughput and batch sizes
+"""
+
+import argparse
+import collections
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from lazy_import import lazy_import
+
+tf = lazy_import('tensorflow')
+np = lazy_import('numpy')
+
+
+class PendingRequest(object):
+    '''A queued request, completed by the batching thread'''
+
+    def __init__(self, token_ids):
+        self.token_ids = token_ids
+        self.arrival_time = time.time()
+        self.result = None
+        self.error = None
+        self._done = threading.Event()
+
+    def set_result(self, result=None, error=None):
+        self.result, self.error = result, error
+        self._done.set()
+
+    def wait(self, timeout=None):
+        if not self._done.wait(timeout):
+            raise TimeoutError("Request was not served in time")
+        if self.error is not None:
+            raise self.error
+        return self.result
+
+
+class ServingMetrics(object):
+    '''Rolling latency, throughput and batch size statistics over the
+       last window requests'''
+
+    def __init__(self, window=10000):
+        self._lock = threading.Lock()
+        self.latencies = collections.deque(maxlen=window)
+        self.completion_times = collections.deque(maxlen=window)
+        self.batch_sizes = collections.deque(maxlen=window)
+        self.num_requests = 0
+        self.num_batches = 0
+
+    def record_batch(self, requests, finish_time):
+        with self._lock:
+            self.num_batches += 1
+            self.num_requests += len(requests)
+            self.batch_sizes.append(len(requests))
+            for request in requests:
+                self.latencies.append(finish_time - request.arrival_time)
+                self.completion_times.append(finish_time)
+
+    def summary(self):
+        with self._lock:
+            latencies = np.array(self.latencies) * 1000
+            completion_times = list(self.completion_times)
+            batch_sizes = list(self.batch_sizes)
+            summary = {'num_requests': self.num_requests,
+                       'num_batches': self.num_batches}
+        if len(latencies):
+            summary['p50_latency_ms'] = float(np.percentile(latencies, 50))
+            summary['p99_latency_ms'] = float(np.percentile(latencies, 99))
+            summary['mean_batch_size'] = float(np.mean(batch_sizes))
+        if len(completion_times) > 1:
+            elapsed = completion_times[-1] - completion_times[0]
+            if elapsed > 0:
+                summary['requests_per_second'] = (len(completion_times) - 1) / elapsed
+        return summary
+
+
+class DynamicBatcher(object):
+    '''Groups queued requests into length bucketed batches and runs
+       decode_fn once per batch on a background thread.
+
+       Parameters:
+           decode_fn (callable): maps a padded (batch_size, length) array of
+                                 input ids to a list of outputs
+           max_batch_size (int): largest batch handed to decode_fn
+           max_latency_ms (float): longest a request waits for its batch to
+                                   fill up before the batch is run anyway
+           bucket_width (int): requests whose lengths fall in the same
+                               bucket_width wide range are batched together
+    '''
+
+    def __init__(self, decode_fn, max_batch_size=32, max_latency_ms=10.0,
+                 bucket_width=8, metrics=None):
+        self.decode_fn = decode_fn
+        self.max_batch_size = max_batch_size
+        self.max_latency = max_latency_ms / 1000.0
+        self.bucket_width = bucket_width
+        self.metrics = metrics or ServingMetrics()
+        self._buckets = collections.OrderedDict()
+        self._condition = threading.Condition()
+        self._stopped = False
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def submit(self, token_ids):
+        '''Queue one request, returning a PendingRequest to wait on.
+           Raises RuntimeError once the batcher has been stopped'''
+        request = PendingRequest(token_ids)
+        bucket = len(token_ids) // self.bucket_width
+        with self._condition:
+            if self._stopped:
+                raise RuntimeError("Batcher is stopped")
+            self._buckets.setdefault(bucket, collections.deque()).append(request)
+            self._condition.notify()
+        return request
+
+    def stop(self):
+        '''Stop the batching thread. The batch being decoded still
+           completes; every request still queued fails right away instead
+           of waiting out its timeout'''
+        with self._condition:
+            self._stopped = True
+            queued = [request for queue in self._buckets.values()
+                      for request in queue]
+            self._buckets.clear()
+            self._condition.notify()
+        error = RuntimeError("Batcher stopped before serving the request")
+        for request in queued:
+            request.set_result(error=error)
+        self._thread.join()
+
+    def _next_batch(self):
+        '''Block until a batch is ready: the bucket holding the oldest
+           request, once it is full or that request has waited long enough
+        '''
+        with self._condition:
+            while True:
+                if self._stopped:
+                    return None
+                if not self._buckets:
+                    self._condition.wait()
+                    continue
+
+                # A full bucket runs right away, otherwise the bucket with
+                # the oldest request runs once that request's wait is over
+                full = [kv for kv in self._buckets.items()
+                        if len(kv[1]) >= self.max_batch_size]
+                bucket, queue = full[0] if full else min(
+                    self._buckets.items(), key=lambda kv: kv[1][0].arrival_time)
+                deadline = queue[0].arrival_time + self.max_latency
+                remaining = deadline - time.time()
+                if len(queue) < self.max_batch_size and remaining > 0:
+                    self._condition.wait(remaining)
+                    continue
+
+                batch = [queue.popleft() for _ in
+                         range(min(len(queue), self.max_batch_size))]
+                if not queue:
+                    del self._buckets[bucket]
+                return batch
+
+    def _run(self):
+        while True:
+            batch = self._next_batch()
+            if batch is None:
+                return
+            width = max(len(request.token_ids) for request in batch)
+            inputs = np.zeros((len(batch), width), dtype=np.int64)
+            for row, request in enumerate(batch):
+                inputs[row, :len(request.token_ids)] = request.token_ids
+            try:
+                outputs = self.decode_fn(inputs)
+            except Exception as e:
+                for request in batch:
+                    request.set_result(error=e)
+                continue
+            self.metrics.record_batch(batch, time.time())
+            for request, output in zip(batch, outputs):
+                request.set_result(output)
+
+
+class TranslationServer(ThreadingHTTPServer):
+    '''Threaded HTTP server carrying the batcher, the tokenizers and the
+       request timeout for its handlers'''
+    # Bursts of clients connecting at once would otherwise overflow the
+    # listen backlog and wait on SYN retransmits
+    request_queue_size = 128
+    daemon_threads = True
+
+
+class TranslationHandler(BaseHTTPRequestHandler):
+    '''POST /translate and GET /metrics'''
+    # Keep-alive, so clients do not pay a new connection per request, and
+    # no Nagle delay between the headers and the body of a response
+    protocol_version = 'HTTP/1.1'
+    disable_nagle_algorithm = True
+
+    def _send_json(self, status, payload):
+        body = json.dumps(payload).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        if self.path == '/metrics':
+            self._send_json(200, self.server.batcher.metrics.summary())
+        else:
+            self._send_json(404, {'error': 'not found'})
+
+    def do_POST(self):
+        if self.path != '/translate':
+            self._send_json(404, {'error': 'not found'})
+            return
+        try:
+            length = int(self.headers.get('Content-Length', 0))
+            text = json.loads(self.rfile.read(length).decode('utf-8'))['text']
+        except (ValueError, KeyError, TypeError):
+            self._send_json(400, {'error': 'expected {"text": "..."}'})
+            return
+
+        tokenizer_pt = self.server.tokenizer_pt
+        token_ids = ([tokenizer_pt.vocab_size] + tokenizer_pt.encode(text) +
+                     [tokenizer_pt.vocab_size + 1])
+        try:
+            output = self.server.batcher.submit(token_ids).wait(
+                self.server.request_timeout)
+        except Exception as e:
+            self._send_json(500, {'error': str(e)})
+            return
+
+        tokenizer_en = self.server.tokenizer_en
+        translation = tokenizer_en.decode(
+            [i for i in output if i < tokenizer_en.vocab_size])
+        self._send_json(200, {'translation': translation})
+
+    def log_message(self, format, *args):
+        # Per request logging would dominate the cost of small requests
+        pass
+
+
+def main(flags):
+    import tensorflow_datasets as tfds
+    from ann import Model
+    from decoding import TransformerDecoder
+
+    # The subword vocabularies saved by DatasetGenerator_PtToEng
+    encoder = tfds.features.text.SubwordTextEncoder
+    tokenizer_en = encoder.load_from_file(flags.vocab_file_prefix + '_en')
+    tokenizer_pt = encoder.load_from_file(flags.vocab_file_prefix + '_pt')
+
+    model = Model(input_size=tokenizer_pt.vocab_size + 2,
+                  label_size=tokenizer_en.vocab_size + 2,
+                  batch_size=flags.max_batch_size, learning_rate=0.0,
+                  d_model=flags.dim_model, num_heads=flags.num_heads,
+                  num_layers=flags.num_layers, dff=flags.dff)
+
+    sess = tf.Session()
+    decoder = TransformerDecoder(model, sess,
+                                 start_token=tokenizer_en.vocab_size,
+                                 end_token=tokenizer_en.vocab_size + 1,
+                                 max_length=flags.max_length)
+    checkpoint_path = tf.train.latest_checkpoint(flags.checkpoint_dir)
+    tf.train.Saver(tf.global_variables()).restore(sess, checkpoint_path)
+    print("Restored " + checkpoint_path)
+
+    if flags.beam_size > 1:
+        decode_fn = lambda inp: decoder.beam_search(
+            inp, beam_size=flags.beam_size, alpha=flags.alpha)
+    else:
+        decode_fn = decoder.greedy
+
+    server = TranslationServer((flags.host, flags.port), TranslationHandler)
+    server.batcher = DynamicBatcher(decode_fn,
+                                    max_batch_size=flags.max_batch_size,
+                                    max_latency_ms=flags.max_latency_ms,
+                                    bucket_width=flags.bucket_width)
+    server.tokenizer_en = tokenizer_en
+    server.tokenizer_pt = tokenizer_pt
+    server.request_timeout = flags.request_timeout
+    print("Serving on http://{0}:{1}".format(flags.host, flags.port))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        server.batcher.stop()
+        sess.close()
+        print(json.dumps(server.batcher.metrics.summary(), indent=2))
+
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser()
+
+    parser.add_argument('--host', type=str,
+                        default='127.0.0.1',
+                        help="Address to listen on")
+
+    parser.add_argument('--port', type=int,
+                        default=8500,
+                        help="Port to listen on")
+
+    parser.add_argument('--checkpoint_dir', type=str,
+                        default='checkpoints',
+                        help="Directory holding the trained checkpoints")
+
+    parser.add_argument('--vocab_file_prefix', type=str,
+                        required=True,
+                        help="Where the subword vocabularies were saved")
+
+    parser.add_argument('--max_batch_size', type=int,
+                        default=32,
+                        help="Largest number of requests decoded together")
+
+    parser.add_argument('--max_latency_ms', type=float,
+                        default=10.0,
+                        help="Longest a request waits for its batch to fill up")
+
+    parser.add_argument('--bucket_width', type=int,
+                        default=8,
+                        help="Width in tokens of the length buckets")
+
+    parser.add_argument('--request_timeout', type=float,
+                        default=30.0,
+                        help="Seconds before a queued request fails")
+
+    parser.add_argument('--beam_size', type=int,
+                        default=1,
+                        help="Beam size; 1 uses greedy decoding")
+
+    parser.add_argument('--alpha', type=float,
+                        default=0.6,
+                        help="Length penalty exponent for beam search")
+
+    parser.add_argument('--max_length', type=int,
+                        default=40,
+                        help="Maximum number of generated tokens")
+
+    parser.add_argument('--dim_model', type=int,
+                        default=512,
+                        help="Dimension of embeddings")
+
+    parser.add_argument('--num_layers', type=int,
+                        default=6,
+                        help="Number of transformer layers")
+
+    parser.add_argument('--dff', type=int,
+                        default=2048,
+                        help="Dimensionality of the inner layer")
+
+    parser.add_argument('--num_heads', type=int,
+                        default=8,
+                        help="Number of parallel attention layers")
+
+    parsed_flags, _ = parser.parse_known_args()
+
+    main(parsed_flags)
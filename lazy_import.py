@@ -0,0 +1,23 @@
+import importlib.util
+import sys
+
+
+def lazy_import(name):
+    '''Import a module whose body only runs on first attribute access.
+       Heavy dependencies (TensorFlow, NumPy, ...) imported this way cost
+       nothing until a code path actually uses them, so entry points can
+       parse arguments and print help without paying for them.
+
+       Recipe from https://docs.python.org/3/library/importlib.html
+    '''
+    if name in sys.modules:
+        return sys.modules[name]
+    spec = importlib.util.find_spec(name)
+    if spec is None:
+        raise ImportError("No module named '{}'".format(name))
+    loader = importlib.util.LazyLoader(spec.loader)
+    spec.loader = loader
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[name] = module
+    loader.exec_module(module)
+    return module
@@ -0,0 +1,230 @@
+"""
+Post-training int8 weight quantization of a trained transformer
+checkpoint for CPU inference.
+
+The weights of the attention projections (wq, wk, wv, wo) and of the
+feed forward layers (fc1, fc2), and optionally the output projection,
+are quantized symmetrically per output channel:
+
+    scale[j] = max_i |W[i, j]| / 127,    W_int8 = round(W / scale)
+
+and written to a new checkpoint that Model(int8_layers=...) restores.
+Embeddings, biases, layer norm and softmax stay in float32.
+
+The float and int8 models are then both used to decode the Pt->En
+validation split, and the BLEU drop, speedup and weight memory are
+reported:
+
+    python quantize_model.py --checkpoint_dir checkpoints \\
+        --output_dir checkpoints_int8 --vocab_file_prefix vocab
+"""
+
+import argparse
+import json
+import os
+
+from lazy_import import lazy_import
+
+tf = lazy_import('tensorflow')
+np = lazy_import('numpy')
+
+
+# fc layers whose weights dominate the memory traffic of inference
+QUANTIZED_LAYERS = ('wq', 'wk', 'wv', 'wo', 'fc1', 'fc2')
+
+
+def quantize_per_channel(weights):
+    '''Symmetric int8 quantization with one scale per output column
+
+       :return: int8 weights and float32 scales of shape (num_out,)
+    '''
+    scales = np.abs(weights).max(axis=0) / 127.0
+    scales = np.where(scales > 0, scales, 1.0).astype(np.float32)
+    quantized = np.clip(np.round(weights / scales), -127, 127).astype(np.int8)
+    return quantized, scales
+
+
+def build_decoder(flags, sess, vocab_size_pt, vocab_size_en, int8_layers=()):
+    from ann import Model
+    from decoding import TransformerDecoder
+
+    model = Model(input_size=vocab_size_pt + 2, label_size=vocab_size_en + 2,
+                  batch_size=flags.batch_size, learning_rate=0.0,
+                  d_model=flags.dim_model, num_heads=flags.num_heads,
+                  num_layers=flags.num_layers, dff=flags.dff,
+                  int8_layers=int8_layers)
+    return TransformerDecoder(model, sess, start_token=vocab_size_en,
+                              end_token=vocab_size_en + 1,
+                              max_length=flags.max_length)
+
+
+def quantize_checkpoint(flags, checkpoint_path, vocab_size_pt, vocab_size_en,
+                        int8_layers):
+    '''Write the int8 checkpoint, returning the float and int8 byte counts
+       of the quantized weights'''
+    reader = tf.train.load_checkpoint(checkpoint_path)
+    float_bytes, int8_bytes = 0, 0
+
+    with tf.Graph().as_default(), tf.Session() as sess:
+        build_decoder(flags, sess, vocab_size_pt, vocab_size_en, int8_layers)
+        for var in tf.global_variables():
+            name = var.op.name
+            if name.endswith('/weights_scale'):
+                continue
+            if name.endswith('/weights_int8'):
+                weights = reader.get_tensor(name[:-len('_int8')])
+                quantized, scales = quantize_per_channel(weights)
+                var.load(quantized, sess)
+                scale_name = name[:-len('_int8')] + '_scale'
+                scale_var, = [v for v in tf.global_variables()
+                              if v.op.name == scale_name]
+                scale_var.load(scales, sess)
+                float_bytes += weights.nbytes
+                int8_bytes += quantized.nbytes + scales.nbytes
+            else:
+                var.load(reader.get_tensor(name), sess)
+
+        tf.gfile.MakeDirs(flags.output_dir)
+        tf.train.Saver(tf.global_variables()).save(
+            sess, os.path.join(flags.output_dir, 'model.ckpt'),
+            write_meta_graph=False)
+
+    return float_bytes, int8_bytes
+
+
+def evaluate_checkpoint(flags, checkpoint_path, batches, tokenizer_pt,
+                        tokenizer_en, int8_layers=()):
+    '''Decode the validation batches, returning (sentences/sec, BLEU)'''
+    from decoding import evaluate
+
+    with tf.Graph().as_default(), tf.Session() as sess:
+        decoder = build_decoder(flags, sess, tokenizer_pt.vocab_size,
+                                tokenizer_en.vocab_size, int8_layers)
+        tf.train.Saver(tf.global_variables()).restore(sess, checkpoint_path)
+        # Warm up so graph optimization is not timed
+        decoder.greedy(batches[0][0])
+        _, sentences_per_second, bleu = evaluate(decoder, batches,
+                                                 tokenizer_en, flags.method,
+                                                 flags.beam_size, flags.alpha)
+    return sentences_per_second, bleu
+
+
+def main(flags):
+    from decoding import length_sorted_batches, load_validation_set
+    from Dataset.dataset_generator_porteng_translate import DatasetGenerator_PtToEng
+
+    int8_layers = QUANTIZED_LAYERS
+    if flags.quantize_final_layer:
+        int8_layers += ('final_layer',)
+
+    data = DatasetGenerator_PtToEng(batch_size=flags.batch_size,
+                                    vocab_file_prefix=flags.vocab_file_prefix)
+    tokenizer_pt, tokenizer_en = data.tokenizer_pt, data.tokenizer_en
+    batches = length_sorted_batches(
+        load_validation_set(data, flags.max_sentences), flags.batch_size)
+
+    checkpoint_path = tf.train.latest_checkpoint(flags.checkpoint_dir)
+    float_bytes, int8_bytes = quantize_checkpoint(
+        flags, checkpoint_path, tokenizer_pt.vocab_size,
+        tokenizer_en.vocab_size, int8_layers)
+    int8_checkpoint_path = tf.train.latest_checkpoint(flags.output_dir)
+    print("Quantized {0}: {1:.1f} MiB of weights -> {2:.1f} MiB".format(
+        ', '.join(int8_layers), float_bytes / 2**20, int8_bytes / 2**20))
+
+    float_speed, float_bleu = evaluate_checkpoint(
+        flags, checkpoint_path, batches, tokenizer_pt, tokenizer_en)
+    int8_speed, int8_bleu = evaluate_checkpoint(
+        flags, int8_checkpoint_path, batches, tokenizer_pt, tokenizer_en,
+        int8_layers)
+
+    report = {
+        'layers': list(int8_layers),
+        'num_sentences': sum(len(inputs) for inputs, _ in batches),
+        'float_weight_bytes': float_bytes,
+        'int8_weight_bytes': int8_bytes,
+        'float_bleu': float_bleu,
+        'int8_bleu': int8_bleu,
+        'bleu_drop': float_bleu - int8_bleu,
+        'float_sentences_per_second': float_speed,
+        'int8_sentences_per_second': int8_speed,
+        'speedup': int8_speed / float_speed,
+    }
+    print("{0:>8} {1:>10} {2:>14}".format('', 'BLEU', 'sentences/s'))
+    print("{0:>8} {1:10.2f} {2:14.1f}".format('float32', float_bleu, float_speed))
+    print("{0:>8} {1:10.2f} {2:14.1f}".format('int8', int8_bleu, int8_speed))
+    print("BLEU drop {0:.2f}, speedup {1:.2f}x".format(report['bleu_drop'],
+                                                       report['speedup']))
+
+    if flags.output_json:
+        with open(flags.output_json, 'w') as of:
+            json.dump(report, of, indent=2)
+
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser()
+
+    parser.add_argument('--checkpoint_dir', type=str,
+                        default='checkpoints',
+                        help="Directory holding the trained float checkpoints")
+
+    parser.add_argument('--output_dir', type=str,
+                        default='checkpoints_int8',
+                        help="Where to write the int8 checkpoint")
+
+    parser.add_argument('--vocab_file_prefix', type=str,
+                        required=True,
+                        help="Where the subword vocabularies were saved")
+
+    parser.add_argument('--quantize_final_layer', action='store_true',
+                        default=False,
+                        help="Also quantize the output projection")
+
+    parser.add_argument('--method', type=str,
+                        choices=['greedy', 'beam'],
+                        default='greedy',
+                        help="Decoding method used for the report")
+
+    parser.add_argument('--beam_size', type=int,
+                        default=4,
+                        help="Number of hypotheses kept per sentence")
+
+    parser.add_argument('--alpha', type=float,
+                        default=0.6,
+                        help="Length penalty exponent for beam search")
+
+    parser.add_argument('--max_sentences', type=int,
+                        default=None,
+                        help="Only evaluate the first max_sentences sentences")
+
+    parser.add_argument('--batch_size', type=int,
+                        default=64,
+                        help="Sentences decoded together")
+
+    parser.add_argument('--max_length', type=int,
+                        default=40,
+                        help="Maximum number of generated tokens")
+
+    parser.add_argument('--output_json', type=str,
+                        default=None,
+                        help="Where to save the report")
+
+    parser.add_argument('--dim_model', type=int,
+                        default=512,
+                        help="Dimension of embeddings")
+
+    parser.add_argument('--num_layers', type=int,
+                        default=6,
+                        help="Number of transformer layers")
+
+    parser.add_argument('--dff', type=int,
+                        default=2048,
+                        help="Dimensionality of the inner layer")
+
+    parser.add_argument('--num_heads', type=int,
+                        default=8,
+                        help="Number of parallel attention layers")
+
+    parsed_flags, _ = parser.parse_known_args()
+
+    main(parsed_flags)
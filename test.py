@@ -1,42 +1,233 @@
 import argparse
 import os
-
-
-import tensorflow as tf
-
-
-
+import time
 
 
 def main(flags):
     '''Adopted from Ian W. McQuaid'''
     print("Script starting...")
 
+    # Heavy dependencies are imported here rather than at module level so
+    # that argument parsing (and --help) does not wait on TensorFlow
+    import numpy as np
+    import tensorflow as tf
+    from ann import Model
+    import data_parallel
+    from callbacks.AsyncCheckpointCallback import AsyncCheckpointCallback
+    from callbacks.EarlyStoppingCallback import EarlyStoppingCallback
+    from callbacks.StepProfilerCallback import StepProfilerCallback
+    from callbacks.TensorboardValidationCallback import print_time
+    from callbacks.TranslationValidationCallback import TranslationValidationCallback
+    from decoding import load_validation_set
+    from Dataset.dataset_generator_porteng_translate import DatasetGenerator_PtToEng
+    from Dataset.translation_sources import make_source
+
     # Set the GPUs we want the script to use/see
     print("GPU List = " + str(flags.gpu_list))
     os.environ["CUDA_VISIBLE_DEVICES"] = flags.gpu_list
 
+    # One model replica per worker: the visible GPUs if there are any,
+    # otherwise num_workers virtual CPU devices sharing the cores
+    use_gpus = tf.test.is_gpu_available()
+    num_workers = flags.num_workers
+    if use_gpus and not num_workers:
+        num_workers = len(flags.gpu_list.split(','))
+    num_workers = num_workers or 1
+    devices = data_parallel.worker_devices(num_workers, use_gpus)
+    print("Training on {0} worker(s): {1}".format(num_workers, devices))
+
     with tf.device('/cpu:0'):
+        # The test problem is the small synthetic corpus, which trains
+        # offline on the same data path as the real dataset
         if flags.use_test_problem:
-            # TODO: establish general datapath for test data and real data
-            pass
+            source = make_source('synthetic', num_sentences=10000)
         else:
-            data = DatasetGenerator_PtToEng
-            print("Building generator...")
-            train_generator = iter(data.train_dataset)
-            val_generator = iter(data.val_dataset)
-            print("Generator built.")
+            source = make_source(flags.dataset_source, flags.dataset_dir)
+
+        print("Building generator...")
+        data = DatasetGenerator_PtToEng(
+            target_vocab_size=flags.vocab_size,
+            batch_size=flags.batch_size,
+            num_parallel_calls=flags.num_dataset_threads,
+            vocab_file_prefix=flags.vocab_file_prefix,
+            source=source,
+            num_shards=num_workers)
+        # Every worker reads batches of its own shard of the examples
+        train_iterators, train_init_op = data_parallel.worker_iterators(
+            data.train_datasets, devices, flags.dataset_buffer_size)
+        val_iterators, val_init_op = data_parallel.worker_iterators(
+            [data.val_dataset], devices[:1], flags.dataset_buffer_size)
+        print("Generator built.")
+
+    if flags.run_pipeline_test:
+        pt_batch, en_batch = train_iterators[0].get_next()
+        with tf.Session() as sess:
+            sess.run(train_init_op)
+            pt_batch, en_batch = sess.run([pt_batch, en_batch])
+            print("pt_batch shape = " + str(pt_batch.shape))
+            print("en_batch_shape = " + str(en_batch.shape))
+        return
+
+    # Instantiate the model. Vocabularies are the tokenizer vocabularies
+    # plus the start and end tokens
+    model = Model(input_size=data.tokenizer_pt.vocab_size + 2,
+                  label_size=data.tokenizer_en.vocab_size + 2,
+                  batch_size=flags.batch_size,
+                  learning_rate=flags.learning_rate,
+                  d_model=flags.dim_model,
+                  num_heads=flags.num_heads,
+                  num_layers=flags.num_layers,
+                  dff=flags.dff,
+                  dropout_rate=flags.dropout_rate,
+                  recompute_layers=flags.recompute_layers)
+
+    # Training graph, replicated on every worker with the gradients
+    # averaged across workers before each update
+    with tf.device('/cpu:0'):
+        global_step = tf.train.get_or_create_global_step()
+        learning_rate = model.learning_rate_schedule(global_step,
+                                                     flags.warmup_steps)
+    # With gradient accumulation every optimizer step averages the
+    # gradients of num_accumulation_steps micro-batches per worker, while
+    # only one micro-batch of activations is held in memory
+    if flags.num_accumulation_steps > 1:
+        accumulate_op, apply_op, loss = \
+            data_parallel.build_accumulating_train_op(
+                model, train_iterators, devices,
+                model.optimizer(learning_rate), global_step)
+    else:
+        train_op, loss = data_parallel.build_train_op(
+            model, train_iterators, devices, model.optimizer(learning_rate),
+            global_step)
+
+    # Validation graph sharing the training weights, without dropout
+    (val_loss, val_tokens), = data_parallel.build_tower_losses(
+        model, val_iterators, devices[:1], training=False)
+
+    checkpoint_callback = AsyncCheckpointCallback(
+        flags.checkpoint_dir, save_every_n_steps=flags.checkpoint_every_n_steps)
+    early_stopping_callback = EarlyStoppingCallback(patience=flags.patience)
+    # Every training step goes through the profiler, which only traces the
+    # sampled ones
+    profiler_callback = StepProfilerCallback(
+        os.path.join(flags.profile_dir, flags.run_name),
+        profile_every_n_steps=flags.profile_every_n_steps)
+
+    # BLEU, perplexity, sample translations and attention heatmaps on
+    # (a prefix of) the validation set, logged to TensorBoard
+    summary_writer = tf.summary.FileWriter(
+        os.path.join(flags.log_dir, flags.run_name))
+    translation_callback = None
+    if flags.bleu_max_sentences:
+        # A negative --bleu_max_sentences decodes the whole split
+        max_sentences = (flags.bleu_max_sentences
+                         if flags.bleu_max_sentences > 0 else None)
+        translation_callback = TranslationValidationCallback(
+            model, load_validation_set(data, max_sentences),
+            data.tokenizer_pt, data.tokenizer_en, summary_writer,
+            batch_size=flags.batch_size,
+            num_samples=flags.num_translation_samples)
+
+    config = data_parallel.session_config(num_workers, use_gpus)
+    with tf.Session(config=config) as sess:
+        sess.run([tf.global_variables_initializer(),
+                  tf.local_variables_initializer()])
+
+        # The epoch and the early stopping counters are saved next to the
+        # checkpoints, so a restarted run carries on where it stopped
+        start_epoch = 0
+        checkpoint_path = checkpoint_callback.restore(sess)
+        if checkpoint_path is not None:
+            state = checkpoint_callback.load_state(checkpoint_path)
+            if state is not None:
+                start_epoch = state['epoch']
+                early_stopping_callback.set_state(state['early_stopping'])
+            print("Resuming from {0} at epoch {1}".format(checkpoint_path,
+                                                          start_epoch))
+        if early_stopping_callback.stop_training:
+            print("Training already stopped early. Best val loss {0:.4f} at "
+                  "epoch {1}".format(early_stopping_callback.best_loss,
+                                     early_stopping_callback.best_epoch))
+            start_epoch = flags.num_training_epochs
+
+        def training_state(next_epoch):
+            return {'epoch': next_epoch,
+                    'early_stopping': early_stopping_callback.get_state()}
+
+        for epoch in range(start_epoch, flags.num_training_epochs):
+            start_time = time.time()
+
+            # Train for one pass over the training set
+            sess.run(train_init_op)
+            train_losses = list()
+            num_micro_batches = 0
+            while True:
+                try:
+                    if flags.num_accumulation_steps > 1:
+                        _, step_loss = profiler_callback.run(
+                            sess, [accumulate_op, loss])
+                        train_losses.append(step_loss)
+                        num_micro_batches += 1
+                        if num_micro_batches % flags.num_accumulation_steps:
+                            continue
+                        sess.run(apply_op)
+                        step = sess.run(global_step)
+                    else:
+                        _, step_loss, step = profiler_callback.run(
+                            sess, [train_op, loss, global_step])
+                        train_losses.append(step_loss)
+                except tf.errors.OutOfRangeError:
+                    break
+                # A checkpoint taken mid epoch restarts that epoch
+                checkpoint_callback.on_step_end(sess, step,
+                                                state=training_state(epoch))
+
+            # Apply whatever was accumulated at the end of the epoch
+            if (flags.num_accumulation_steps > 1 and
+                    num_micro_batches % flags.num_accumulation_steps):
+                sess.run(apply_op)
 
-        if flags.run_pipeline_test
-            with tf.Session() as sess:
-                pt_batch, en_batch = next(train_generator)
-                print("pt_batch shape = " + str(pt_batch.shape))
-                print("en_batch_shape = " + str(en_batch.shape))
+            # Token weighted loss over the validation set
+            sess.run(val_init_op)
+            total_loss, total_tokens = 0.0, 0.0
+            while True:
+                try:
+                    batch_loss, batch_tokens = sess.run([val_loss, val_tokens])
+                except tf.errors.OutOfRangeError:
+                    break
+                total_loss += batch_loss * batch_tokens
+                total_tokens += batch_tokens
+            epoch_val_loss = total_loss / max(total_tokens, 1.0)
 
+            print("Epoch {0}: step {1}, train loss {2:.4f}, val loss {3:.4f} "
+                  "({4})".format(epoch, sess.run(global_step),
+                                 np.mean(train_losses), epoch_val_loss,
+                                 print_time(time.time() - start_time)))
 
-        # Instantiate positional encoder
+            if flags.profile_every_n_steps:
+                profiler_callback.on_epoch_end(epoch)
 
-        # Construct generators yielding data batches
+            step = sess.run(global_step)
+            is_best = early_stopping_callback.on_epoch_end(epoch,
+                                                           epoch_val_loss)
+            checkpoint_callback.save(sess, step,
+                                     state=training_state(epoch + 1))
+            if translation_callback is not None:
+                translation_callback.on_epoch_end(sess, epoch, step)
+            if is_best:
+                checkpoint_callback.save(sess, step, best=True,
+                                         state=training_state(epoch + 1))
+            if early_stopping_callback.stop_training:
+                print("No improvement for {0} epochs, stopping early. Best "
+                      "val loss {1:.4f} at epoch {2}".format(
+                          flags.patience, early_stopping_callback.best_loss,
+                          early_stopping_callback.best_epoch))
+                break
+
+        checkpoint_callback.join()
+        if translation_callback is not None:
+            translation_callback.join()
+        summary_writer.close()
 
 if __name__ == "__main__":
 
@@ -45,7 +236,7 @@ if __name__ == "__main__":
 
     parser.add_argument('--vocab_size', type=int,
                         default=8500,
-                        help="Number of unique words in corpus")
+                        help="Target size of the subword vocabularies")
 
     parser.add_argument('--run_name', type=str,
                         default='TNN_tensorboard_valid_test',
@@ -84,12 +275,86 @@ if __name__ == "__main__":
                         default=124,
                         help='Number of images to prefetch in the input pipeline')
 
+    parser.add_argument('--dataset_source', type=str,
+                        choices=['tfds', 'shards', 'synthetic'],
+                        default='tfds',
+                        help='Where the sentence pairs come from: the ted_hrlr_translate download, a local shard directory or a synthetic corpus')
+
+    parser.add_argument('--dataset_dir', type=str,
+                        default=None,
+                        help='Shard directory read by --dataset_source shards')
+
     parser.add_argument('--num_dataset_threads', type=int,
                         default=1,
                         help='Number of threads to be used by the input pipeline')
 
     parser.add_argument('--batch_size', type=int,
-                        )
+                        default=64,
+                        help='Number of sentence pairs per batch on each worker')
+
+    parser.add_argument('--num_workers', type=int,
+                        default=0,
+                        help='Number of data-parallel model replicas (default: one per GPU, or 1 on CPU)')
+
+    parser.add_argument('--num_accumulation_steps', type=int,
+                        default=1,
+                        help='Number of micro-batches whose gradients are accumulated per optimizer step')
+
+    parser.add_argument('--recompute_layers', action='store_true',
+                        default=False,
+                        help='Recompute layer activations on the backward pass to save memory')
+
+    parser.add_argument('--dropout_rate', type=float,
+                        default=0.1,
+                        help='Dropout rate used during training')
+
+    parser.add_argument('--warmup_steps', type=int,
+                        default=4000,
+                        help='Number of steps to linearly warm up the learning rate')
+
+    parser.add_argument('--checkpoint_dir', type=str,
+                        default='checkpoints',
+                        help='Directory to write and resume checkpoints from')
+
+    parser.add_argument('--checkpoint_every_n_steps', type=int,
+                        default=1000,
+                        help='Number of training steps between checkpoints')
+
+    parser.add_argument('--vocab_file_prefix', type=str,
+                        default=None,
+                        help='Where to save/load the subword vocabularies')
+
+    parser.add_argument('--log_dir', type=str,
+                        default='logs',
+                        help='Directory the Tensorboard logs of each run are written under')
+
+    parser.add_argument('--bleu_max_sentences', type=int,
+                        default=64,
+                        help='Validation sentences decoded for BLEU every epoch (-1 decodes the whole split, 0 disables it)')
+
+    parser.add_argument('--num_translation_samples', type=int,
+                        default=3,
+                        help='Sampled translations and attention heatmaps logged every epoch')
+
+    parser.add_argument('--profile_every_n_steps', type=int,
+                        default=0,
+                        help='Trace one training step in every n and print a per scope time table each epoch (0 disables it)')
+
+    parser.add_argument('--profile_dir', type=str,
+                        default='profiles',
+                        help='Directory the Chrome traces and profile tables of each run are written under')
+
+    parser.add_argument('--gpu_list', type=str,
+                        default="0",
+                        help="Comma separated list of GPUs the script may use")
+
+    parser.add_argument('--use_test_problem', action='store_true',
+                        default=False,
+                        help="Train on a small synthetic Pt->En corpus instead of --dataset_source")
+
+    parser.add_argument('--run_pipeline_test', action='store_true',
+                        default=False,
+                        help="Pull a single batch from the input pipeline and print its shape")
 
     # Parse known arguments
     parsed_flags, _ = parser.parse_known_args()
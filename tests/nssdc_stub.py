@@ -0,0 +1,168 @@
+"""
+Local stand-in for the NSSDC catalog, served by http.server on a free
+localhost port. It answers the spacecraft query form and the object pages
+with just enough html for parse_nssdc_query_page and
+parse_nssdc_object_page, and records every request and connection so
+tests can check how the scrapers talk to it.
+"""
+
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, quote, urlparse
+
+
+QUERY_PATH = '/nmc/spacecraft/query'
+OBJECT_PATH = '/nmc/spacecraft/display.action'
+
+
+def object_ids(obj_name, objects_per_query):
+    '''Ids of the objects a query for obj_name returns'''
+    return ['{0}-{1}'.format(obj_name, i) for i in range(objects_per_query)]
+
+
+def query_page(obj_name, objects_per_query):
+    '''Results table of a catalog query, laid out like the NSSDC one'''
+    ids = object_ids(obj_name, objects_per_query)
+    rows = ''.join(
+        '<tr><td>{0}</td><td>{1}</td><td>1957-10-0{2}</td></tr>'.format(
+            obj_id, obj_id.upper(), i + 1)
+        for i, obj_id in enumerate(ids))
+    links = ''.join('<a href="{0}?id={1}">{2}</a>'.format(
+        OBJECT_PATH, quote(obj_id), obj_id) for obj_id in ids)
+    return ('<html><body><p>Query returned {0} objects</p>'
+            '<a href="/nmc/spacecraft/">Search again</a>{1}'
+            '<table>{2}</table></body></html>').format(len(ids), links, rows)
+
+
+def object_page(obj_id):
+    '''Detail page of one object, laid out like the NSSDC one'''
+    return ('<html><body>'
+            '<div class="urone"><p>Description of {0}.</p></div>'
+            '<div class="urtwo"><ul><li>{0}</li><li>{1}</li></ul>'
+            '<p><strong>Launch Date:</strong> 1957-10-04</p>'
+            '<h2>Funding Agency</h2><ul><li>NASA</li></ul>'
+            '<h2>Discipline</h2><ul><li>Engineering</li></ul>'
+            '</div></body></html>').format(obj_id, obj_id.upper())
+
+
+class NSSDCStubServer(object):
+    '''Stub NSSDC server running in a background thread. Use as a context
+       manager; url is the base url to point the scrapers at.
+
+       Parameters:
+           objects_per_query (int): objects every catalog query returns
+           fail_first (int): requests per path answered with HTTP 503
+                             before the path starts succeeding
+           delay (float): seconds every response is held back
+           etags (bool): send an ETag with every object page and answer
+                         a matching If-None-Match with 304 Not Modified
+    '''
+
+    def __init__(self, objects_per_query=2, fail_first=0, delay=0.0,
+                 etags=False):
+        self.objects_per_query = objects_per_query
+        self.fail_first = fail_first
+        self.delay = delay
+        self.etags = etags
+        self.lock = threading.Lock()
+        # (monotonic arrival time, method, path) of every request
+        self.requests = list()
+        # Status of every response, in the order they were sent
+        self.statuses = list()
+        self.num_connections = 0
+        self.max_in_flight = 0
+        self._in_flight = 0
+        self._failures = dict()
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), self._handler())
+        self.server.daemon_threads = True
+        self.url = 'http://127.0.0.1:{0}'.format(self.server.server_port)
+
+    def __enter__(self):
+        self._thread = threading.Thread(target=self.server.serve_forever,
+                                        daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.server.shutdown()
+        self.server.server_close()
+        self._thread.join()
+
+    def arrival_times(self):
+        '''Sorted arrival times of every request'''
+        with self.lock:
+            return sorted(arrival for arrival, _, _ in self.requests)
+
+    def _handler(self):
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            # Keep-alive, so connection reuse can be observed
+            protocol_version = 'HTTP/1.1'
+
+            def setup(self):
+                super().setup()
+                with stub.lock:
+                    stub.num_connections += 1
+
+            def log_message(self, *args):
+                pass
+
+            def do_GET(self):
+                self.respond('GET')
+
+            def do_POST(self):
+                self.respond('POST')
+
+            def respond(self, method):
+                url = urlparse(self.path)
+                length = int(self.headers.get('Content-Length') or 0)
+                form = parse_qs(self.rfile.read(length).decode('utf-8'))
+                with stub.lock:
+                    stub.requests.append((time.monotonic(), method, url.path))
+                    stub._in_flight += 1
+                    stub.max_in_flight = max(stub.max_in_flight,
+                                             stub._in_flight)
+                    key = (method, self.path)
+                    failures = stub._failures.get(key, 0)
+                    fail = failures < stub.fail_first
+                    stub._failures[key] = failures + 1
+                try:
+                    if stub.delay:
+                        time.sleep(stub.delay)
+                    if fail:
+                        self.send_body(503, 'unavailable')
+                    elif method == 'POST' and url.path == QUERY_PATH:
+                        self.send_body(200, query_page(form['name'][0],
+                                                       stub.objects_per_query))
+                    elif method == 'GET' and url.path == OBJECT_PATH:
+                        obj_id = parse_qs(url.query)['id'][0]
+                        etag = '"{0}"'.format(obj_id) if stub.etags else None
+                        if etag and self.headers.get('If-None-Match') == etag:
+                            self.send_body(304, '', etag)
+                        else:
+                            self.send_body(200, object_page(obj_id), etag)
+                    else:
+                        self.send_body(404, 'not found')
+                finally:
+                    with stub.lock:
+                        stub._in_flight -= 1
+
+            def send_body(self, status, text, etag=None):
+                body = text.encode('utf-8')
+                with stub.lock:
+                    stub.statuses.append(status)
+                try:
+                    self.send_response(status)
+                    self.send_header('Content-Type', 'text/html; charset=utf-8')
+                    self.send_header('Content-Length', str(len(body)))
+                    if etag:
+                        self.send_header('ETag', etag)
+                    self.end_headers()
+                    self.wfile.write(body)
+                except (BrokenPipeError, ConnectionResetError):
+                    # The client gave up on the request (timeout tests)
+                    pass
+
+        return Handler
@@ -0,0 +1,67 @@
+"""
+DynamicBatcher of the inference server, with a stand-in decode function:
+
+    python -m pytest tests/test_dynamic_batcher.py
+"""
+
+import os
+import sys
+import threading
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# inference_server lazy imports tensorflow, which still has to be installed
+pytest.importorskip('tensorflow')
+
+from inference_server import DynamicBatcher
+
+
+def test_requests_are_batched():
+    batcher = DynamicBatcher(lambda inputs: [list(row) for row in inputs],
+                             max_batch_size=4, max_latency_ms=1000.0)
+    try:
+        requests = [batcher.submit([i, i + 1]) for i in range(4)]
+        outputs = [request.wait(5.0) for request in requests]
+    finally:
+        batcher.stop()
+
+    assert outputs == [[i, i + 1] for i in range(4)]
+    # A full bucket runs without waiting for max_latency_ms
+    assert list(batcher.metrics.batch_sizes) == [4]
+
+
+def test_stop_fails_queued_requests():
+    decoding, release = threading.Event(), threading.Event()
+
+    def decode_fn(inputs):
+        decoding.set()
+        release.wait(5.0)
+        return [list(row) for row in inputs]
+
+    batcher = DynamicBatcher(decode_fn, max_batch_size=1, max_latency_ms=0.0)
+    in_flight = batcher.submit([1])
+    assert decoding.wait(5.0)
+    queued = [batcher.submit([2]), batcher.submit([3, 4, 5, 6, 7, 8, 9, 10])]
+
+    stopper = threading.Thread(target=batcher.stop)
+    stopper.start()
+    # Queued requests fail without waiting for their timeout, while the
+    # batch being decoded still completes
+    for request in queued:
+        with pytest.raises(RuntimeError):
+            request.wait(1.0)
+    release.set()
+    stopper.join(5.0)
+
+    assert not stopper.is_alive()
+    assert in_flight.wait(1.0) == [1]
+
+
+def test_submit_after_stop_raises():
+    batcher = DynamicBatcher(lambda inputs: [list(row) for row in inputs])
+    batcher.stop()
+
+    with pytest.raises(RuntimeError):
+        batcher.submit([1, 2, 3])
@@ -0,0 +1,154 @@
+"""
+FetchEngine running NSSDCScraper against the local NSSDC stub server:
+
+    python -m pytest tests/test_fetch_engine.py
+"""
+
+import asyncio
+import os
+import sys
+import time
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from nssdc_stub import OBJECT_PATH, QUERY_PATH, NSSDCStubServer, object_ids
+from Website_Scrapers.fetch_engine import (FetchEngine, FetchError,
+        ScraperPlugin, TokenBucket, run_scraper)
+from Website_Scrapers.scraping_functions import NSSDCScraper
+
+
+OBJ_NAMES = ['sputnik', 'explorer', 'vanguard', 'telstar']
+
+
+def fetch_once(url, **engine_kwargs):
+    '''Fetch url on a new engine, returning the response and the engine'''
+    async def run():
+        async with FetchEngine(**engine_kwargs) as engine:
+            return await engine.fetch(url), engine
+
+    return asyncio.run(run())
+
+
+def test_scraper_parses_every_name():
+    with NSSDCStubServer(objects_per_query=2) as stub:
+        results = run_scraper(NSSDCScraper(base_nssdc_url=stub.url),
+                              OBJ_NAMES, requests_per_second=None)
+
+    assert sorted(results) == sorted(OBJ_NAMES)
+    for obj_name, obj_dicts in results.items():
+        assert [obj_dict['description'] for obj_dict in obj_dicts] == [
+            'Description of {0}.'.format(obj_id)
+            for obj_id in object_ids(obj_name, 2)]
+
+
+def test_retries_5xx_with_backoff():
+    backoff_base = 0.1
+    with NSSDCStubServer(fail_first=2) as stub:
+        url = stub.url + OBJECT_PATH + '?id=sputnik-0'
+        response, engine = fetch_once(url, requests_per_second=None,
+                                      max_retries=3, backoff_base=backoff_base)
+        arrivals = stub.arrival_times()
+
+    assert response.status == 200
+    assert engine.network_requests == 3
+    # Jittered backoff waits between half and all of base * 2 ** retry
+    gaps = [later - earlier for earlier, later in zip(arrivals, arrivals[1:])]
+    assert gaps[0] >= 0.5 * backoff_base
+    assert gaps[1] >= 0.5 * backoff_base * 2
+
+
+def test_gives_up_after_max_retries():
+    with NSSDCStubServer(fail_first=10) as stub:
+        with pytest.raises(FetchError, match='after 3 attempts: HTTP 503'):
+            fetch_once(stub.url + OBJECT_PATH + '?id=sputnik-0',
+                       requests_per_second=None, max_retries=2,
+                       backoff_base=0.01)
+        assert len(stub.requests) == 3
+
+        # The scraper maps the failed name to None and keeps the others
+        results = run_scraper(NSSDCScraper(base_nssdc_url=stub.url),
+                              OBJ_NAMES[:2], requests_per_second=None,
+                              max_retries=0)
+    assert results == {obj_name: None for obj_name in OBJ_NAMES[:2]}
+
+
+def test_client_errors_are_not_retried():
+    with NSSDCStubServer() as stub:
+        with pytest.raises(FetchError, match='HTTP 404'):
+            fetch_once(stub.url + '/missing', requests_per_second=None,
+                       max_retries=3, backoff_base=0.01)
+        assert len(stub.requests) == 1
+
+
+def test_timeouts_are_retried_then_raised():
+    timeout = 0.2
+    with NSSDCStubServer(delay=1.0) as stub:
+        start_time = time.monotonic()
+        with pytest.raises(FetchError, match='after 2 attempts'):
+            fetch_once(stub.url + OBJECT_PATH + '?id=sputnik-0',
+                       requests_per_second=None, max_retries=1,
+                       backoff_base=0.01, timeout=timeout)
+        elapsed = time.monotonic() - start_time
+        num_requests = len(stub.requests)
+
+    assert num_requests == 2
+    # Each attempt is cut off at the timeout, not at the slow response
+    assert elapsed < 1.0
+
+
+def test_token_bucket_rate():
+    requests_per_second = 20.0
+    with NSSDCStubServer(objects_per_query=2) as stub:
+        run_scraper(NSSDCScraper(base_nssdc_url=stub.url), OBJ_NAMES,
+                    requests_per_second=requests_per_second, burst=1,
+                    per_domain_limit=8)
+        arrivals = stub.arrival_times()
+
+    interval = 1.0 / requests_per_second
+    assert len(arrivals) == len(OBJ_NAMES) * 3
+    gaps = [later - earlier for earlier, later in zip(arrivals, arrivals[1:])]
+    assert min(gaps) > interval - 0.02
+    assert arrivals[-1] - arrivals[0] >= 0.95 * interval * (len(arrivals) - 1)
+
+
+def test_token_bucket_burst():
+    async def acquire_all(bucket, count):
+        start_time = time.monotonic()
+        for _ in range(count):
+            await bucket.acquire()
+        return time.monotonic() - start_time
+
+    # A full bucket lets burst requests through at once, then refills at
+    # rate tokens per second
+    assert asyncio.run(acquire_all(TokenBucket(10.0, capacity=5), 5)) < 0.05
+    assert asyncio.run(acquire_all(TokenBucket(10.0, capacity=5), 7)) >= 0.15
+
+
+def test_per_domain_concurrency_limit():
+    per_domain_limit = 3
+    delay = 0.1
+    with NSSDCStubServer(objects_per_query=2, delay=delay) as stub:
+        start_time = time.monotonic()
+        results = run_scraper(NSSDCScraper(base_nssdc_url=stub.url),
+                              OBJ_NAMES, requests_per_second=None,
+                              per_domain_limit=per_domain_limit)
+        elapsed = time.monotonic() - start_time
+        max_in_flight = stub.max_in_flight
+        num_queries = sum(path == QUERY_PATH for _, _, path in stub.requests)
+
+    assert all(results.values())
+    assert num_queries == len(OBJ_NAMES)
+    assert max_in_flight == per_domain_limit
+    # Concurrent requests beat fetching the 12 pages one at a time
+    assert elapsed < 0.75 * delay * len(OBJ_NAMES) * 3
+
+
+def test_plugin_without_parse_fails_at_instantiation():
+    class FetchOnlyScraper(ScraperPlugin):
+        async def fetch(self, engine, obj_name):
+            return None
+
+    with pytest.raises(TypeError):
+        FetchOnlyScraper()
@@ -0,0 +1,88 @@
+"""
+MinHash near-duplicate filter used by the corpus pipeline:
+
+    python -m pytest tests/test_near_duplicate_filter.py
+"""
+
+import os
+import pickle
+import sys
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from Dataset.near_duplicate_filter import MinHashDeduplicator
+
+
+BOILERPLATE = ("The satellite was launched from Cape Canaveral aboard a Delta "
+               "rocket into a low earth orbit to study the ionosphere and "
+               "measure the density of charged particles along its path, "
+               "and it transmitted data until its batteries were exhausted")
+
+
+def sibling_documents():
+    '''Sibling objects sharing their boilerplate, plus unrelated ones'''
+    siblings = [('galaxy-{}'.format(i),
+                 'Galaxy {0} communications satellite. {1}'.format(i,
+                                                                  BOILERPLATE))
+                for i in range(1, 5)]
+    others = [('voyager-1', "Voyager 1 is a space probe that flew past "
+                            "Jupiter and Saturn and entered interstellar "
+                            "space in 2012"),
+              ('hubble', "The Hubble Space Telescope is a large optical "
+                         "telescope in low earth orbit serviced by five "
+                         "shuttle missions")]
+    return siblings + others
+
+
+def test_near_duplicates_are_dropped():
+    deduplicator = MinHashDeduplicator(threshold=0.7)
+    kept = deduplicator.add_batch(sibling_documents())
+
+    assert [doc_id for doc_id, _ in kept] == ['galaxy-1', 'voyager-1',
+                                              'hubble']
+    assert deduplicator.num_seen == 6
+    assert deduplicator.num_duplicates == 3
+
+
+def test_duplicates_across_batches_are_dropped():
+    deduplicator = MinHashDeduplicator(threshold=0.7)
+    documents = sibling_documents()
+    first = deduplicator.add_batch(documents[:2])
+    second = deduplicator.add_batch(documents[2:])
+
+    assert [doc_id for doc_id, _ in first] == ['galaxy-1']
+    assert [doc_id for doc_id, _ in second] == ['voyager-1', 'hubble']
+
+
+def test_dedup_ratio_is_reported(capsys):
+    deduplicator = MinHashDeduplicator(threshold=0.7)
+    assert deduplicator.dedup_ratio == 0.0
+
+    deduplicator.add_batch(sibling_documents())
+    assert deduplicator.dedup_ratio == 0.5
+
+    deduplicator.report()
+    out = capsys.readouterr().out
+    assert "6 documents seen, 3 kept, 3 dropped" in out
+    assert "dedup ratio 50.00%" in out
+
+
+def test_signatures_from_hash_config_match():
+    # The corpus pipeline computes signatures in worker processes from a
+    # pickled hash_config and only inserts them on the event loop
+    deduplicator = MinHashDeduplicator(threshold=0.7, seed=7)
+    deduplicator.add_batch(sibling_documents()[:1])
+
+    hasher = MinHashDeduplicator(**pickle.loads(
+        pickle.dumps(deduplicator.hash_config)))
+    documents = sibling_documents()[1:]
+    signatures = hasher.compute_signatures([text for _, text in documents])
+
+    assert np.array_equal(
+        signatures,
+        deduplicator.compute_signatures([text for _, text in documents]))
+    kept = deduplicator.add_signatures(documents, signatures)
+    assert [doc_id for doc_id, _ in kept] == ['voyager-1', 'hubble']
+    assert deduplicator.num_duplicates == 3
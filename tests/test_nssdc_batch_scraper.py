@@ -0,0 +1,120 @@
+"""
+nasa_nssdc_batch_scraper against the local NSSDC stub server:
+
+    python -m pytest tests/test_nssdc_batch_scraper.py
+"""
+
+import os
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from nssdc_stub import NSSDCStubServer, object_ids
+from Website_Scrapers.scraping_functions import (HostRateLimiter,
+        make_scraping_session, nasa_nssdc_batch_scraper)
+
+
+OBJ_NAMES = ['sputnik', 'explorer', 'vanguard', 'telstar', 'syncom', 'relay']
+
+
+def test_every_name_gets_parsed_results():
+    with NSSDCStubServer(objects_per_query=3) as stub:
+        results = nasa_nssdc_batch_scraper(OBJ_NAMES, max_workers=4,
+                                           requests_per_second=None,
+                                           base_nssdc_url=stub.url)
+
+    assert sorted(results) == sorted(OBJ_NAMES)
+    for obj_name, obj_dicts in results.items():
+        assert [obj_dict['description'] for obj_dict in obj_dicts] == [
+            'Description of {0}.'.format(obj_id)
+            for obj_id in object_ids(obj_name, 3)]
+        assert all(obj_dict['Funding Agency'] == 'NASA'
+                   for obj_dict in obj_dicts)
+
+
+def test_failed_query_maps_to_empty_list():
+    # The first query for every name is answered with HTTP 503, which the
+    # session does not retry
+    with NSSDCStubServer(fail_first=1) as stub:
+        results = nasa_nssdc_batch_scraper(OBJ_NAMES[:2], max_workers=2,
+                                           requests_per_second=None,
+                                           base_nssdc_url=stub.url)
+    assert results == {obj_name: list() for obj_name in OBJ_NAMES[:2]}
+
+
+def test_pooled_session_reuses_connections():
+    max_workers = 4
+    with NSSDCStubServer(objects_per_query=3) as stub:
+        nasa_nssdc_batch_scraper(OBJ_NAMES, max_workers=max_workers,
+                                 requests_per_second=None,
+                                 base_nssdc_url=stub.url)
+        num_requests = len(stub.requests)
+        num_connections = stub.num_connections
+
+    assert num_requests == len(OBJ_NAMES) * 4
+    # One keep-alive connection per worker at most, not one per request
+    assert num_connections <= max_workers
+
+
+def test_given_session_is_left_open():
+    with NSSDCStubServer() as stub:
+        session = make_scraping_session(pool_size=2)
+        nasa_nssdc_batch_scraper(OBJ_NAMES[:2], max_workers=2,
+                                 requests_per_second=None, session=session,
+                                 base_nssdc_url=stub.url)
+        # Still usable after the batch
+        nasa_nssdc_batch_scraper(OBJ_NAMES[2:4], max_workers=2,
+                                 requests_per_second=None, session=session,
+                                 base_nssdc_url=stub.url)
+        session.close()
+        assert stub.num_connections <= 2
+
+
+def test_per_host_rate_limit():
+    requests_per_second = 20.0
+    with NSSDCStubServer(objects_per_query=2) as stub:
+        nasa_nssdc_batch_scraper(OBJ_NAMES[:4], max_workers=8,
+                                 requests_per_second=requests_per_second,
+                                 base_nssdc_url=stub.url)
+        arrivals = stub.arrival_times()
+
+    interval = 1.0 / requests_per_second
+    assert len(arrivals) == 4 * 3
+    # Requests are spaced by the limiter, up to the jitter of the arrivals
+    gaps = [later - earlier for earlier, later in zip(arrivals, arrivals[1:])]
+    assert min(gaps) > interval - 0.02
+    assert arrivals[-1] - arrivals[0] >= 0.95 * interval * (len(arrivals) - 1)
+
+
+def test_rate_limiter_keeps_hosts_apart():
+    limiter = HostRateLimiter(requests_per_second=5.0)
+    limiter.wait('http://a.example/1')
+    start_time = time.monotonic()
+    # A different host is not held back by the request to a.example
+    limiter.wait('http://b.example/1')
+    assert time.monotonic() - start_time < 0.05
+    # The same host waits for its next slot
+    limiter.wait('http://a.example/2')
+    assert time.monotonic() - start_time >= 0.15
+
+
+def test_rate_limiter_is_thread_safe():
+    limiter = HostRateLimiter(requests_per_second=50.0)
+    times = list()
+    lock = threading.Lock()
+
+    def wait():
+        limiter.wait('http://a.example/')
+        with lock:
+            times.append(time.monotonic())
+
+    threads = [threading.Thread(target=wait) for _ in range(10)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    times.sort()
+    assert times[-1] - times[0] >= 0.95 * 9 / 50.0
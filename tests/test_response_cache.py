@@ -0,0 +1,150 @@
+"""
+ResponseCache behind the FetchEngine and the CachedSession, against the
+local NSSDC stub server:
+
+    python -m pytest tests/test_response_cache.py
+"""
+
+import asyncio
+import os
+import sys
+import time
+import zlib
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from nssdc_stub import OBJECT_PATH, NSSDCStubServer, object_page
+from Website_Scrapers.fetch_engine import FetchEngine, scrape_all
+from Website_Scrapers.response_cache import (CachedSession, CacheMissError,
+        ResponseCache)
+from Website_Scrapers.scraping_functions import NSSDCScraper
+
+
+OBJ_NAMES = ['sputnik', 'explorer', 'vanguard']
+
+
+def scrape(stub, cache):
+    '''Scrape OBJ_NAMES through a cached engine, returning the results
+       and the number of requests that went to the network'''
+    async def run():
+        async with FetchEngine(requests_per_second=None,
+                               cache=cache) as engine:
+            results = await scrape_all(NSSDCScraper(base_nssdc_url=stub.url),
+                                       OBJ_NAMES, engine)
+            return results, engine.network_requests
+
+    return asyncio.run(run())
+
+
+@pytest.fixture
+def cache_path(tmp_path):
+    return str(tmp_path / 'cache.sqlite')
+
+
+def test_second_run_makes_no_network_requests(cache_path):
+    with NSSDCStubServer(objects_per_query=2) as stub:
+        cache = ResponseCache(cache_path)
+        first, first_requests = scrape(stub, cache)
+        cache.close()
+
+        # A new cache on the same file, as in a rerun of the corpus build
+        cache = ResponseCache(cache_path)
+        second, second_requests = scrape(stub, cache)
+        cache.close()
+        num_requests = len(stub.requests)
+
+    assert first_requests == len(OBJ_NAMES) * 3
+    assert second_requests == 0
+    assert num_requests == first_requests
+    assert second == first
+    assert all(first.values())
+
+
+def test_stale_etag_entry_is_revalidated(cache_path):
+    with NSSDCStubServer(etags=True) as stub:
+        url = stub.url + OBJECT_PATH + '?id=sputnik-0'
+        # Every entry is stale at once
+        cache = ResponseCache(cache_path, ttl=0)
+
+        async def fetch_twice():
+            async with FetchEngine(requests_per_second=None,
+                                   cache=cache) as engine:
+                first = await engine.fetch(url)
+                second = await engine.fetch(url)
+                return first, second, engine.network_requests
+
+        first, second, network_requests = asyncio.run(fetch_twice())
+        statuses = list(stub.statuses)
+
+        # The synchronous scrapers' session revalidates the same entry
+        session = CachedSession(cache)
+        response = session.get(url)
+        session.close()
+        cache.close()
+
+    assert statuses == [200, 304]
+    assert network_requests == 2
+    assert second.status == 200
+    assert second.content == first.content == object_page('sputnik-0').encode()
+    assert stub.statuses == [200, 304, 304]
+    assert response.status_code == 200
+    assert response.content == first.content
+
+
+def test_offline_miss_raises(cache_path):
+    with NSSDCStubServer() as stub:
+        url = stub.url + OBJECT_PATH + '?id=sputnik-0'
+        cache = ResponseCache(cache_path, offline=True)
+
+        async def fetch():
+            async with FetchEngine(requests_per_second=None,
+                                   cache=cache) as engine:
+                return await engine.fetch(url)
+
+        with pytest.raises(CacheMissError):
+            asyncio.run(fetch())
+        with pytest.raises(CacheMissError):
+            CachedSession(cache).get(url)
+        cache.close()
+        num_requests = len(stub.requests)
+
+    assert num_requests == 0
+
+
+def test_offline_serves_stale_entries(cache_path):
+    with NSSDCStubServer() as stub:
+        url = stub.url + OBJECT_PATH + '?id=sputnik-0'
+        cache = ResponseCache(cache_path, ttl=0)
+        CachedSession(cache).get(url)
+        cache.close()
+
+        cache = ResponseCache(cache_path, ttl=0, offline=True)
+        response = CachedSession(cache).get(url)
+        cache.close()
+        num_requests = len(stub.requests)
+
+    assert num_requests == 1
+    assert response.content == object_page('sputnik-0').encode()
+
+
+def test_least_recently_used_entries_are_evicted(cache_path):
+    bodies = [bytes([ord('a') + i]) * 100 for i in range(3)]
+    # Room for the compressed bodies of two entries
+    cache = ResponseCache(cache_path,
+                          max_bytes=2 * len(zlib.compress(bodies[0])))
+    urls = ['http://a.example/{0}'.format(i) for i in range(3)]
+    cache.put('GET', urls[0], None, None, 200, {}, bodies[0])
+    time.sleep(0.01)
+    cache.put('GET', urls[1], None, None, 200, {}, bodies[1])
+    time.sleep(0.01)
+    # Reading the first entry makes the second the least recently used
+    assert cache.get('GET', urls[0]).content == bodies[0]
+    time.sleep(0.01)
+    cache.put('GET', urls[2], None, None, 200, {}, bodies[2])
+
+    assert len(cache) == 2
+    assert cache.get('GET', urls[1]) is None
+    assert cache.get('GET', urls[2]).content == bodies[2]
+    cache.close()
@@ -0,0 +1,95 @@
+"""
+StreamingPRCurveEvaluator against the brute-force per-threshold matching
+of benchmarks/pr_curve_benchmark.py:
+
+    python -m pytest tests/test_streaming_pr_curve_evaluator.py
+"""
+
+import os
+import sys
+
+import numpy as np
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.pr_curve_benchmark import (box_iou, brute_force_counts,
+        random_boxes, random_detections, validation_thresholds)
+from callbacks.StreamingPRCurveEvaluator import (StreamingPRCurveEvaluator,
+        iou_matrix)
+
+
+def evaluate(detections, iou_thresholds, confidence_thresholds, batch_size=4):
+    evaluator = StreamingPRCurveEvaluator(iou_thresholds, confidence_thresholds)
+    for start in range(0, len(detections[0]), batch_size):
+        evaluator.add_batch(*[d[start:start + batch_size] for d in detections])
+    return evaluator
+
+
+def test_iou_matrix_matches_pairwise_iou():
+    rng = np.random.RandomState(0)
+    boxes_a, boxes_b = random_boxes(rng, 7), random_boxes(rng, 5)
+    # Identical and disjoint boxes
+    boxes_b[0] = boxes_a[0]
+    boxes_b[1] = [0.9, 0.9, 0.95, 0.95]
+    expected = [[box_iou(a, b) for b in boxes_b] for a in boxes_a]
+    np.testing.assert_allclose(iou_matrix(boxes_a, boxes_b), expected)
+    assert iou_matrix(boxes_a, boxes_b)[0, 0] == pytest.approx(1.0)
+
+
+@pytest.mark.parametrize('seed', range(5))
+def test_counts_match_brute_force(seed):
+    rng = np.random.RandomState(seed)
+    detections = random_detections(rng, num_images=12, num_predictions=8,
+                                   num_ground_truth=4)
+    iou_thresholds, confidence_thresholds = validation_thresholds()
+    evaluator = evaluate(detections, iou_thresholds, confidence_thresholds)
+
+    true_positives, false_positives = brute_force_counts(
+        *detections, iou_thresholds, confidence_thresholds)
+    np.testing.assert_array_equal(evaluator.true_positives, true_positives)
+    np.testing.assert_array_equal(evaluator.false_positives, false_positives)
+    assert evaluator.num_ground_truth == sum(len(gt) for gt in detections[2])
+
+
+def test_counts_do_not_depend_on_batching():
+    rng = np.random.RandomState(1)
+    detections = random_detections(rng, num_images=10, num_predictions=6,
+                                   num_ground_truth=3)
+    thresholds = validation_thresholds()
+    one_batch = evaluate(detections, *thresholds, batch_size=10)
+    single_images = evaluate(detections, *thresholds, batch_size=1)
+    np.testing.assert_array_equal(one_batch.true_positives,
+                                  single_images.true_positives)
+    np.testing.assert_array_equal(one_batch.false_positives,
+                                  single_images.false_positives)
+
+
+def test_images_without_predictions_or_ground_truth():
+    box = np.array([[0.1, 0.1, 0.3, 0.3]])
+    evaluator = StreamingPRCurveEvaluator([0.5], [0.0, 0.5, 1.0])
+    evaluator.add_batch([np.zeros((0, 4)), box],
+                        [np.zeros(0), np.array([0.7])],
+                        [box, np.zeros((0, 4))])
+
+    statistics = evaluator.compute_statistics()[0.5]
+    # The only prediction is on the image without ground truth
+    np.testing.assert_array_equal(statistics['true_positives'], [0, 0, 0])
+    np.testing.assert_array_equal(statistics['false_positives'], [1, 1, 0])
+    np.testing.assert_array_equal(statistics['false_negatives'], [1, 1, 1])
+    np.testing.assert_array_equal(statistics['precision'], [0.0, 0.0, 1.0])
+    np.testing.assert_array_equal(statistics['recall'], [0.0, 0.0, 0.0])
+
+
+def test_each_ground_truth_box_is_matched_once():
+    gt = np.array([[0.1, 0.1, 0.3, 0.3]])
+    evaluator = StreamingPRCurveEvaluator([0.5], [0.0, 0.8])
+    # Two predictions on the same box: the more confident one matches
+    evaluator.add_batch([np.concatenate([gt, gt])], [np.array([0.6, 0.9])],
+                        [gt])
+
+    statistics = evaluator.compute_statistics()[0.5]
+    np.testing.assert_array_equal(statistics['true_positives'], [1, 1])
+    np.testing.assert_array_equal(statistics['false_positives'], [1, 0])
+    np.testing.assert_array_equal(statistics['recall'], [1.0, 1.0])
+    np.testing.assert_array_equal(statistics['precision'], [0.5, 1.0])